@@ -0,0 +1,457 @@
+"""Links the passengers of the Kaggle tables to the ones of the extra data,
+and writes the links to data/integration/matches.json.
+
+Only pairs of passengers sharing a block are compared: the same ticket
+number, or the same last name (maiden names included) and first initial.
+The passengers left unmatched are then compared to the ones with similarly
+spelled first and last names, see `name_index`. Each candidate pair gets a
+weighted sum of similarity scores, computed on whole columns at once: first
+name, last name, ticket, title, age, class and gender. The one-to-one
+assignment maximizing the total score is then solved on the sparse graph of
+the best candidates. The few passengers no score can link are matched by
+hand in data/fixes/manual_matches.json.
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import optimize
+from scipy import sparse
+from scipy.sparse import csgraph
+
+import data.integration.merge as merge
+import dataset as ds
+import gazetteer as gz
+import name_index as ni
+import preprocessing as pp
+
+_logger = logging.getLogger(__name__)
+
+_matches_path = os.path.join(os.environ['HOME'],
+                             'kaggle',
+                             'titanic',
+                             'data',
+                             'integration',
+                             'matches.json')
+_manual_matches_path = os.path.join(os.environ['HOME'],
+                                    'kaggle',
+                                    'titanic',
+                                    'data',
+                                    'fixes',
+                                    'manual_matches.json')
+
+# Weights of the similarity scores of a candidate pair.
+_score_weights = {
+    'FirstName': 3.0,
+    'LastName': 2.0,
+    'TicketNumber': 2.0,
+    'Title': 1.0,
+    'Age': 1.0,
+    'Pclass': 1.0,
+    'Sex': 1.0,
+}
+# Pairs scoring less are never matched.
+_min_score = 5.0
+# Number of similar first and last names looked up for each passenger.
+_max_similar_names = 3
+# Only the best candidates of each passenger are kept for the assignment.
+_max_candidates = 3
+# Components of the candidate pairs up to this many (kaggle, extra) cells are
+# solved through a dense matrix.
+_max_dense_cells = 10 ** 6
+# Components with more pairs, only seen when most passengers share few names,
+# are assigned greedily: the exact solvers take minutes on them.
+_max_exact_pairs = 10 ** 5
+
+# Titles written differently in the two sources, normalized.
+_title_aliases = {
+    'colonel': 'col',
+    'sig': 'mr',
+    'sr': 'mr',
+    'signora': 'mrs',
+    'mme': 'mrs',
+    'mlle': 'miss',
+    'ms': 'miss',
+}
+
+# Passenger classes of the extra data. Crew members have none.
+_extra_classes = {
+    '1st Class Passenger': 1,
+    '2nd Class Passenger': 2,
+    '3rd Class Passenger': 3,
+}
+
+
+def _normalized_names(names):
+    return pp.transform_unique_values(names,
+                                      lambda names: names.map(gz.normalize))
+
+
+def _first_tokens(names):
+    return names.str.split(n=1).str[0]
+
+
+def _normalized_titles(titles):
+    titles = _normalized_names(titles)
+    return titles.replace(_title_aliases)
+
+
+def kaggle_passengers():
+    """Returns the passengers of the Kaggle training and test sets, in the
+    common format of the linkage.
+    """
+    X_train, _ = ds.load_training_set(extended=False)
+    X_test = ds.load_test_set(extended=False)
+    df = pd.concat([X_train, X_test])
+    df = pp.manual_fixes(df)
+    df = pp.format_name(df)
+    df = pp.add_ticket_number_column(df)
+
+    first_names = _normalized_names(df['FirstName'])
+    unmarried_first_names = _normalized_names(df['UnmarriedFirstName'])
+    return pd.DataFrame({
+        'FirstName': _first_tokens(unmarried_first_names),
+        # Married women may be registered with their husband's names.
+        'OtherFirstName': _first_tokens(first_names),
+        'LastName': _normalized_names(df['UnmarriedLastName']),
+        'OtherLastName': _normalized_names(df['LastName']),
+        'TicketNumber': df['TicketNumber'].where(df['TicketNumber'] > 0),
+        'Title': _normalized_titles(df['Title']),
+        'Age': df['Age'],
+        'Pclass': df['Pclass'].astype(float),
+        'Sex': df['Sex'],
+    }, index=df.index)
+
+
+def extra_passengers():
+    """Returns the passengers of the extra data, in the common format of the
+    linkage. The crew members, absent from the Kaggle tables, are left out.
+    """
+    df = merge.apply_post_processing(merge.import_extra_data())
+    df = df.set_index('PassengerId')
+    df = df[df['Pclass'].isin(list(_extra_classes))]
+    return pd.DataFrame({
+        'FirstName': _first_tokens(_normalized_names(df['FirstName'])),
+        'LastName': _normalized_names(df['LastName']),
+        'TicketNumber': df['TicketNumber'].where(df['TicketNumber'] > 0),
+        'Title': _normalized_titles(df['Title']),
+        'Age': pd.to_numeric(df['Age'], errors='coerce'),
+        'Pclass': df['Pclass'].map(_extra_classes),
+        'Sex': df['Sex'],
+    }, index=df.index)
+
+
+def _initials(names):
+    return names.str.slice(stop=1)
+
+
+def candidate_pairs(kaggle_df, extra_df):
+    """Returns the (kaggle row, extra row) positions of the pairs sharing a
+    block: a ticket number, or a last name and the initial of the first name.
+    Married women may be registered with their maiden last name, or with the
+    first name of their husband.
+    """
+    kaggle_keys = pd.DataFrame({
+        'KaggleRow': np.arange(len(kaggle_df)),
+        'TicketNumber': kaggle_df['TicketNumber'].values,
+        'LastName': kaggle_df['LastName'].values,
+        'OtherLastName': kaggle_df['OtherLastName'].values,
+        'Initial': _initials(kaggle_df['FirstName']).values,
+        'OtherInitial': _initials(kaggle_df['OtherFirstName']).values,
+    })
+    extra_keys = pd.DataFrame({
+        'ExtraRow': np.arange(len(extra_df)),
+        'TicketNumber': extra_df['TicketNumber'].values,
+        'LastName': extra_df['LastName'].values,
+        'Initial': _initials(extra_df['FirstName']).values,
+    })
+    blocks = [
+        (['TicketNumber'], ['TicketNumber']),
+        (['LastName', 'Initial'], ['LastName', 'Initial']),
+        (['OtherLastName', 'Initial'], ['LastName', 'Initial']),
+        (['OtherLastName', 'OtherInitial'], ['LastName', 'Initial']),
+    ]
+    pairs_df = pd.concat([
+        kaggle_keys[['KaggleRow'] + kaggle_key]
+        .dropna()
+        .merge(extra_keys[['ExtraRow'] + extra_key].dropna(),
+               left_on=kaggle_key,
+               right_on=extra_key)[['KaggleRow', 'ExtraRow']]
+        for kaggle_key, extra_key in blocks
+    ])
+    return pairs_df.drop_duplicates().sort_values(['KaggleRow', 'ExtraRow'])
+
+
+def similar_name_pairs(kaggle_df, extra_df):
+    """Returns the (kaggle row, extra row) positions of the pairs with
+    similarly spelled first and last names, see `name_index`: the
+    `_max_similar_names` most similar ones of each. Maiden names included.
+    """
+    kaggle_keys = kaggle_df[['FirstName', 'LastName', 'OtherLastName']] \
+        .assign(KaggleRow=np.arange(len(kaggle_df)))
+    extra_keys = extra_df[['FirstName', 'LastName']] \
+        .assign(ExtraRow=np.arange(len(extra_df)))
+
+    def similar_names(col_name, kaggle_col_names):
+        index = ni.NameIndex.build(extra_keys[col_name])
+        candidates_df = index.candidates(
+            pd.concat([kaggle_keys[kaggle_col_name]
+                       for kaggle_col_name in kaggle_col_names]),
+            k=_max_similar_names)
+        return candidates_df[['Name', 'Candidate']] \
+            .rename(columns={'Candidate': 'Extra' + col_name})
+
+    similar_first_names = similar_names('FirstName', ['FirstName'])
+    similar_last_names = similar_names('LastName',
+                                       ['LastName', 'OtherLastName'])
+    pairs_df = pd.concat([
+        kaggle_keys[['KaggleRow', 'FirstName', last_name_col]]
+        .dropna()
+        .merge(similar_first_names, left_on='FirstName', right_on='Name')
+        .merge(similar_last_names, left_on=last_name_col, right_on='Name')
+        .merge(extra_keys.dropna(),
+               left_on=['ExtraFirstName', 'ExtraLastName'],
+               right_on=['FirstName', 'LastName'])[['KaggleRow', 'ExtraRow']]
+        for last_name_col in ['LastName', 'OtherLastName']
+    ])
+    return pairs_df.drop_duplicates().sort_values(['KaggleRow', 'ExtraRow'])
+
+
+def _equal(kaggle_values, extra_values):
+    """Returns 1 where the values are equal, 0 where they differ and 0.5
+    where any is missing.
+    """
+    scores = (kaggle_values == extra_values).astype(float)
+    scores[pd.isna(kaggle_values) | pd.isna(extra_values)] = 0.5
+    return scores
+
+
+def _similar(kaggle_names, extra_names, kaggle_rows, extra_rows):
+    """Returns the similarity of the names of the pairs, 0.5 where any is
+    missing.
+    """
+    scores = ni.similarity(kaggle_names, extra_names, kaggle_rows, extra_rows)
+    scores[np.isnan(scores)] = 0.5
+    return scores
+
+
+def score_pairs(kaggle_df, extra_df, pairs_df):
+    """Returns the weighted similarity of each candidate pair."""
+    kaggle_rows = pairs_df['KaggleRow'].values
+    extra_rows = pairs_df['ExtraRow'].values
+
+    def values(df, col_name, rows):
+        return df[col_name].values[rows]
+
+    # Names are compared by similarity, to survive spelling differences.
+    first_name_scores = np.maximum(
+        _similar(kaggle_df['FirstName'], extra_df['FirstName'],
+                 kaggle_rows, extra_rows),
+        _similar(kaggle_df['OtherFirstName'], extra_df['FirstName'],
+                 kaggle_rows, extra_rows))
+    last_name_scores = np.maximum(
+        _similar(kaggle_df['LastName'], extra_df['LastName'],
+                 kaggle_rows, extra_rows),
+        _similar(kaggle_df['OtherLastName'], extra_df['LastName'],
+                 kaggle_rows, extra_rows))
+
+    # Ages are often rounded, or off by a year.
+    age_differences = np.abs(values(kaggle_df, 'Age', kaggle_rows)
+                             - values(extra_df, 'Age', extra_rows))
+    age_scores = np.clip(1 - (age_differences - 1) / 10, 0, 1)
+    age_scores[np.isnan(age_differences)] = 0.5
+
+    scores = {
+        'FirstName': first_name_scores,
+        'LastName': last_name_scores,
+        'Age': age_scores,
+        **{col_name: _equal(values(kaggle_df, col_name, kaggle_rows),
+                            values(extra_df, col_name, extra_rows))
+           for col_name in ['TicketNumber', 'Title', 'Pclass', 'Sex']},
+    }
+    return sum(_score_weights[col_name] * col_scores
+               for col_name, col_scores in scores.items())
+
+
+def _assign_greedily(kaggle_rows, extra_rows, scores):
+    """Returns the (kaggle rows, extra rows) of the pairs taken from the best
+    score down, skipping the passengers already matched.
+    """
+    matched_kaggle_rows = set()
+    matched_extra_rows = set()
+    matched_pairs = []
+    for kaggle_row, extra_row in zip(
+            *(rows[np.argsort(-scores, kind='stable')]
+              for rows in [kaggle_rows, extra_rows])):
+        if kaggle_row in matched_kaggle_rows \
+                or extra_row in matched_extra_rows:
+            continue
+        matched_kaggle_rows.add(kaggle_row)
+        matched_extra_rows.add(extra_row)
+        matched_pairs.append((kaggle_row, extra_row))
+    matched_pairs = np.array(matched_pairs, dtype=kaggle_rows.dtype) \
+        .reshape(-1, 2)
+    return matched_pairs[:, 0], matched_pairs[:, 1]
+
+
+def _assign_component(kaggle_rows, extra_rows, scores):
+    """Returns the (kaggle row, extra row) positions of the one-to-one
+    assignment maximizing the total score, within a connected component of
+    the candidate pairs.
+    """
+    if len(scores) > _max_exact_pairs:
+        _logger.warning('Assigning greedily a component of {} candidate '
+                        'pairs'.format(len(scores)))
+        return _assign_greedily(kaggle_rows, extra_rows, scores)
+
+    kaggle_ids, kaggle_positions = np.unique(kaggle_rows, return_inverse=True)
+    extra_ids, extra_positions = np.unique(extra_rows, return_inverse=True)
+    shape = (len(kaggle_ids), len(extra_ids))
+    if shape[0] * shape[1] <= _max_dense_cells:
+        # Pairs which are no candidates score 0: assigning them is the same
+        # as leaving both passengers unmatched.
+        score_matrix = np.zeros(shape)
+        score_matrix[kaggle_positions, extra_positions] = scores
+        matched_kaggle, matched_extra = \
+            optimize.linear_sum_assignment(score_matrix, maximize=True)
+        is_matched = score_matrix[matched_kaggle, matched_extra] > 0
+        matched_kaggle = matched_kaggle[is_matched]
+        matched_extra = matched_extra[is_matched]
+    else:
+        # Each Kaggle passenger may also stay unmatched, through a column of
+        # its own: a matching of all the Kaggle passengers always exists, and
+        # the cheapest one leaves out the lowest scores.
+        max_cost = scores.max() + 1
+        graph = sparse.csr_matrix(
+            (np.concatenate([max_cost - scores, np.full(shape[0], max_cost)]),
+             (np.concatenate([kaggle_positions, np.arange(shape[0])]),
+              np.concatenate([extra_positions,
+                              shape[1] + np.arange(shape[0])]))),
+            shape=(shape[0], shape[1] + shape[0]))
+        matched_kaggle, matched_extra = \
+            csgraph.min_weight_full_bipartite_matching(graph)
+        is_matched = matched_extra < shape[1]
+        matched_kaggle = matched_kaggle[is_matched]
+        matched_extra = matched_extra[is_matched]
+    return kaggle_ids[matched_kaggle], extra_ids[matched_extra]
+
+
+def assign(num_kaggle, num_extra, pairs_df, scores):
+    """Returns the (kaggle row, extra row) positions of the one-to-one
+    assignment maximizing the total score of the matched pairs.
+
+    Only the `_max_candidates` best candidates of each Kaggle passenger
+    scoring at least `_min_score` are considered. The assignment is solved
+    separately on each connected component of the graph of those pairs:
+    the components of a single pair are matched at once, the small ones
+    through a dense matrix and the large ones on the sparse graph. Only the
+    huge components are assigned greedily instead, see `_max_exact_pairs`.
+    """
+    is_valid = scores >= _min_score
+    kaggle_rows = pairs_df['KaggleRow'].values[is_valid]
+    extra_rows = pairs_df['ExtraRow'].values[is_valid]
+    scores = scores[is_valid]
+    if not len(scores):
+        return []
+
+    # Best candidates first, for each Kaggle passenger.
+    order = np.lexsort((-scores, kaggle_rows))
+    kaggle_rows, extra_rows, scores = \
+        kaggle_rows[order], extra_rows[order], scores[order]
+    group_starts = np.flatnonzero(np.diff(kaggle_rows, prepend=-1))
+    ranks = np.arange(len(kaggle_rows)) \
+        - np.repeat(group_starts, np.diff(np.append(group_starts,
+                                                    len(kaggle_rows))))
+    is_kept = ranks < _max_candidates
+    kaggle_rows, extra_rows, scores = \
+        kaggle_rows[is_kept], extra_rows[is_kept], scores[is_kept]
+
+    # Kaggle passengers are the nodes [0, num_kaggle), extra ones follow.
+    graph = sparse.coo_matrix(
+        (np.ones(len(scores)), (kaggle_rows, num_kaggle + extra_rows)),
+        shape=(num_kaggle + num_extra, num_kaggle + num_extra))
+    _, labels = csgraph.connected_components(graph, directed=False)
+    components = labels[kaggle_rows]
+    component_sizes = np.bincount(components)
+
+    is_single = component_sizes[components] == 1
+    matched_kaggle_rows = [kaggle_rows[is_single]]
+    matched_extra_rows = [extra_rows[is_single]]
+
+    order = np.argsort(components[~is_single], kind='stable')
+    components = components[~is_single][order]
+    split_points = np.flatnonzero(np.diff(components)) + 1
+    for component_kaggle_rows, component_extra_rows, component_scores in zip(
+            np.split(kaggle_rows[~is_single][order], split_points),
+            np.split(extra_rows[~is_single][order], split_points),
+            np.split(scores[~is_single][order], split_points)):
+        if not len(component_scores):
+            continue
+        component_kaggle_rows, component_extra_rows = _assign_component(
+            component_kaggle_rows, component_extra_rows, component_scores)
+        matched_kaggle_rows.append(component_kaggle_rows)
+        matched_extra_rows.append(component_extra_rows)
+    return list(zip(np.concatenate(matched_kaggle_rows),
+                    np.concatenate(matched_extra_rows)))
+
+
+def _load_manual_matches():
+    with open(_manual_matches_path, 'r') as f:
+        match_groups = json.load(f)
+    return {kaggle_id: extra_id
+            for match_group in match_groups
+            for kaggle_id, extra_id in match_group['matches']}
+
+
+def _match(kaggle_df, extra_df, find_pairs):
+    """Returns the matches among the candidate pairs found by `find_pairs`.
+    """
+    pairs_df = find_pairs(kaggle_df, extra_df)
+    scores = score_pairs(kaggle_df, extra_df, pairs_df)
+    matched_pairs = assign(len(kaggle_df), len(extra_df), pairs_df, scores)
+    return {int(kaggle_df.index[kaggle_row]): int(extra_df.index[extra_row])
+            for kaggle_row, extra_row in matched_pairs}
+
+
+def match_passengers(kaggle_df, extra_df, manual_matches=None):
+    """Returns the dict {Kaggle PassengerId: extra data PassengerId} of the
+    passengers found in both. The `manual_matches` are kept as they are.
+
+    The passengers are first compared within the blocks of
+    `candidate_pairs`. The ones left unmatched are then compared by similar
+    names, see `similar_name_pairs`.
+    """
+    manual_matches = manual_matches or {}
+    kaggle_df = kaggle_df.drop(index=list(manual_matches), errors='ignore')
+    extra_df = extra_df.drop(index=list(manual_matches.values()),
+                             errors='ignore')
+
+    matches = _match(kaggle_df, extra_df, candidate_pairs)
+    # The passengers left out may have their names spelled differently.
+    kaggle_df = kaggle_df.drop(index=list(matches))
+    extra_df = extra_df.drop(index=list(matches.values()))
+    matches.update(_match(kaggle_df, extra_df, similar_name_pairs))
+    matches.update(manual_matches)
+    return dict(sorted(matches.items()))
+
+
+def write_matches(matches, path=_matches_path):
+    with open(path, 'w') as f:
+        json.dump({str(kaggle_id): extra_id
+                   for kaggle_id, extra_id in matches.items()}, f, indent=2)
+
+
+def main():
+    kaggle_df = kaggle_passengers()
+    extra_df = extra_passengers()
+    matches = match_passengers(kaggle_df, extra_df, _load_manual_matches())
+    _logger.info('{}/{} passengers matched'.format(len(matches),
+                                                   len(kaggle_df)))
+    write_matches(matches)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,5 @@
 import data.integration.postprocessing as postpro
+import pipeline
 import pandas as pd
 import os
 
@@ -9,33 +10,38 @@ _extra_data_filepath = os.path.join(os.environ['HOME'],
                                     'data',
                                     'extra_data.csv')
 
+_post_processing_steps = [
+    postpro.manually_fix_titles,
+    postpro.extract_ticket_number_and_price,
+    postpro.format_destination,
+    postpro.extract_city_region_country,
+    postpro.add_belfast_as_embarking_city,
+    postpro.embarked_as_single_character,
+    postpro.manually_fill_missing_nationalities,
+    postpro.manually_fill_missing_birth_dates,
+    postpro.extract_cabin_deck,
+    postpro.gender_to_lower_case,
+    postpro.compute_age_in_days,
+    postpro.assign_id,
+]
+
 
 def import_extra_data():
     df = pd.read_csv(_extra_data_filepath)
     return df
 
 
-def apply_post_processing(df):
-    post_processing_functions = [
-        postpro.manually_fix_titles,
-        postpro.extract_ticket_number_and_price,
-        postpro.extract_birth_city_region_country,
-        postpro.extract_residence_city_region_country,
-        postpro.extract_destination_city_region_country,
-        postpro.add_belfast_as_embarking_city,
-        postpro.embarked_as_single_character,
-        postpro.manually_fill_missing_nationalities,
-        postpro.manually_fill_missing_birth_dates,
-        postpro.extract_cabin_deck,
-        postpro.gender_to_lower_case,
-        postpro.compute_age_in_days,
-        postpro.assign_id,
-    ]
-
-    for func in post_processing_functions:
-        df = func(df)
-
-    return df
+def apply_post_processing(df, num_workers=1, profiler=None):
+    """Runs the post-processing stages on `df`. Only the stages whose input
+    columns, code or data files changed since the last run actually run: the
+    others are read from the feature cache. The row-local parsing stages run
+    on shards of the rows, in `num_workers` processes. Each stage is profiled
+    by `profiler`, if given.
+    """
+    return pipeline.run(df,
+                        _post_processing_steps,
+                        num_workers=num_workers,
+                        profiler=profiler)
 
 
 def main():
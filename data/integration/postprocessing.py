@@ -2,6 +2,7 @@
     www.encyclopedia-titanica.org
 """
 
+import calendar
 import datetime as dt
 import json
 import os
@@ -9,9 +10,23 @@ import os
 import numpy as np
 import pandas as pd
 
+import gazetteer as gz
+import patches
+import pipeline
+import preprocessing as pp
+
 # The date of the sinking.
 _sinking_date = dt.date(year=1912, month=4, day=15)
 
+# Seed of the months and days drawn for the partial birth dates.
+_birth_date_seed = 1912
+
+_month_numbers = {calendar.month_name[month].lower(): month
+                  for month in range(1, 13)}
+
+# Columns holding a location, as "City, Region, Country".
+_location_fields = ['BirthPlace', 'Residence', 'Destination']
+
 # List of UrlId of passengers embarked in Belfast.
 _belfast_passengers_path = os.path.join(os.environ['HOME'],
                                         'kaggle',
@@ -20,105 +35,108 @@ _belfast_passengers_path = os.path.join(os.environ['HOME'],
                                         'belfast_passengers.json')
 
 
+@pipeline.stage(['UrlId', 'FirstName', 'LastName', 'Title'],
+                ['FirstName', 'Title'],
+                data_files=[patches.patch_table_path('extra_titles')],
+                helpers=[patches])
 def manually_fix_titles(df):
-    # Fix missing titles.
-    df.loc[df['LastName'] == 'Banfi', ['Title']] = 'Mr'
-    df.loc[df['FirstName'] == 'Lucy Christiana, Lady',
-           ['FirstName', 'Title']] = ['Lucy Christiana', 'Lady']
-    df.loc[df['FirstName'] == 'Lucy Noël Martha, Countess of',
-           ['FirstName', 'Title']] = ['Lucy Noël Martha', 'Countess']
-    df.loc[df['LastName'] == 'Walsh', ['Title']] = 'Msr'
-
-    # Mr Eugene Joseph Abbott is 13 yo: he's probably a Master instead of a Mr.
-    df.loc[df['UrlId'] == '/titanic-victim/eugene-joseph-abbott.html',
-           ['Title']] = 'Master'
-
-    # Sra. Asuncion Durán i Moné and Sra. Florentina Durán i Moné were both
-    # single: let's make it clear by changing "Sra" with "Miss".
-    df.loc[df['UrlId'].isin(['/titanic-survivor/asuncion-duran-y-more.html',
-                             '/titanic-survivor/florentina-duran-y-more.html']),
-           ['Title']] = 'Miss'
-
-    # Mr Colonel (Oberst) Alfons Simonius-Blumer is a Colonel.
-    df.loc[df['UrlId'] == '/titanic-survivor/alfons-simonius-blumer.html',
-           ['Title']] = 'Colonel'
+    return patches.apply_patch_table(df,
+                                     patches.patch_table_path('extra_titles'))
 
-    return df
 
-
-def extract_ticket_number_and_price(df):
+def _parse_tickets(tickets):
     # Remove the initial "Ticket No." string and split number and price.
-    df[['Ticket', 'TicketPrice']] = df['Ticket'] \
-        .str.split('No. ', expand=True)[1] \
+    # Shards of the rows may hold no ticket or no price at all: both splits
+    # must still give the columns.
+    tickets_df = tickets \
+        .str.split('No. ', n=1, expand=True) \
+        .reindex(columns=[0, 1])[1] \
+        .astype(object) \
         .str.strip() \
-        .str.split(', ', expand=True)
+        .str.split(', ', n=1, expand=True) \
+        .reindex(columns=[0, 1]) \
+        .astype(object)
+    tickets_df.columns = ['Ticket', 'TicketPrice']
 
     # Extract the ticket number.
     ticket_number_pattern = r'^\D*(?P<TicketNumber>\d+)$'
-    df = df.join(df['Ticket'] \
-                 .str.strip()
-                 .str.extract(ticket_number_pattern, expand=True)
-                 .astype(float))
+    tickets_df['TicketNumber'] = tickets_df['Ticket'] \
+        .str.strip() \
+        .str.extract(ticket_number_pattern, expand=False) \
+        .astype(float)
 
     # Extract the ticket price: first extract pounds, shillings and pence and
     # then sum them together:
     #  1 pound (£) = 20 shillings (s)
     #  1 shilling (s) = 12 pence (d)
-    # This extraction requires the creation of 3 intermediate columns.
     ticket_price_pattern = r'(?:£(?P<Pounds>\d+))\s*' \
                            r'(?:(?P<Shillings>\d+)s)?\s*' \
                            r'(?:(?P<Pence>\d+)d)?'
-    df = df.join(df['TicketPrice'] \
-                 .str.extract(ticket_price_pattern, expand=True)
-                 .astype(float))
+    price_df = tickets_df['TicketPrice'] \
+        .str.extract(ticket_price_pattern, expand=True) \
+        .astype(float) \
+        .fillna(0)
+    tickets_df['TicketPrice'] = price_df['Pounds'] \
+                                + (1 / 20) * price_df['Shillings'] \
+                                + (1 / 240) * price_df['Pence']
+    return tickets_df
+
+
+@pipeline.stage(['Ticket'],
+                ['Ticket', 'TicketPrice', 'TicketNumber'],
+                row_local=True,
+                helpers=[_parse_tickets, pp.transform_unique_values])
+def extract_ticket_number_and_price(df):
+    # Many passengers share a ticket: each ticket is only parsed once.
+    tickets_df = pp.transform_unique_values(df['Ticket'], _parse_tickets)
+    df['Ticket'] = tickets_df['Ticket']
 
     # Fill the nan with zeros. This should hold because the people without
     # ticket seem to be employees of the cruise, hence they actually paid £0.
-    df[['Pounds', 'Shillings', 'Pence']] = \
-        df[['Pounds', 'Shillings', 'Pence']].fillna(0)
-
-    df['TicketPrice'] = df['Pounds'] \
-                        + (1 / 20) * df['Shillings'] \
-                        + (1 / 240) * df['Pence']
-
-    # Drop the intermediate columns.
-    df = df.drop(columns=['Pounds', 'Shillings', 'Pence'])
-
+    df['TicketPrice'] = tickets_df['TicketPrice'].fillna(0)
+    df['TicketNumber'] = tickets_df['TicketNumber']
     return df
 
 
-def _extract_city_region_country_from_location(df, field_name):
-    suffixes = ['CityRegion', 'City', 'Region', 'Country']
-    city_region, city, region, country = \
-        ['{}{}'.format(field_name, suffix) for suffix in suffixes]
-
-    df[[city_region, country]] = \
-        df[field_name].str.strip().str.rsplit(', ', n=1, expand=True)
-    df[[city, region]] = df[city_region].str.split(', ', n=1, expand=True)
-    df = df.drop(columns=city_region)
+@pipeline.stage(['Destination'],
+                ['Destination'],
+                row_local=True,
+                helpers=[pp.transform_unique_values])
+def format_destination(df):
+    df['Destination'] = pp.transform_unique_values(
+        df['Destination'],
+        lambda destinations: destinations
+        .str.split(':', expand=True)[1]
+        .str.strip())
     return df
 
 
-def extract_birth_city_region_country(df):
-    return _extract_city_region_country_from_location(df, 'BirthPlace')
-
-
-def extract_residence_city_region_country(df):
-    return _extract_city_region_country_from_location(df, 'Residence')
-
-
-def extract_destination_city_region_country(df):
-    df['Destination'] = df['Destination'] \
-        .str.split(':', expand=True)[1] \
-        .str.strip()
-    return _extract_city_region_country_from_location(df, 'Destination')
+@pipeline.stage(_location_fields,
+                ['{}{}'.format(field_name, level)
+                 for field_name in _location_fields
+                 for level in gz.LEVELS],
+                helpers=[gz])
+def extract_city_region_country(df):
+    # The places of all the fields are indexed together: a place gets the
+    # same canonical name whichever field mentions it.
+    gazetteer = gz.Gazetteer.build([df[field_name]
+                                    for field_name in _location_fields])
+    for field_name in _location_fields:
+        locations_df = gazetteer.resolve(df[field_name])
+        for level in gz.LEVELS:
+            df['{}{}'.format(field_name, level)] = locations_df[level]
+    return df
 
 
+@pipeline.stage(['Embarked'], ['Embarked'])
 def embarked_as_single_character(df):
-    df[['Embarked']] = df['Embarked'].str.slice(stop=1)
+    df['Embarked'] = df['Embarked'].str.slice(stop=1)
     return df
 
 
+@pipeline.stage(['UrlId', 'Embarked'],
+                ['Embarked'],
+                data_files=[_belfast_passengers_path])
 def add_belfast_as_embarking_city(df):
     with open(_belfast_passengers_path, 'r') as f:
         belfast_passengers = json.load(f)
@@ -126,6 +144,7 @@ def add_belfast_as_embarking_city(df):
     return df
 
 
+@pipeline.stage(['Nationality'], ['Nationality'])
 def manually_fill_missing_nationalities(df):
     # Only three passenger have a missing nationality and all of them sound
     # English by the name.
@@ -133,10 +152,13 @@ def manually_fill_missing_nationalities(df):
     return df
 
 
+@pipeline.stage(['FirstName', 'LastName', 'BirthDate'],
+                ['BirthDate'],
+                data_files=[patches.patch_table_path('extra_birth_dates')],
+                helpers=[patches])
 def manually_fill_missing_birth_dates(df):
-    df.loc[(df['FirstName'] == 'Juho') & (df['LastName'] == 'Niskanen'),
-           ['BirthDate']] = '1870'
-    return df
+    return patches.apply_patch_table(
+        df, patches.patch_table_path('extra_birth_dates'))
 
 
 def extract_birth_year(df):
@@ -146,64 +168,121 @@ def extract_birth_year(df):
     return df
 
 
-def extract_cabin_deck(df):
-    # This function also formats the Cabin column.
-    df['Cabin'] = df['Cabin'].str.split(':', expand=True)[1].str.strip()
-    df['CabinDeck'] = df['Cabin'].str.extract(r'^\W*(\w)', expand=True)
-
-    # Passenger Benoît Picard does not have the deck indicated,
-    # but it was probably deck F.
-    df.loc[df['UrlId'] == '/titanic-survivor/berk-pickard.html',
-           ['CabinDeck']] = 'F'
+def _format_cabins_and_extract_decks(cabins):
+    cabins = cabins.str.split(':', expand=True)[1].str.strip()
+    decks = cabins.str.extract(r'^\W*(\w)', expand=False)
 
     # Some passengers are assigned deck "R", which is actually a location
     # in deck F.
-    df.loc[df['CabinDeck'] == 'R', ['CabinDeck']] = 'F'
+    decks[decks == 'R'] = 'F'
+    return pd.DataFrame({'Cabin': cabins, 'CabinDeck': decks})
+
+
+def _format_cabin_and_extract_deck(df):
+    # Families share cabins: each cabin is only parsed once.
+    cabins_df = pp.transform_unique_values(df['Cabin'],
+                                           _format_cabins_and_extract_decks)
+    df['Cabin'] = cabins_df['Cabin']
+    df['CabinDeck'] = cabins_df['CabinDeck']
     return df
 
 
+@pipeline.stage(['UrlId', 'Cabin'],
+                ['Cabin', 'CabinDeck'],
+                data_files=[patches.patch_table_path('extra_cabin_decks')],
+                helpers=[_format_cabin_and_extract_deck,
+                         _format_cabins_and_extract_decks,
+                         pp.transform_unique_values,
+                         patches])
+def extract_cabin_deck(df):
+    # This function also formats the Cabin column.
+    df = _format_cabin_and_extract_deck(df)
+    return patches.apply_patch_table(
+        df, patches.patch_table_path('extra_cabin_decks'))
+
+
+@pipeline.stage(['Sex'], ['Sex'])
 def gender_to_lower_case(df):
     df['Sex'] = df['Sex'].str.lower()
     return df
 
 
+def _parse_birth_dates(birth_dates):
+    """Splits the birth dates, in the formats "1870-10-19", "1870" or
+    "January 1912", in year, month and day. Missing parts are NaN. The
+    dates with the month name are also rewritten as "1912-01".
+    """
+    parts_df = birth_dates.str.extract(
+        r'^(?P<year>\d{4})(?:-(?P<month>\d{1,2})(?:-(?P<day>\d{1,2}))?)?$')
+    named_parts_df = birth_dates.str.extract(
+        r'^(?P<month_name>[A-Za-z]+) (?P<year>\d{4})$')
+    named_parts_df['month'] = named_parts_df['month_name'] \
+        .str.lower() \
+        .map(_month_numbers)
+
+    has_month_name = named_parts_df['month'].notna()
+    parts_df.loc[has_month_name, 'year'] = named_parts_df['year']
+    parts_df.loc[has_month_name, 'month'] = named_parts_df['month']
+    parts_df = parts_df.astype(float)
+
+    parts_df['BirthDate'] = birth_dates.where(
+        ~has_month_name,
+        named_parts_df['year'] + '-' + named_parts_df['month']
+        .map('{:02.0f}'.format))
+    return parts_df
+
+
+def _fill_with_random_integers(values, low, high, rng):
+    """Replaces the NaN `values` with integers drawn in [low, high)."""
+    values = values.copy()
+    is_missing = np.isnan(values)
+    values[is_missing] = rng.integers(low, high, size=is_missing.sum())
+    return values
+
+
+@pipeline.stage(['Age', 'BirthDate'],
+                ['Age', 'BirthDate', 'AgeInDays'],
+                helpers=[_parse_birth_dates,
+                         _month_numbers,
+                         _fill_with_random_integers,
+                         pp.transform_unique_values,
+                         _sinking_date,
+                         _birth_date_seed])
 def compute_age_in_days(df):
     # Explicitly set the missing ages to NaN.
     df.loc[df['BirthDate'].isna(), ['Age']] = np.nan
 
-    # Convert the dates in the format "January 1912" to "1912-04".
+    # Many passengers share the birth date, or at least the birth year.
+    parts_df = pp.transform_unique_values(df['BirthDate'], _parse_birth_dates)
+    df['BirthDate'] = parts_df['BirthDate']
+
     # We don't use directly the to_datetime function because we don't want
     # all the missing values to be set to 1, as it is by default.
-    # We prefer to randomize the missing months and days.
-    mask = ~(df['BirthDate'].str.extract(r'([A-Za-z])').isna())[0]
-    numeral_dates = df[mask]['BirthDate'].apply(
-        lambda d: dt.datetime.strptime(d, '%B %Y').strftime('%Y-%m'))
-    df.loc[mask, 'BirthDate'] = numeral_dates
-
-    # Split the birth date in year, month and day.
-    df[['year', 'month', 'day']] = df['BirthDate'] \
-        .str.split('-', expand=True) \
-        .astype(float)
-
-    # Randomize the missing months.
-    nan_months = df.loc[df.month.isna(), ['month']]
-    nan_months['month'] = np.random.randint(1, 13, size=len(nan_months))
-    df.loc[df.month.isna(), ['month']] = nan_months.astype(int)
-
-    # Randomize the missing days.
-    nan_days = df.loc[df.day.isna(), ['day']]
-    nan_days['day'] = np.random.randint(1, 29, size=len(nan_days))
-    df.loc[df.day.isna(), ['day']] = nan_days.astype(int)
-
-    df['AgeInDays'] = pd.to_datetime(df[['year', 'month', 'day']]).apply(
-        lambda d: (pd.Timestamp(_sinking_date) - d).days)
-
-    # Get rid of the utility columns.
-    df = df.drop(columns=['year', 'month', 'day'])
+    # We prefer to randomize the missing months and days, with a fixed seed
+    # to get the same ages at every run.
+    has_year = parts_df['year'].notna().values
+    rng = np.random.default_rng(_birth_date_seed)
+    years = parts_df['year'].values[has_year].astype(int)
+    months = _fill_with_random_integers(parts_df['month'].values[has_year],
+                                        1, 13, rng).astype(int)
+    days = _fill_with_random_integers(parts_df['day'].values[has_year],
+                                      1, 29, rng).astype(int)
+
+    birth_months = ((years - 1970) * 12 + months - 1).astype('datetime64[M]')
+    birth_dates = birth_months.astype('datetime64[D]') \
+        + (days - 1).astype('timedelta64[D]')
+    age_in_days = (np.datetime64(_sinking_date, 'D') - birth_dates) \
+        .astype(int)
+
+    # The ages stay integers if no birth date is missing.
+    df['AgeInDays'] = pd.Series(age_in_days, index=np.flatnonzero(has_year)) \
+        .reindex(np.arange(len(df))) \
+        .values
 
     return df
 
 
+@pipeline.stage([], ['PassengerId'])
 def assign_id(df):
     df['PassengerId'] = df.index
     return df
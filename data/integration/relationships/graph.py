@@ -0,0 +1,211 @@
+"""Sparse graph of the relationships between passengers, read from
+data/relationships_data.json and the manual fixes.
+
+Passenger 1 says: "passenger 2 is my <relationship>". The graph is a CSR
+matrix with the code of the coarse relationship (see `mapping.codes`) at
+(row of passenger 1, row of passenger 2), and the code of the reciprocal
+relationship at (row of passenger 2, row of passenger 1). The rows of the
+passengers are looked up by UrlId through a hash index.
+
+When the relationships of a pair of passengers disagree, the manual fixes
+win, and any relationship wins over the generic "knows". Otherwise the last
+one read wins. Relationships with people not aboard are left out.
+
+Example:
+    graph = RelationshipGraph.build(df['UrlId'])
+    num_children = graph.count('child')
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import data.integration.relationships.manual_fixes as mf
+import data.integration.relationships.mapping as mapping
+
+_logger = logging.getLogger(__name__)
+
+_relationships_path = os.path.join(os.environ['HOME'],
+                                   'kaggle',
+                                   'titanic',
+                                   'data',
+                                   'relationships_data.json')
+
+# The reciprocal code of each code.
+_reciprocal_codes = np.zeros(len(mapping.codes) + 1, dtype=np.int8)
+for _rel, _code in mapping.codes.items():
+    _reciprocal_codes[_code] = mapping.codes[mapping.reciprocals[_rel]]
+
+# Priorities of the relationships of a pair of passengers.
+_knows_priority = 0
+_relationship_priority = 1
+_manual_fix_priority = 2
+
+
+def load_relationships(path=_relationships_path):
+    """Returns the (UrlId, OtherUrlId, Relationship) of the relationships
+    of `path`, as coarse relationships.
+    """
+    with open(path, 'r') as f:
+        passenger_dicts = json.load(f)
+    relationships_df = pd.DataFrame(
+        [(passenger_dict['UrlId'], other_url_id, rel_type, rel_desc)
+         for passenger_dict in passenger_dicts
+         for other_url_id, rel_type, rel_desc
+         in passenger_dict['Relationships']],
+        columns=['UrlId', 'OtherUrlId', 'Type', 'Description'])
+
+    # Prefer the description, if available, over the relationship type.
+    relationships = relationships_df['Description'].map(
+        mapping.fine_description_to_coarse_description)
+    relationships = relationships.where(
+        relationships_df['Description'] != '',
+        relationships_df['Type'].map(
+            mapping.relationship_type_to_coarse_description))
+    if relationships.isna().any():
+        url_id, other_url_id = relationships_df.loc[
+            relationships.isna(), ['UrlId', 'OtherUrlId']].iloc[0]
+        raise ValueError('No valid relationship between {} and {}'
+                         .format(url_id, other_url_id))
+
+    return pd.DataFrame({
+        'UrlId': relationships_df['UrlId'],
+        'OtherUrlId': relationships_df['OtherUrlId'],
+        'Relationship': relationships,
+    })
+
+
+def _manual_fixes_frame(manual_fixes):
+    return pd.DataFrame(
+        [(url_id, other_url_id, rel)
+         for url_id, rel_list in manual_fixes.items()
+         for rel, other_url_id in rel_list],
+        columns=['UrlId', 'OtherUrlId', 'Relationship'])
+
+
+class UrlIdIndex:
+    """Hash index of the rows of the passengers, by UrlId."""
+
+    def __init__(self, url_ids):
+        # The UrlId of each row, None for the passengers without one.
+        self.url_ids = np.asarray(url_ids, dtype=object)
+        rows = np.flatnonzero(pd.notna(self.url_ids))
+        self._index = pd.Index(self.url_ids[rows])
+        if not self._index.is_unique:
+            raise ValueError('Duplicated UrlIds: {}'.format(
+                list(self._index[self._index.duplicated()][:5])))
+        # Unknown UrlIds get the trailing -1.
+        self._rows = np.append(rows, -1)
+
+    def __len__(self):
+        return len(self.url_ids)
+
+    def rows(self, url_ids):
+        """Returns the rows of the passengers of `url_ids`, -1 for the
+        unknown ones.
+        """
+        return self._rows[self._index.get_indexer(url_ids)]
+
+
+class RelationshipGraph:
+
+    def __init__(self, index, matrix):
+        self.index = index
+        # matrix[row, other_row] is the code of the relationship.
+        self.matrix = matrix
+
+    @classmethod
+    def build(cls, url_ids, relationships_df=None,
+              manual_fixes=mf.manual_fixes):
+        """Returns the graph of the relationships between the passengers of
+        `url_ids`, the UrlId of each row.
+
+        The relationships are the ones of `relationships_df`, as returned by
+        `load_relationships`, loaded from data/relationships_data.json if not
+        given, then the `manual_fixes`.
+        """
+        if relationships_df is None:
+            relationships_df = load_relationships()
+        fixes_df = _manual_fixes_frame(manual_fixes)
+        edges_df = pd.concat([relationships_df, fixes_df], ignore_index=True)
+        priorities = np.where(
+            edges_df['Relationship'] == 'knows',
+            _knows_priority,
+            _relationship_priority)
+        priorities[len(relationships_df):] = _manual_fix_priority
+
+        index = UrlIdIndex(url_ids)
+        rows = index.rows(edges_df['UrlId'])
+        other_rows = index.rows(edges_df['OtherUrlId'])
+        codes = edges_df['Relationship'].map(mapping.codes) \
+            .values.astype(np.int8)
+        is_valid = (rows >= 0) & (other_rows >= 0) & (rows != other_rows)
+        rows, other_rows, codes, priorities, orders = \
+            rows[is_valid], other_rows[is_valid], codes[is_valid], \
+            priorities[is_valid], np.flatnonzero(is_valid)
+
+        # Each pair is seen from its lowest row: both passengers may have
+        # said how they are related.
+        is_swapped = rows > other_rows
+        rows, other_rows = \
+            np.where(is_swapped, other_rows, rows), \
+            np.where(is_swapped, rows, other_rows)
+        codes = np.where(is_swapped, _reciprocal_codes[codes], codes)
+
+        # The relationship of highest priority of each pair, the last one
+        # read among equals.
+        order = np.lexsort((orders, priorities, other_rows, rows))
+        rows, other_rows, codes, priorities = \
+            rows[order], other_rows[order], codes[order], priorities[order]
+        is_last = np.ones(len(rows), dtype=bool)
+        is_last[:-1] = (np.diff(rows) != 0) | (np.diff(other_rows) != 0)
+
+        # Pairs told two different relationships, the generic "knows" apart.
+        is_told = priorities == _relationship_priority
+        told_df = pd.DataFrame({'Row': rows[is_told],
+                                'OtherRow': other_rows[is_told],
+                                'Code': codes[is_told]})
+        num_conflicts = (told_df.groupby(['Row', 'OtherRow'])['Code']
+                         .nunique() > 1).sum()
+        if num_conflicts:
+            _logger.info('{} pairs of passengers with mismatching '
+                         'relationships'.format(num_conflicts))
+
+        rows, other_rows, codes = \
+            rows[is_last], other_rows[is_last], codes[is_last]
+        matrix = sparse.csr_matrix(
+            (np.concatenate([codes, _reciprocal_codes[codes]]),
+             (np.concatenate([rows, other_rows]),
+              np.concatenate([other_rows, rows]))),
+            shape=(len(index), len(index)),
+            dtype=np.int8)
+        return cls(index, matrix)
+
+    def adjacency(self, relationship=None):
+        """Returns the CSR matrix with 1 at (row, other row) if the other
+        passenger is the `relationship` of the passenger, of any
+        relationship if None.
+        """
+        if relationship is None:
+            is_related = self.matrix.data != 0
+        else:
+            is_related = self.matrix.data == mapping.codes[relationship]
+        # Dropping the zeros works in place: the structure of the matrix
+        # must not be shared.
+        adjacency = sparse.csr_matrix(
+            (is_related.astype(np.int8),
+             self.matrix.indices.copy(),
+             self.matrix.indptr.copy()),
+            shape=self.matrix.shape)
+        adjacency.eliminate_zeros()
+        return adjacency
+
+    def count(self, relationship=None):
+        """Returns the number of passengers being the `relationship` of each
+        passenger, of any relationship if None.
+        """
+        return np.diff(self.adjacency(relationship).indptr)
@@ -121,3 +121,12 @@ relationship_type_to_coarse_description = {
     'spouse': 'spouse',
     'colleague': 'friend',
 }
+
+
+# Codes of the coarse relationships in the relationship graph. 0 stands for
+# no relationship.
+codes = {
+    rel: code
+    for code, rel
+    in enumerate(coarse_description_to_fine_description.keys(), start=1)
+}
@@ -1,5 +1,8 @@
+import json
 import os
+import shutil
 
+import numpy as np
 import pandas as pd
 
 ID_COLUMN_NAME = 'PassengerId'
@@ -12,24 +15,237 @@ _testset_path = os.path.join(_data_dir, 'test.csv')
 _xdataset_path = os.path.join(_data_dir, 'xtrain.csv')
 _xtestset_path = os.path.join(_data_dir, 'xtest.csv')
 
+# Declared dtypes of the extended passenger tables. Columns not listed here
+# (names, ids, dates, raw tickets and locations) keep pandas' inference.
+_extended_categorical_columns = [
+    'Embarked',
+    'Job',
+    'MaritalStatus',
+    'Nationality',
+    'Pclass',
+    'Sex',
+    'Title',
+    'BirthPlaceCountry',
+    'BirthPlaceCity',
+    'BirthPlaceRegion',
+    'ResidenceCountry',
+    'ResidenceCity',
+    'ResidenceRegion',
+    'DestinationCountry',
+    'DestinationCity',
+    'DestinationRegion',
+    'CabinDeck',
+    'Split',
+]
+_extended_count_columns = [
+    'SibSp',
+    'Parch',
+    'NumChild',
+    'NumEmployee',
+    'NumEmployer',
+    'NumFriend',
+    'NumKnows',
+    'NumParent',
+    'NumRelative',
+    'NumSibling',
+    'NumSpouse',
+]
+_extended_float_columns = [
+    'Age',
+    'AgeInDays',
+    'TicketPrice',
+    'TicketNumber',
+]
+EXTENDED_SCHEMA = {
+    **{col_name: 'category' for col_name in _extended_categorical_columns},
+    **{col_name: 'int8' for col_name in _extended_count_columns},
+    **{col_name: 'float32' for col_name in _extended_float_columns},
+}
 
-def load_test_set(extended=True):
+# The extended test set is indexed by the Kaggle passenger id.
+_xtestset_sources = {ID_COLUMN_NAME: 'KPassengerId'}
+_xtestset_schema = dict(EXTENDED_SCHEMA, KPassengerId='int64')
+
+# Each csv table gets a binary copy in a sibling directory, one pickled
+# column per file. Bump the version whenever the cached layout changes.
+_CACHE_VERSION = 2
+_cache_dir_suffix = '.cache'
+_cache_meta_filename = 'meta.json'
+
+
+def _cache_signature(csv_path, dtype, sources):
+    # The cache is invalidated whenever the source file is touched, the
+    # dtypes and the column sources applied to it change, or the library
+    # versions the pickles depend on change.
+    stat = os.stat(csv_path)
+    return {
+        'version': _CACHE_VERSION,
+        'pandas_version': pd.__version__,
+        'numpy_version': np.__version__,
+        'source_mtime_ns': stat.st_mtime_ns,
+        'source_size': stat.st_size,
+        'dtype': dtype,
+        'sources': sources,
+    }
+
+
+def _read_cache_meta(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, _cache_meta_filename), 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_cache_meta(cache_dir, meta):
+    with open(os.path.join(cache_dir, _cache_meta_filename), 'w') as f:
+        json.dump(meta, f, indent=2)
+
+
+def _table_columns(csv_path, sources):
+    # The table columns are the csv columns, with each column listed in
+    # `sources` replacing the one it is named after.
+    source_names = set(sources.values())
+    table_columns = []
+    for csv_col_name in pd.read_csv(csv_path, nrows=0).columns:
+        if csv_col_name in sources:
+            continue
+        if csv_col_name in source_names:
+            table_columns.extend(col_name
+                                 for col_name, source in sources.items()
+                                 if source == csv_col_name)
+            continue
+        table_columns.append(csv_col_name)
+    return table_columns
+
+
+def _new_cache(csv_path, cache_dir, signature, sources):
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    return dict(signature,
+                table_columns=_table_columns(csv_path, sources),
+                columns={})
+
+
+def _add_to_cache(df, cache_dir, meta):
+    os.makedirs(cache_dir, exist_ok=True)
+    for col_name in df.columns:
+        filename = '{}.pkl'.format(len(meta['columns']))
+        df[col_name].to_pickle(os.path.join(cache_dir, filename))
+        meta['columns'][col_name] = filename
+
+    # The meta file is written last: columns written without it are
+    # simply ignored and parsed again on the next load.
+    _write_cache_meta(cache_dir, meta)
+
+
+def _read_table(csv_path, columns=None, dtype=None, sources=None):
+    """Loads the given columns of a csv table through its on-disk binary
+    cache.
+
+    Columns not cached yet are parsed from the csv with the given `dtype`
+    mapping, and only them: `columns` defaults to the whole table. `sources`
+    maps a table column to the csv column it is read from. Cached columns
+    are reused as long as the csv file, the dtypes and the sources did not
+    change.
+    """
+    sources = sources or {}
+    cache_dir = csv_path + _cache_dir_suffix
+    signature = _cache_signature(csv_path, dtype, sources)
+    meta = _read_cache_meta(cache_dir)
+
+    if meta is None \
+            or {key: meta.get(key) for key in signature} != signature:
+        meta = _new_cache(csv_path, cache_dir, signature, sources)
+
+    if columns is None:
+        columns = meta['table_columns']
+    columns = list(dict.fromkeys([ID_COLUMN_NAME] + list(columns)))
+
+    missing_columns = [col_name
+                       for col_name in columns
+                       if col_name not in meta['columns']]
+    parsed_df = pd.DataFrame()
+    if missing_columns:
+        usecols = [sources.get(col_name, col_name)
+                   for col_name in missing_columns]
+        parsed_df = pd.read_csv(csv_path, usecols=usecols, dtype=dtype)
+        parsed_df = parsed_df.rename(columns={
+            source: col_name for col_name, source in sources.items()})
+        try:
+            _add_to_cache(parsed_df, cache_dir, meta)
+        except OSError:
+            # A read-only data directory only costs us the speed-up.
+            pass
+
+    df = pd.DataFrame({
+        col_name: parsed_df[col_name]
+        if col_name in parsed_df.columns
+        else pd.read_pickle(os.path.join(cache_dir, meta['columns'][col_name]))
+        for col_name in columns
+    })
+    return df.set_index(ID_COLUMN_NAME)
+
+
+def dataset_version(extended=True):
+    """Identifies the current content of the training and test tables."""
     if extended:
-        X_test = pd.read_csv(_xtestset_path)
-        X_test = X_test.drop(columns=[ID_COLUMN_NAME])
-        X_test = X_test.rename(columns={'KPassengerId': ID_COLUMN_NAME})
-        X_test[ID_COLUMN_NAME] = X_test[ID_COLUMN_NAME].astype(int)
-        X_test = X_test.set_index(ID_COLUMN_NAME)
+        csv_paths = (_xdataset_path, _xtestset_path)
     else:
-        X_test = pd.read_csv(_testset_path).set_index(ID_COLUMN_NAME)
+        csv_paths = (_dataset_path, _testset_path)
+    return tuple((os.stat(csv_path).st_mtime_ns, os.stat(csv_path).st_size)
+                 for csv_path in csv_paths)
+
+
+def clear_cache():
+    for csv_path in (_dataset_path, _testset_path,
+                     _xdataset_path, _xtestset_path):
+        shutil.rmtree(csv_path + _cache_dir_suffix, ignore_errors=True)
+
+
+def _iter_table(csv_path, chunksize, columns=None, dtype=None, sources=None):
+    # Chunks are always parsed from the csv: the cached columns can only be
+    # unpickled as a whole, which would defeat the bounded memory.
+    sources = sources or {}
+    if columns is None:
+        columns = _table_columns(csv_path, sources)
+    columns = list(dict.fromkeys([ID_COLUMN_NAME] + list(columns)))
+    usecols = [sources.get(col_name, col_name) for col_name in columns]
+
+    reader = pd.read_csv(csv_path,
+                         usecols=usecols,
+                         dtype=dtype,
+                         chunksize=chunksize)
+    renames = {source: col_name for col_name, source in sources.items()}
+    for chunk_df in reader:
+        chunk_df = chunk_df.rename(columns=renames)[columns]
+        yield chunk_df.set_index(ID_COLUMN_NAME)
+
+
+def load_test_set(extended=True, columns=None):
+    """If `columns` is given, only those attributes are loaded."""
+    if extended:
+        X_test = _read_table(_xtestset_path,
+                             columns=columns,
+                             dtype=_xtestset_schema,
+                             sources=_xtestset_sources)
+    else:
+        X_test = _read_table(_testset_path, columns=columns)
     return X_test
 
 
-def load_training_set(extended=True):
+def load_training_set(extended=True, columns=None):
+    """If `columns` is given, only those attributes are loaded, besides
+    the label.
+    """
+    if columns is not None:
+        columns = list(columns) + [LABEL_COLUMN_NAME]
+
     if extended:
-        dataset_df = pd.read_csv(_xdataset_path).set_index(ID_COLUMN_NAME)
+        dataset_df = _read_table(_xdataset_path,
+                                 columns=columns,
+                                 dtype=EXTENDED_SCHEMA)
     else:
-        dataset_df = pd.read_csv(_dataset_path).set_index(ID_COLUMN_NAME)
+        dataset_df = _read_table(_dataset_path, columns=columns)
 
     attributes_columns = [
         col_name
@@ -39,3 +255,77 @@ def load_training_set(extended=True):
     X_train = dataset_df[attributes_columns]
     y_train = dataset_df[LABEL_COLUMN_NAME]
     return X_train, y_train
+
+
+def iter_test_set(chunksize, extended=True, columns=None):
+    """Yields the test set in DataFrames of at most `chunksize` rows.
+    Categorical columns only hold the categories seen in their chunk.
+    """
+    if extended:
+        return _iter_table(_xtestset_path,
+                           chunksize,
+                           columns=columns,
+                           dtype=_xtestset_schema,
+                           sources=_xtestset_sources)
+    return _iter_table(_testset_path, chunksize, columns=columns)
+
+
+def iter_training_set(chunksize, extended=True, columns=None):
+    """Yields the training set in (X_train, y_train) chunks of at most
+    `chunksize` rows. Categorical columns only hold the categories seen in
+    their chunk.
+    """
+    if columns is not None:
+        columns = list(columns) + [LABEL_COLUMN_NAME]
+
+    if extended:
+        chunks = _iter_table(_xdataset_path,
+                             chunksize,
+                             columns=columns,
+                             dtype=EXTENDED_SCHEMA)
+    else:
+        chunks = _iter_table(_dataset_path, chunksize, columns=columns)
+
+    for chunk_df in chunks:
+        yield chunk_df.drop(columns=[LABEL_COLUMN_NAME]), \
+            chunk_df[LABEL_COLUMN_NAME]
+
+
+def memory_usage_report(df):
+    """Returns the dtype and the deep memory usage of each column of `df`,
+    largest first, with a final row for the whole frame.
+    """
+    memory_usage = df.memory_usage(index=True, deep=True)
+    report_df = pd.DataFrame({
+        'dtype': [str(df.index.dtype)] + [str(dtype) for dtype in df.dtypes],
+        'bytes': memory_usage.values,
+    }, index=memory_usage.index)
+    report_df = report_df.sort_values('bytes', ascending=False)
+    report_df['fraction'] = report_df['bytes'] / report_df['bytes'].sum()
+    report_df.loc['Total'] = ['', report_df['bytes'].sum(), 1.]
+    report_df['bytes'] = report_df['bytes'].astype(np.int64)
+    return report_df
+
+
+def main():
+    X_train, y_train = load_training_set()
+    tables = [
+        ('Training set',
+         _xdataset_path,
+         pd.concat([X_train, y_train], axis=1)),
+        ('Test set', _xtestset_path, load_test_set()),
+    ]
+    for table_name, csv_path, df in tables:
+        inferred_bytes = pd.read_csv(csv_path).memory_usage(deep=True).sum()
+        declared_bytes = df.memory_usage(deep=True).sum()
+        print('{}: {:.2f} MB with the declared schema, '
+              '{:.2f} MB with the inferred dtypes'
+              .format(table_name,
+                      declared_bytes / 2 ** 20,
+                      inferred_bytes / 2 ** 20))
+        print(memory_usage_report(df).to_string())
+        print()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""On-disk cache of the columns derived by preprocessing steps.
+
+A step is any function taking a DataFrame and returning it with some columns
+added or overwritten. Its outputs are stored under a key hashing the bytes of
+its input columns, the index included, together with the identity, the
+version and the code of the step: the source of the step and of the helpers
+it declares. A step runs again only if its inputs or its code changed. Bump
+its version whenever any other code it depends on changes.
+
+The least recently used entries are evicted once the cache grows beyond
+`_max_cache_bytes`.
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+
+import pandas as pd
+
+_cache_dir = os.path.join(os.environ['HOME'],
+                          'kaggle',
+                          'titanic',
+                          'data',
+                          '.feature_cache')
+_max_cache_bytes = 512 * 2 ** 20
+_entry_suffix = '.pkl'
+
+# Set to False to always run the steps, e.g. while editing one of them.
+enabled = True
+
+
+def code_fingerprint(step, helpers=()):
+    """Hashes the source of `step` and of its `helpers`: the functions,
+    classes and modules it calls, by their source, and the constants it reads
+    (e.g. regex patterns), by their repr.
+    """
+    digest = hashlib.sha256()
+    for code in [step] + list(helpers):
+        if inspect.isfunction(code) or inspect.isclass(code) \
+                or inspect.ismodule(code):
+            digest.update(inspect.getsource(code).encode())
+        else:
+            digest.update(repr(code).encode())
+    return digest.hexdigest()
+
+
+def _step_key(step, version, fingerprint, df, input_columns):
+    digest = hashlib.sha256()
+    digest.update('{}.{}:{}:{}'.format(step.__module__,
+                                       step.__qualname__,
+                                       version,
+                                       fingerprint).encode())
+    digest.update(pd.util.hash_pandas_object(df.index).values)
+    for col_name in input_columns:
+        column = df[col_name]
+        digest.update('{}:{}'.format(col_name, column.dtype).encode())
+        # Most input columns hold free text: factorizing them first would
+        # cost more than hashing each value.
+        digest.update(pd.util.hash_pandas_object(column,
+                                                 index=False,
+                                                 categorize=False).values)
+    return digest.hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(_cache_dir, key + _entry_suffix)
+
+
+def has_entry(key):
+    return os.path.exists(_entry_path(key))
+
+
+def read_entry(key):
+    """Returns the DataFrame stored under `key`, or None if there is none."""
+    path = _entry_path(key)
+    try:
+        outputs_df = pd.read_pickle(path)
+    except (OSError, ValueError, EOFError, ImportError,
+            pickle.UnpicklingError):
+        return None
+    # The modification time keeps track of the last use.
+    os.utime(path)
+    return outputs_df
+
+
+def write_entry(key, outputs_df):
+    """Stores `outputs_df` under `key`, evicting the least recently used
+    entries if the cache grew too large.
+    """
+    path = _entry_path(key)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        os.makedirs(_cache_dir, exist_ok=True)
+        outputs_df.to_pickle(tmp_path)
+        os.replace(tmp_path, path)
+        _evict(_max_cache_bytes)
+    except OSError:
+        # The outputs are simply not kept: the step will run again.
+        pass
+
+
+def _evict(max_bytes):
+    entries = []
+    for filename in os.listdir(_cache_dir):
+        if not filename.endswith(_entry_suffix):
+            continue
+        stat = os.stat(os.path.join(_cache_dir, filename))
+        entries.append((stat.st_mtime_ns, stat.st_size, filename))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, filename in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(_cache_dir, filename))
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+
+
+def clear_cache():
+    if os.path.isdir(_cache_dir):
+        _evict(0)
+
+
+def cached_step(input_columns, output_columns, version=1, helpers=()):
+    """Decorator caching the `output_columns` a step computes from its
+    `input_columns`. The `helpers` of the step are keyed together with its
+    code, see `code_fingerprint`.
+
+    On a hit the cached columns are assigned to the DataFrame, in place, and
+    the step is skipped altogether.
+    """
+    def decorator(step):
+        fingerprint = None
+
+        @functools.wraps(step)
+        def wrapper(df):
+            nonlocal fingerprint
+            if not enabled:
+                return step(df)
+
+            # The sources are only read once.
+            if fingerprint is None:
+                fingerprint = code_fingerprint(step, helpers)
+            key = _step_key(step, version, fingerprint, df, input_columns)
+            outputs_df = read_entry(key)
+            if outputs_df is not None:
+                for col_name in output_columns:
+                    df[col_name] = outputs_df[col_name]
+                return df
+
+            df = step(df)
+            write_entry(key, df[output_columns])
+            return df
+        return wrapper
+    return decorator
@@ -0,0 +1,584 @@
+"""Feature sets of the models, and the engine computing them.
+
+Each model states the names of its features in `MODEL_FEATURES`. A feature is
+either a raw column of the passenger tables or a derived column, computed by
+one of the functions registered below. A derived column is computed at most
+once per dataset version: models sharing it get the very same values.
+"""
+
+import numpy as np
+import pandas as pd
+
+import data.integration.relationships.graph as rg
+import dataset as ds
+import gazetteer as gz
+import groups
+import preprocessing as pp
+import profiling
+import relationship_features as rf
+import transformers as tr
+
+'''
+Just a copy of all the attributes of the extended tables.
+
+attributes = [
+    'Age',
+    'BirthDate',
+    'BirthPlace',
+    'Cabin',
+    'Destination',
+    'Embarked',
+    'FirstName',
+    'Job',
+    'LastName',
+    'MaritalStatus',
+    'Nationality',
+    'Pclass',
+    'Residence',
+    'Sex',
+    'Ticket',
+    'Title',
+    'UrlId',
+    'TicketPrice',
+    'TicketNumber',
+    'BirthPlaceCountry',
+    'BirthPlaceCity',
+    'BirthPlaceRegion',
+    'ResidenceCountry',
+    'ResidenceCity',
+    'ResidenceRegion',
+    'DestinationCountry',
+    'DestinationCity',
+    'DestinationRegion',
+    'CabinDeck',
+    'AgeInDays',
+    'KPassengerId',
+    'SibSp',
+    'Parch',
+    'Split',
+    'NumChild',
+    'NumEmployee',
+    'NumEmployer',
+    'NumFriend',
+    'NumKnows',
+    'NumParent',
+    'NumRelative',
+    'NumSibling',
+    'NumSpouse',
+]
+'''
+
+_extended_features = [
+    # 'Age',
+    # 'BirthDate',
+    # 'BirthPlace',
+    # 'Cabin',
+    # 'Destination',
+    'Embarked',
+    # 'FirstName',
+    'Job',
+    # 'LastName',
+    'MaritalStatus',
+    'Nationality',
+    'Pclass',
+    # 'Residence',
+    'Sex',
+    # 'Ticket',
+    'Title',
+    # 'UrlId',
+    'TicketPrice',
+    'TicketNumber',
+    'BirthPlaceCountry',
+    # 'BirthPlaceCity',
+    # 'BirthPlaceRegion',
+    'ResidenceCountry',
+    # 'ResidenceCity',
+    # 'ResidenceRegion',
+    'DestinationCountry',
+    # 'DestinationCity',
+    # 'DestinationRegion',
+    'CabinDeck',
+    'AgeInDays',
+    # 'KPassengerId',
+    # 'SibSp',
+    # 'Parch',
+    # 'Split',
+    'NumChild',
+    'NumEmployee',
+    'NumEmployer',
+    'NumFriend',
+    'NumKnows',
+    'NumParent',
+    'NumRelative',
+    'NumSibling',
+    'NumSpouse',
+    *groups.GROUP_FEATURES,
+    *rf.TWO_HOP_FEATURES,
+]
+
+# Group keys, replaced by the survival rate of the group within the
+# cross-validation of the model, see `fold_group_statistics`: the travel
+# group, and the passengers at most two relationships away from the one of
+# the UrlId.
+GROUP_KEY_FEATURES = ['GroupId', 'UrlId']
+
+_kaggle_features = [
+    'Age',
+    'Embarked',
+    'Fare',
+    'Floor',
+    'Parch',
+    'Pclass',
+    'Sex',
+    'SibSp',
+    'TicketNumber',
+    'Title',
+]
+
+# Whether each model is trained on the extended tables, and its features.
+MODEL_FEATURES = {
+    'adaboost': (True, _extended_features),
+    'ensamble_knn': (True, _extended_features),
+    'knn': (True, _extended_features),
+    'random_forest': (True, _extended_features + GROUP_KEY_FEATURES),
+    'svm': (True, _extended_features),
+    'trees': (False, _kaggle_features),
+}
+
+
+# Columns telling the families and travel groups apart.
+_group_fields = ['UrlId', 'TicketNumber', 'Cabin', 'Sex', 'Age']
+
+# Columns holding a location, resolved to canonical places by a gazetteer.
+_location_fields = ['BirthPlace', 'Residence', 'Destination']
+
+
+def _reading(raw_column_names):
+    """Decorator declaring the raw columns a feature function reads: the
+    ones of all the features of a view are loaded together.
+    """
+    def decorator(compute):
+        compute.raw_column_names = list(raw_column_names)
+        return compute
+    return decorator
+
+
+def _raw(attribute_name):
+    @_reading([attribute_name])
+    def compute(store):
+        X_train, X_test = store.raw_columns([attribute_name])
+        return X_train[attribute_name], X_test[attribute_name]
+    return compute
+
+
+def _encoded(attribute_name):
+    """Returns the feature function encoding the values of a categorical
+    feature with the vocabulary of the training set.
+    """
+    def compute(store):
+        X_train, X_test = (
+            values.to_frame(attribute_name)
+            for values in store.categorical_values(attribute_name))
+        X_train = pp.fill_missing_with_unknown(X_train, [attribute_name])
+        X_test = pp.fill_missing_with_unknown(X_test, [attribute_name])
+
+        encoder = tr.CategoricalEncoder([attribute_name]).fit(X_train)
+        return encoder.transform(X_train)[attribute_name], \
+            encoder.transform(X_test)[attribute_name]
+    return compute
+
+
+def _filled(attribute_name, value):
+    @_reading([attribute_name])
+    def compute(store):
+        X_train, X_test = store.raw_columns([attribute_name])
+        return X_train[attribute_name].fillna(value), \
+            X_test[attribute_name].fillna(value)
+    return compute
+
+
+def _added_by(add_column, attribute_name, raw_attribute_name):
+    """Returns the feature function of a column added by a preprocessing
+    function to a frame holding `raw_attribute_name`.
+    """
+    @_reading([raw_attribute_name])
+    def compute(store):
+        X_train, X_test = store.raw_columns([raw_attribute_name])
+        return add_column(X_train)[attribute_name], \
+            add_column(X_test)[attribute_name]
+    return compute
+
+
+def _resolved_location(field_name, level):
+    """Returns the feature function of the canonical names of the `level`
+    places (see gazetteer.LEVELS) of a location field.
+    """
+    feature_name = '{}{}'.format(field_name, level)
+
+    # The gazetteer reads all the location fields.
+    @_reading(_location_fields)
+    def compute(store):
+        X_train, X_test = store.raw_columns([field_name])
+        gazetteer = store.gazetteer()
+        return tuple(gazetteer.resolve(X[field_name])[level]
+                     .rename(feature_name)
+                     for X in (X_train, X_test))
+    return compute
+
+
+def _group_feature(feature_name):
+    @_reading(_group_fields)
+    def compute(store):
+        groups_train, groups_test = store.groups()
+        return groups_train[feature_name], groups_test[feature_name]
+    return compute
+
+
+def _relationship_feature(feature_name):
+    @_reading(['UrlId'])
+    def compute(store):
+        features_train, features_test = store.relationship_features()
+        return features_train[feature_name], features_test[feature_name]
+    return compute
+
+
+# Missing ages are imputed from the passengers of the same class, gender and
+# port of embarkation.
+_age_fields = ['AgeInDays', 'Pclass', 'Sex', 'Embarked']
+
+
+@_reading(_age_fields)
+def _imputed_age_in_days(store):
+    # Use the median of the training set to replace missing ages.
+    X_train, X_test = store.raw_columns(_age_fields)
+    imputer = tr.GroupMedianImputer('AgeInDays', _age_fields[1:])
+    imputer.fit(X_train)
+    return imputer.transform(X_train)['AgeInDays'], \
+        imputer.transform(X_test)['AgeInDays']
+
+
+# Functions returning the values of the categorical features, before they
+# are encoded.
+_extended_categorical_values = {
+    **{attribute_name: _raw(attribute_name)
+       for attribute_name in ['Embarked',
+                              'Job',
+                              'MaritalStatus',
+                              'Nationality',
+                              'Pclass',
+                              'Sex',
+                              'Title',
+                              'CabinDeck']},
+    # Variants of the same place share a single category.
+    **{'{}{}'.format(field_name, level): _resolved_location(field_name, level)
+       for field_name in _location_fields
+       for level in gz.LEVELS},
+}
+
+_kaggle_categorical_values = {
+    'Embarked': _raw('Embarked'),
+    'Pclass': _raw('Pclass'),
+    'Sex': _raw('Sex'),
+    'Floor': _added_by(pp.add_floor_column, 'Floor', 'Cabin'),
+    'Title': _added_by(pp.add_coarse_title_column, 'Title', 'Name'),
+}
+
+_extended_derived_features = {
+    **{attribute_name: _encoded(attribute_name)
+       for attribute_name in _extended_categorical_values},
+    # Missing tickets belong to crew member.
+    'TicketNumber': _filled('TicketNumber', -1),
+    'AgeInDays': _imputed_age_in_days,
+    **{feature_name: _group_feature(feature_name)
+       for feature_name in groups.GROUP_FEATURES + ['GroupId']},
+    **{feature_name: _relationship_feature(feature_name)
+       for feature_name in rf.TWO_HOP_FEATURES},
+}
+
+_kaggle_derived_features = {
+    **{attribute_name: _encoded(attribute_name)
+       for attribute_name in _kaggle_categorical_values},
+    'Age': _filled('Age', -1),
+    'Fare': _filled('Fare', 0),
+    'TicketNumber': _added_by(pp.add_ticket_number_column,
+                              'TicketNumber',
+                              'Ticket'),
+}
+
+
+class FeatureStore:
+    """Features of the training and test sets of one dataset version.
+
+    Raw columns are loaded on demand and every feature is computed on first
+    use only, then kept for any later view.
+    """
+
+    def __init__(self, extended=True):
+        self.extended = extended
+        self.version = ds.dataset_version(extended)
+        self._table_name = 'extended' if extended else 'kaggle'
+        self._derived_features = _extended_derived_features \
+            if extended else _kaggle_derived_features
+        self._categorical_value_functions = _extended_categorical_values \
+            if extended else _kaggle_categorical_values
+        self._raw_columns = {}
+        self._categorical_values = {}
+        self._features = {}
+        self._labels = None
+        self._gazetteer = None
+        self._relationship_graph = None
+        self._groups = None
+        self._relationship_features = None
+        # Set a profiling.Profiler to profile the loads and the features.
+        self.profiler = None
+
+    def raw_columns(self, attribute_names):
+        """Returns the (X_train, X_test) frames of the given raw columns."""
+        missing_names = [attribute_name
+                         for attribute_name in attribute_names
+                         if attribute_name not in self._raw_columns]
+        if missing_names:
+            with profiling.stage(self.profiler,
+                                 '{} load'.format(self._table_name)) \
+                    as stage:
+                X_train, self._labels = ds.load_training_set(
+                    self.extended, columns=missing_names)
+                X_test = ds.load_test_set(self.extended, columns=missing_names)
+                stage.set_output((X_train, X_test))
+            for attribute_name in missing_names:
+                self._raw_columns[attribute_name] = X_train[attribute_name], \
+                    X_test[attribute_name]
+        return self._frames(self._raw_columns, attribute_names)
+
+    def load_raw_columns(self, feature_names):
+        """Loads the raw columns read by the given features, all in a
+        single read of each table.
+        """
+        raw_column_names = []
+        for feature_name in feature_names:
+            compute = self._derived_features.get(feature_name)
+            if compute is None:
+                raw_column_names.append(feature_name)
+                continue
+            # Encoded features read the columns of their values.
+            for function in (compute,
+                             self._categorical_value_functions.get(
+                                 feature_name)):
+                raw_column_names.extend(
+                    getattr(function, 'raw_column_names', []))
+        self.raw_columns(list(dict.fromkeys(raw_column_names)))
+
+    def labels(self):
+        if self._labels is None:
+            _, self._labels = ds.load_training_set(self.extended, columns=[])
+        return self._labels
+
+    def gazetteer(self):
+        """Returns the index of the places named in the location columns of
+        both sets.
+        """
+        if self._gazetteer is None:
+            with profiling.stage(self.profiler,
+                                 '{} gazetteer'.format(self._table_name)):
+                self._gazetteer = gz.Gazetteer.build([
+                    X[field_name]
+                    for X in self.raw_columns(_location_fields)
+                    for field_name in _location_fields
+                ])
+        return self._gazetteer
+
+    def relationship_graph(self):
+        """Returns the graph of the relationships between the passengers,
+        whose rows are the ones of the training set then of the test set.
+        """
+        if self._relationship_graph is None:
+            with profiling.stage(self.profiler,
+                                 '{} graph'.format(self._table_name)):
+                X_train, X_test = self.raw_columns(['UrlId'])
+                # The ids of the two sets overlap.
+                self._relationship_graph = rg.RelationshipGraph.build(
+                    pd.concat([X_train['UrlId'], X_test['UrlId']],
+                              ignore_index=True))
+        return self._relationship_graph
+
+    def groups(self):
+        """Returns the (train, test) frames of the groups of the passengers,
+        found among the passengers of both sets, see `groups.find_groups`.
+        """
+        if self._groups is None:
+            with profiling.stage(self.profiler,
+                                 '{} groups'.format(self._table_name)):
+                X_train, X_test = self.raw_columns(_group_fields)
+                # The ids of the two sets overlap.
+                groups_df = groups.find_groups(
+                    pd.concat([X_train, X_test], ignore_index=True),
+                    self.relationship_graph())
+                self._groups = \
+                    groups_df.iloc[:len(X_train)].set_index(X_train.index), \
+                    groups_df.iloc[len(X_train):].set_index(X_test.index)
+        return self._groups
+
+    def relationship_features(self):
+        """Returns the (train, test) frames of the features derived from the
+        relationships between the passengers of both sets, see
+        `relationship_features`.
+        """
+        if self._relationship_features is None:
+            with profiling.stage(self.profiler,
+                                 '{} relationships'.format(self._table_name)):
+                X_train, X_test = self.raw_columns(['UrlId'])
+                features_df = rf.build_features(
+                    np.concatenate([X_train['UrlId'].values,
+                                    X_test['UrlId'].values]))
+                self._relationship_features = \
+                    features_df.iloc[:len(X_train)].set_index(X_train.index), \
+                    features_df.iloc[len(X_train):].set_index(X_test.index)
+        return self._relationship_features
+
+    def categorical_values(self, feature_name):
+        """Returns the (train, test) series of the values of a categorical
+        feature, before they are encoded.
+        """
+        if feature_name not in self._categorical_values:
+            with profiling.stage(self.profiler,
+                                 '{} values {}'.format(self._table_name,
+                                                       feature_name)) \
+                    as stage:
+                compute = self._categorical_value_functions[feature_name]
+                self._categorical_values[feature_name] = compute(self)
+                stage.set_output(self._categorical_values[feature_name])
+        return self._categorical_values[feature_name]
+
+    def feature(self, feature_name):
+        """Returns the (train, test) series of a feature."""
+        if feature_name not in self._features:
+            compute = self._derived_features.get(feature_name)
+            if compute is None:
+                X_train, X_test = self.raw_columns([feature_name])
+                self._features[feature_name] = X_train[feature_name], \
+                    X_test[feature_name]
+            else:
+                with profiling.stage(self.profiler,
+                                     '{} feature {}'.format(self._table_name,
+                                                            feature_name)) \
+                        as stage:
+                    self._features[feature_name] = compute(self)
+                    stage.set_output(self._features[feature_name])
+        return self._features[feature_name]
+
+    def view(self, feature_names):
+        """Returns the (X_train, y_train, X_test) frames of the given
+        features, in the given order.
+        """
+        self.load_raw_columns(feature_names)
+        for feature_name in feature_names:
+            self.feature(feature_name)
+        X_train, X_test = self._frames(self._features, feature_names)
+        return X_train, self.labels(), X_test
+
+    def one_hot_view(self, feature_names, min_frequency=1, scale=False):
+        """Returns the (X_train, y_train, X_test) of the given features, with
+        the categorical ones one-hot encoded, as scipy.sparse CSR matrices.
+        Categories seen less than `min_frequency` times in the training set
+        share a single column. The other features are scaled to [-1, 1] on
+        the training set if `scale`. The test ids are returned last, as the
+        rows of X_test are not labeled.
+        """
+        self.load_raw_columns(feature_names)
+        categorical_names = [
+            feature_name
+            for feature_name in feature_names
+            if feature_name in self._categorical_value_functions
+        ]
+        columns = {
+            feature_name: self.categorical_values(feature_name)
+            if feature_name in categorical_names
+            else self.feature(feature_name)
+            for feature_name in feature_names
+        }
+        X_train, X_test = self._frames(columns, feature_names)
+
+        encoder = tr.SparseOneHotEncoder(categorical_names,
+                                         min_frequency=min_frequency,
+                                         scale=scale)
+        encoder.fit(X_train)
+        return encoder.transform(X_train), self.labels(), \
+            encoder.transform(X_test), X_test.index
+
+    @staticmethod
+    def _frames(columns, attribute_names):
+        return tuple(pd.concat([columns[attribute_name][i]
+                                for attribute_name in attribute_names],
+                               axis=1)
+                     for i in range(2))
+
+
+_stores = {}
+
+
+def get_feature_store(extended=True):
+    """Returns the feature store of the current dataset version, shared by
+    all the models of the process.
+    """
+    store = _stores.get(extended)
+    if store is None or store.version != ds.dataset_version(extended):
+        store = _stores[extended] = FeatureStore(extended)
+    return store
+
+
+def load_features(model_name, profiler=None):
+    """Returns the (X_train, y_train, X_test) frames of a model. The
+    features computed meanwhile are profiled by `profiler`, if given.
+    """
+    extended, feature_names = MODEL_FEATURES[model_name]
+    store = get_feature_store(extended)
+    store.profiler = profiler
+    try:
+        return store.view(feature_names)
+    finally:
+        store.profiler = None
+
+
+def fold_group_statistics(X_train, y_train, folds):
+    """Returns the transformers.FoldGroupStatistics of the
+    `GROUP_KEY_FEATURES` of the passengers of `X_train`, part of the extended
+    training set, in the given `folds`.
+    """
+    graph = get_feature_store(True).relationship_graph()
+    return tr.FoldGroupStatistics(
+        X_train,
+        y_train,
+        GROUP_KEY_FEATURES,
+        folds,
+        memberships={'UrlId': rf.neighbourhoods(graph, X_train['UrlId'])})
+
+
+def load_one_hot_features(model_name, min_frequency=1, scale=False,
+                          profiler=None):
+    """Returns the (X_train, y_train, X_test, test_ids) of a model, with the
+    categorical features one-hot encoded in sparse matrices. See
+    FeatureStore.one_hot_view.
+    """
+    extended, feature_names = MODEL_FEATURES[model_name]
+    store = get_feature_store(extended)
+    store.profiler = profiler
+    try:
+        return store.one_hot_view(feature_names,
+                                  min_frequency=min_frequency,
+                                  scale=scale)
+    finally:
+        store.profiler = None
+
+
+def main():
+    # Profiles the features of all the models: shared features are only
+    # computed, hence profiled, once.
+    profiler = profiling.Profiler()
+    for model_name in MODEL_FEATURES:
+        load_features(model_name, profiler=profiler)
+    profiler.print_report()
+    profiler.write_json('features_profile.json')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,235 @@
+"""Index of the places named in the location columns (BirthPlace, Residence,
+Destination), resolving each location string to canonical city, region and
+country ids.
+
+The locations are written "City, Region, Country", "City, Country" or
+"Country", sometimes after a street address on a line of its own, and with
+alternative names in brackets: "Åbo (Turku), Finland". The index is compiled
+from all the distinct location strings together, over normalized tokens
+(case, accents, dots and spaces do not matter). This way:
+  - "England, UK" and "England" are the same country;
+  - "London, England" gets the region most often seen for London, England;
+  - "Turku, Finland" is the same city as "Åbo (Turku), Finland".
+
+Example:
+    gazetteer = Gazetteer.build([df['BirthPlace'], df['Residence']])
+    locations_df = gazetteer.resolve(df['BirthPlace'])
+"""
+
+import collections
+import re
+import unicodedata
+
+import numpy as np
+import pandas as pd
+
+import preprocessing as pp
+
+LEVELS = ['Country', 'City', 'Region']
+
+# Other names of the countries, normalized. None stands for the United
+# Kingdom, only kept if no constituent country precedes it.
+_country_aliases = {
+    'america': 'United States',
+    'u s a': 'United States',
+    'united states of america': 'United States',
+    'us': 'United States',
+    'usa': 'United States',
+    'gb': None,
+    'great britain': None,
+    'u k': None,
+    'uk': None,
+    'united kingdom': None,
+}
+_united_kingdom = 'United Kingdom'
+# The constituent countries of the United Kingdom, normalized. All of Ireland
+# was part of it in 1912.
+_uk_countries = {'england', 'ireland', 'northern ireland', 'scotland',
+                 'wales'}
+
+_bracketed_pattern = re.compile(r'[(\[]([^)\]]*)[)\]]')
+
+
+def normalize(name):
+    """Returns the key of a place name: lower case, without accents, dots
+    and repeated spaces.
+    """
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(char for char in name if not unicodedata.combining(char))
+    name = name.casefold().replace('.', ' ')
+    return ' '.join(name.split())
+
+
+def _split_names(location):
+    """Returns the (name, alternative names) of the comma-separated parts of
+    a location, from the most to the least specific.
+    """
+    # Street addresses are on a line of their own, before the place.
+    location = location.splitlines()[-1] if location.strip() else ''
+    parts = []
+    for part in location.split(','):
+        alternative_names = [alternative_name.strip()
+                             for alternative_name
+                             in _bracketed_pattern.findall(part)]
+        name = ' '.join(_bracketed_pattern.sub(' ', part).split())
+        if name:
+            parts.append((name, alternative_names))
+    return parts
+
+
+def _parse(location):
+    """Returns the (city, region, country) parts of a location, each as a
+    (name, alternative names) pair, or None.
+    """
+    parts = _split_names(location)
+    country = None
+    if parts and normalize(parts[-1][0]) in _country_aliases:
+        alias = _country_aliases[normalize(parts[-1][0])]
+        parts = parts[:-1]
+        if alias is not None:
+            country = (alias, [])
+        elif not parts or normalize(parts[-1][0]) not in _uk_countries:
+            country = (_united_kingdom, [])
+    if country is None and len(parts) > 1:
+        country = parts.pop()
+    if not parts:
+        return None, None, country
+    if len(parts) == 1:
+        return parts[0], None, country
+    return parts[0], parts[-1], country
+
+
+class Gazetteer:
+
+    def __init__(self):
+        # The names of the places of each level, by id.
+        self.names = {level: [] for level in LEVELS}
+        self._ids = {level: {} for level in LEVELS}
+        self._spellings = {level: [] for level in LEVELS}
+        # The region ids seen with each city id.
+        self._city_regions = collections.defaultdict(collections.Counter)
+        self._resolved = {}
+
+    def _place_id(self, level, key, name):
+        place_id = self._ids[level].get(key)
+        if place_id is None:
+            place_id = self._ids[level][key] = len(self.names[level])
+            self.names[level].append(name)
+            self._spellings[level].append(collections.Counter())
+        self._spellings[level][place_id][name] += 1
+        return place_id
+
+    def _lookup(self, level, key):
+        return self._ids[level].get(key)
+
+    def _places(self, location):
+        """Returns the (city, region, country) parts of a location, with
+        single names of known countries taken as countries.
+        """
+        city, region, country = _parse(location)
+        if country is None and city is not None and region is None \
+                and self._lookup('Country', normalize(city[0])) is not None:
+            city, country = None, city
+        return city, region, country
+
+    def _city_id(self, country_key, city):
+        # A city is known by any of its names.
+        for name in [city[0]] + city[1]:
+            city_id = self._lookup('City', (country_key, normalize(name)))
+            if city_id is not None:
+                return city_id
+        return None
+
+    def _add(self, location):
+        city, region, country = self._places(location)
+        country_key = normalize(country[0]) if country else None
+        if country is not None:
+            self._place_id('Country', country_key, country[0])
+
+        region_id = None
+        if region is not None:
+            region_id = self._place_id(
+                'Region', (country_key, normalize(region[0])), region[0])
+
+        if city is not None:
+            city_id = self._city_id(country_key, city)
+            if city_id is None:
+                city_id = self._place_id(
+                    'City', (country_key, normalize(city[0])), city[0])
+            else:
+                self._spellings['City'][city_id][city[0]] += 1
+            for name in city[1]:
+                self._ids['City'].setdefault((country_key, normalize(name)),
+                                             city_id)
+            if region_id is not None:
+                self._city_regions[city_id][region_id] += 1
+
+    @classmethod
+    def build(cls, location_columns):
+        """Compiles the index of the places named in the `location_columns`
+        Series.
+        """
+        gazetteer = cls()
+        locations = pd.unique(pd.concat(location_columns).dropna())
+        # The most detailed locations first: they tell which names are
+        # countries and which regions the cities are in.
+        locations = sorted(locations,
+                           key=lambda location: -len(_split_names(location)))
+        for location in locations:
+            gazetteer._add(location)
+
+        # Each place is named after its most common spelling.
+        for level in LEVELS:
+            gazetteer.names[level] = [
+                spellings.most_common(1)[0][0]
+                for spellings in gazetteer._spellings[level]
+            ]
+        return gazetteer
+
+    def _resolve_one(self, location):
+        """Returns the (country, city, region) ids of a location, None for
+        the unknown parts.
+        """
+        city, region, country = self._places(location)
+        country_key = normalize(country[0]) if country else None
+        country_id = None if country is None \
+            else self._lookup('Country', country_key)
+        city_id = None if city is None else self._city_id(country_key, city)
+
+        if region is not None:
+            region_id = self._lookup('Region',
+                                     (country_key, normalize(region[0])))
+        elif city_id is not None and self._city_regions[city_id]:
+            # The region most often seen with the city.
+            region_id = self._city_regions[city_id].most_common(1)[0][0]
+        else:
+            region_id = None
+        return country_id, city_id, region_id
+
+    def resolve_ids(self, locations):
+        """Returns the Country, City and Region ids of the `locations`
+        Series, -1 where unknown. Each distinct location is only resolved
+        once.
+        """
+        def resolve_unique(unique_locations):
+            for location in unique_locations:
+                if location not in self._resolved:
+                    self._resolved[location] = self._resolve_one(location)
+            return pd.DataFrame([self._resolved[location]
+                                 for location in unique_locations],
+                                columns=LEVELS,
+                                index=unique_locations.index)
+
+        ids_df = pp.transform_unique_values(locations, resolve_unique)
+        return ids_df.fillna(-1).astype(np.int32)
+
+    def resolve(self, locations):
+        """Returns the canonical Country, City and Region names of the
+        `locations` Series, None where unknown.
+        """
+        ids_df = self.resolve_ids(locations)
+        return pd.DataFrame({
+            level: np.append(np.array(self.names[level], dtype=object),
+                             None)[ids_df[level].values]
+            for level in LEVELS
+        }, index=locations.index)
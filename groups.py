@@ -0,0 +1,108 @@
+"""Families and travel groups of the passengers: the connected components of
+the graph linking the passengers related to each other (see
+data.integration.relationships.graph), holding the same ticket number or
+sharing a cabin.
+
+The components are found by a union-find over all the edges at once. Each
+round hooks the root of every edge between two components to the smallest
+root it is linked to, then points every passenger to its root again by
+pointer jumping. Each round only takes a few numpy operations over the edges
+still between two components, and few rounds are needed.
+
+Example:
+    groups_df = groups.find_groups(df)
+"""
+
+import numpy as np
+import pandas as pd
+
+import data.integration.relationships.graph as rg
+
+# Passengers younger than this are children.
+_child_max_age = 14
+
+GROUP_FEATURES = [
+    'GroupSize',
+    'GroupNumFemales',
+    'GroupNumMales',
+    'GroupNumChildren',
+]
+
+
+def _point_to_roots(parents):
+    while True:
+        grand_parents = parents[parents]
+        if np.array_equal(grand_parents, parents):
+            return parents
+        parents = grand_parents
+
+
+def union_find(num_nodes, nodes, other_nodes):
+    """Returns the root of the component of each of the `num_nodes` nodes,
+    linked by the edges (`nodes`, `other_nodes`). The root of a component
+    is its smallest node.
+    """
+    parents = np.arange(num_nodes)
+    while True:
+        roots = parents[nodes]
+        other_roots = parents[other_nodes]
+        is_between = roots != other_roots
+        if not is_between.any():
+            return parents
+
+        # Edges within a component are done with.
+        nodes, other_nodes = nodes[is_between], other_nodes[is_between]
+        roots, other_roots = roots[is_between], other_roots[is_between]
+        np.minimum.at(parents,
+                      np.maximum(roots, other_roots),
+                      np.minimum(roots, other_roots))
+        parents = _point_to_roots(parents)
+
+
+def _shared_value_edges(values):
+    """Returns the edges linking each row of the `values` Series, indexed by
+    row, to the first row holding the same value.
+    """
+    codes, _ = pd.factorize(values)
+    rows = values.index.values[codes >= 0]
+    codes = codes[codes >= 0]
+    _, first_positions = np.unique(codes, return_index=True)
+    return rows, rows[first_positions][codes]
+
+
+def find_groups(df, relationship_graph=None):
+    """Returns the group of each passenger of `df`, holding the UrlId,
+    TicketNumber, Cabin, Sex and Age columns: its GroupId, and the size and
+    composition of the group (see `GROUP_FEATURES`).
+
+    The relationships are the ones of `relationship_graph`, whose rows are
+    the ones of `df`, built from relationships_data.json if not given.
+    """
+    if relationship_graph is None:
+        relationship_graph = rg.RelationshipGraph.build(df['UrlId'])
+    relationships = relationship_graph.matrix.tocoo()
+
+    # Passengers may share more cabins: "C23 C25 C27".
+    cabins = pd.Series(df['Cabin'].values).str.split().explode()
+    edges = [
+        (relationships.row, relationships.col),
+        _shared_value_edges(pd.Series(df['TicketNumber'].values)),
+        _shared_value_edges(cabins),
+    ]
+    roots = union_find(len(df),
+                       np.concatenate([nodes for nodes, _ in edges]),
+                       np.concatenate([nodes for _, nodes in edges]))
+    group_ids, _ = pd.factorize(roots)
+
+    def group_counts(is_member):
+        counts = np.bincount(group_ids, weights=is_member)
+        return counts[group_ids].astype(int)
+
+    return pd.DataFrame({
+        'GroupId': group_ids,
+        'GroupSize': group_counts(np.ones(len(df))),
+        'GroupNumFemales': group_counts((df['Sex'] == 'female').values),
+        'GroupNumMales': group_counts((df['Sex'] == 'male').values),
+        'GroupNumChildren': group_counts(
+            (df['Age'] < _child_max_age).values),
+    }, index=df.index)
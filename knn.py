@@ -1,167 +1,31 @@
+import pandas as pd
 from sklearn.model_selection import GridSearchCV
 from sklearn.model_selection import train_test_split
 from sklearn.neighbors import KNeighborsClassifier
 
 import dataset as ds
-import preprocessing as pp
+import features as fs
 import submission as sm
 
-'''
-Just a copy of all the attributes.
+# Rarer categories share a single one-hot column.
+_min_category_frequency = 5
 
-attributes = [
-    'Age',
-    'BirthDate',
-    'BirthPlace',
-    'Cabin',
-    'Destination',
-    'Embarked',
-    'FirstName',
-    'Job',
-    'LastName',
-    'MaritalStatus',
-    'Nationality',
-    'Pclass',
-    'Residence',
-    'Sex',
-    'Ticket',
-    'Title',
-    'UrlId',
-    'TicketPrice',
-    'TicketNumber',
-    'BirthPlaceCountry',
-    'BirthPlaceCity',
-    'BirthPlaceRegion',
-    'ResidenceCountry',
-    'ResidenceCity',
-    'ResidenceRegion',
-    'DestinationCountry',
-    'DestinationCity',
-    'DestinationRegion',
-    'CabinDeck',
-    'AgeInDays',
-    'KPassengerId',
-    'SibSp',
-    'Parch',
-    'Split',
-    'NumChild',
-    'NumEmployee',
-    'NumEmployer',
-    'NumFriend',
-    'NumKnows',
-    'NumParent',
-    'NumRelative',
-    'NumSibling',
-    'NumSpouse',
-]
-'''
 
-
-def preprocess_dataset(df):
-    keep_attributes = [
-        # 'Age',
-        # 'BirthDate',
-        # 'BirthPlace',
-        # 'Cabin',
-        # 'Destination',
-        'Embarked',
-        # 'FirstName',
-        'Job',
-        # 'LastName',
-        'MaritalStatus',
-        'Nationality',
-        'Pclass',
-        # 'Residence',
-        'Sex',
-        # 'Ticket',
-        'Title',
-        # 'UrlId',
-        'TicketPrice',
-        'TicketNumber',
-        'BirthPlaceCountry',
-        # 'BirthPlaceCity',
-        # 'BirthPlaceRegion',
-        'ResidenceCountry',
-        # 'ResidenceCity',
-        # 'ResidenceRegion',
-        'DestinationCountry',
-        # 'DestinationCity',
-        # 'DestinationRegion',
-        'CabinDeck',
-        'AgeInDays',
-        # 'KPassengerId',
-        # 'SibSp',
-        # 'Parch',
-        # 'Split',
-        'NumChild',
-        'NumEmployee',
-        'NumEmployer',
-        'NumFriend',
-        'NumKnows',
-        'NumParent',
-        'NumRelative',
-        'NumSibling',
-        'NumSpouse',
-    ]
-    drop_attributes = set(df.columns) - set(keep_attributes)
-    df = df.drop(columns=drop_attributes)
-
-    # Missing tickets belong to crew member.
-    df['TicketNumber'] = df['TicketNumber'].fillna(-1)
-
-    # Use the median to replace missing ages.
-    no_age_df = df.loc[df['AgeInDays'].isna()]
-    for psgr_id, no_age_row in no_age_df.iterrows():
-        pclass, gender, embarked = no_age_row[['Pclass', 'Sex', 'Embarked']]
-        inferred_age = df.loc[(df['Pclass'] == pclass)
-                              & (df['Sex'] == gender)
-                              & (df['Embarked'] == embarked)
-                              & (~df['AgeInDays'].isna())]['AgeInDays'].median()
-        df.loc[psgr_id, 'AgeInDays'] = inferred_age
-
-    attributes_to_categorical = [
-        'Embarked',
-        'Job',
-        'MaritalStatus',
-        'Nationality',
-        'Pclass',
-        'Sex',
-        'Title',
-        # 'TicketPrice',
-        # 'TicketNumber',
-        'BirthPlaceCountry',
-        'ResidenceCountry',
-        'DestinationCountry',
-        'CabinDeck',
-        # 'AgeInDays',
-        # 'NumChild',
-        # 'NumEmployee',
-        # 'NumEmployer',
-        # 'NumFriend',
-        # 'NumKnows',
-        # 'NumParent',
-        # 'NumRelative',
-        # 'NumSibling',
-        # 'NumSpouse',
-    ]
-    df[attributes_to_categorical] = \
-        df[attributes_to_categorical].fillna('Unknown')
-    for attribute_name in attributes_to_categorical:
-        df = pp.convert_attribute_to_categorical(df, attribute_name)
-
-    df = pp.convert_categorical_columns_to_numerical(df)
-
-    return df
+def load_features():
+    """Returns the (X_train, y_train, X_test, test_ids) of the model."""
+    # Sparse one-hot encoding: integer codes would impose a fake ordering
+    # of the categories on the distances. The numerical features are scaled
+    # to the range of the one-hot ones, or the largest ones (e.g. the ticket
+    # numbers) would make up the whole distance.
+    return fs.load_one_hot_features('knn',
+                                    min_frequency=_min_category_frequency,
+                                    scale=True)
 
 
 def main():
     print('Nearest Neighbours')
 
-    X_dataset, y_dataset = ds.load_training_set()
-    X_testset = ds.load_test_set()
-
-    X_dataset = preprocess_dataset(X_dataset)
-    X_testset = preprocess_dataset(X_testset)
+    X_dataset, y_dataset, X_testset, test_ids = load_features()
 
     X_train, X_val, y_train, y_val = train_test_split(X_dataset,
                                                       y_dataset,
@@ -171,7 +35,8 @@ def main():
     parameters = {
         'n_neighbors': range(3, 31, 3),
         'weights': ('uniform', 'distance'),
-        'algorithm': ('auto', 'ball_tree', 'kd_tree'),
+        # Tree-based searches do not support sparse inputs.
+        'algorithm': ('brute',),
     }
     estimator = KNeighborsClassifier()
     clf = GridSearchCV(estimator=estimator,
@@ -192,7 +57,8 @@ def main():
     print('Testset: {}/{} survived'.format(sum(test_predictions),
                                            len(test_predictions)))
 
-    X_testset[ds.LABEL_COLUMN_NAME] = test_predictions
+    X_testset = pd.DataFrame({ds.LABEL_COLUMN_NAME: test_predictions},
+                             index=test_ids)
     X_testset[ds.LABEL_COLUMN_NAME] = X_testset[ds.LABEL_COLUMN_NAME].astype(int)
     sm.output_submission_file(X_testset, notes='knn')
 
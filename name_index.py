@@ -0,0 +1,178 @@
+"""Index of names, returning the indexed names most similar to any other
+name: the same people are spelled differently across sources, "Katherine"
+and "Catherine", "Houssein" and "Husayn", "Vander Planke" and
+"Vanderplancke".
+
+The similarity of two names averages the cosine similarity of their
+character n-grams and whether they sound alike, as told by their phonetic
+key. Only the distinct names are indexed, by their rarer 3-grams and by
+their keys: looking a name up only visits the few names sharing one of them.
+
+Example:
+    index = NameIndex.build(extra_df['FirstName'])
+    candidates_df = index.candidates(kaggle_df['FirstName'], k=5)
+"""
+
+import numpy as np
+import pandas as pd
+from sklearn.feature_extraction.text import HashingVectorizer
+
+import gazetteer as gz
+
+# The phonetic code of each letter. Vowels only separate the consonants, so
+# that the same code repeated is only kept if a vowel is in between.
+_phonetic_codes = {
+    letter: str(code)
+    for code, letters in enumerate(['aehiouwy',
+                                    'bfpv',
+                                    'cgjkqsxz',
+                                    'dt',
+                                    'l',
+                                    'mn',
+                                    'r'])
+    for letter in letters
+}
+
+_vectorizer = HashingVectorizer(analyzer='char_wb',
+                                ngram_range=(2, 3),
+                                lowercase=False,
+                                alternate_sign=False,
+                                norm='l2',
+                                n_features=2 ** 18)
+
+# The candidates of a name share a 3-gram with it, only counting the 3-grams
+# of at most this fraction of the indexed names: the common ones ("ine",
+# "son") would make most names candidates.
+_block_vectorizer = HashingVectorizer(analyzer='char_wb',
+                                      ngram_range=(3, 3),
+                                      lowercase=False,
+                                      alternate_sign=False,
+                                      norm=None,
+                                      binary=True,
+                                      n_features=2 ** 18)
+_max_block_frequency = 0.01
+
+
+def phonetic_key(name):
+    """Returns the consonant sounds of a name, the same for "Katherine" and
+    "Catherine" or "Bess" and "Bessie". Spaces do not matter.
+    """
+    codes = [_phonetic_codes[char]
+             for char in gz.normalize(name)
+             if char in _phonetic_codes]
+    key = ''.join(code
+                  for code, previous_code in zip(codes, [None] + codes)
+                  if code != previous_code)
+    return key.replace('0', '')
+
+
+def _vectorize(names, vectorizer=_vectorizer):
+    """Returns the n-gram vectors of the names, one row each: by default,
+    their l2-normalized n-gram counts.
+    """
+    return vectorizer.transform(
+        [gz.normalize(name).replace(' ', '') for name in names])
+
+
+def _phonetic_keys(names):
+    return np.array([phonetic_key(name) for name in names], dtype=object)
+
+
+def _similarities(vectors, keys, other_vectors, other_keys):
+    """Returns the similarity of the names of each row of the two sets."""
+    cosines = np.asarray(vectors.multiply(other_vectors).sum(axis=1)).ravel()
+    sound_alike = keys == other_keys
+    return (cosines + sound_alike) / 2
+
+
+def similarity(names, other_names, rows=None, other_rows=None):
+    """Returns the similarity, from 0 to 1, of the names of `names` and
+    `other_names`, two Series of the same length, NaN where any is missing.
+
+    If given, the names at the positions `rows` of `names` are compared to
+    the ones at `other_rows` of `other_names` instead: the same name is then
+    only spelled out once. Each distinct pair is only compared once.
+    """
+    codes, uniques = pd.factorize(names)
+    other_codes, other_uniques = pd.factorize(other_names)
+    if rows is not None:
+        codes = codes[rows]
+        other_codes = other_codes[other_rows]
+    is_valid = (codes >= 0) & (other_codes >= 0)
+
+    pairs, pair_codes = pd.factorize(
+        codes[is_valid].astype(np.int64) * len(other_uniques)
+        + other_codes[is_valid])
+    unique_rows, unique_other_rows = np.divmod(pair_codes, len(other_uniques))
+    pair_similarities = _similarities(
+        _vectorize(uniques[unique_rows]),
+        _phonetic_keys(uniques)[unique_rows],
+        _vectorize(other_uniques[unique_other_rows]),
+        _phonetic_keys(other_uniques)[unique_other_rows])
+
+    similarities = np.full(len(codes), np.nan)
+    similarities[is_valid] = pair_similarities[pairs]
+    return similarities
+
+
+class NameIndex:
+
+    def __init__(self, names):
+        # The distinct names of the index.
+        self.names = np.asarray(names, dtype=object)
+        self._vectors = _vectorize(self.names)
+        self._keys = _phonetic_keys(self.names)
+
+        blocks = _vectorize(self.names, _block_vectorizer).tocsc()
+        num_names = np.diff(blocks.indptr)
+        self._blocks = np.flatnonzero(
+            (num_names > 0)
+            & (num_names <= max(1, _max_block_frequency * len(self.names))))
+        self._names_by_block = blocks[:, self._blocks].T.tocsr()
+        self._rows_by_key = pd.DataFrame({'Key': self._keys,
+                                          'Row': np.arange(len(self.names))})
+
+    @classmethod
+    def build(cls, names):
+        """Indexes the distinct names of the `names` Series."""
+        return cls(pd.unique(names.dropna()))
+
+    def candidates(self, names, k=5):
+        """Returns the (Name, Candidate, Similarity) of the `k` indexed names
+        most similar to each distinct name of the `names` Series, sharing at
+        least a rare 3-gram or the phonetic key with it. The best candidates
+        come first.
+        """
+        queries = pd.unique(names.dropna())
+        vectors = _vectorize(queries)
+        keys = _phonetic_keys(queries)
+
+        query_blocks = _vectorize(queries, _block_vectorizer)[:, self._blocks]
+        shared_ngrams = (query_blocks @ self._names_by_block).tocoo()
+        shared_keys = pd.DataFrame({'Key': keys,
+                                    'QueryRow': np.arange(len(queries))}) \
+            .query('Key != ""') \
+            .merge(self._rows_by_key, on='Key')
+        pairs_df = pd.concat([
+            pd.DataFrame({'QueryRow': shared_ngrams.row,
+                          'Row': shared_ngrams.col}),
+            shared_keys[['QueryRow', 'Row']],
+        ]).drop_duplicates()
+
+        query_rows = pairs_df['QueryRow'].values
+        rows = pairs_df['Row'].values
+        pairs_df['Similarity'] = _similarities(vectors[query_rows],
+                                               keys[query_rows],
+                                               self._vectors[rows],
+                                               self._keys[rows])
+        pairs_df = pairs_df \
+            .sort_values(['QueryRow', 'Similarity'],
+                         ascending=[True, False],
+                         kind='stable') \
+            .groupby('QueryRow') \
+            .head(k)
+        return pd.DataFrame({
+            'Name': queries[pairs_df['QueryRow'].values],
+            'Candidate': self.names[pairs_df['Row'].values],
+            'Similarity': pairs_df['Similarity'].values,
+        })
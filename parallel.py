@@ -0,0 +1,148 @@
+"""Runs row-local preprocessing steps on shards of a DataFrame, in a pool of
+worker processes.
+
+A step is row-local if the output rows only depend on the corresponding input
+rows: running it on contiguous row ranges and concatenating the results gives
+the same frame as running it on the whole table. Steps needing statistics of
+the whole table must instead return per-shard summaries, reduced by the
+caller.
+
+The categories of a categorical output may depend on the whole column, e.g.
+when they are sorted or in order of appearance: the step declares their order
+with `categorical_outputs`, and the column is only categorized after the
+shards are merged.
+
+The workers are forked: they read the input frame from the memory of the
+parent process, copy-on-write, and only the row range of each shard is sent
+to them. Most columns hold Python strings, which could not be placed in a
+shared memory buffer anyway.
+"""
+
+import multiprocessing
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Set by the parent right before forking the workers, which inherit it.
+_shared_job = None
+
+# Orders of the categories of a categorical output.
+SORTED = 'sorted'
+APPEARANCE = 'appearance'
+
+
+def categorical_outputs(**category_orders):
+    """Decorator declaring the categorical columns output by a step, with the
+    order of their categories: SORTED, as pd.Categorical sorts them,
+    APPEARANCE, or the list of the categories.
+    """
+    def decorator(step):
+        step.category_orders = category_orders
+        return step
+    return decorator
+
+
+def _process_row_range(row_range):
+    df, steps, summarize = _shared_job
+    start, stop = row_range
+    input_df = df.iloc[start:stop]
+    shard_df = input_df.copy()
+    for step in steps:
+        shard_df = step(shard_df)
+    summary = summarize(shard_df) if summarize is not None else None
+
+    # Only the columns the steps added or changed are sent back: the parent
+    # already has all the others.
+    changed_columns = [col_name
+                       for col_name in shard_df.columns
+                       if col_name not in input_df.columns
+                       or not shard_df[col_name].equals(input_df[col_name])]
+    return shard_df[changed_columns], list(shard_df.columns), summary
+
+
+def _row_ranges(num_rows, num_shards):
+    bounds = np.linspace(0, num_rows, num_shards + 1).astype(int)
+    return [(start, stop)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+            if stop > start]
+
+
+def _concat_shards(col_name, columns, category_order=None):
+    """Returns the values of the shards of a column, concatenated."""
+    if category_order is None:
+        if not all(isinstance(column.dtype, pd.CategoricalDtype)
+                   for column in columns):
+            return pd.concat(columns).values
+        # The categories of the whole column cannot be told from those of the
+        # shards, unless they are the same in all of them.
+        if any(not column.cat.categories.equals(columns[0].cat.categories)
+               for column in columns):
+            raise ValueError('The shards of the categorical column {!r} have '
+                             'different categories: declare their order '
+                             'with categorical_outputs'.format(col_name))
+        return union_categoricals(columns)
+
+    # A declared categorical is categorized once, on the whole column.
+    values = pd.concat([column.astype(object) for column in columns]).values
+    if category_order == SORTED:
+        return pd.Categorical(values)
+    if category_order == APPEARANCE:
+        return pd.Categorical(values,
+                              categories=pd.unique(values[pd.notna(values)]))
+    return pd.Categorical(values, categories=category_order)
+
+
+def apply_steps(df, steps, num_workers=None, summarize=None):
+    """Applies the row-local `steps` functions to `df`, one shard of rows per
+    worker.
+
+    If given, `summarize` is called on each processed shard. Returns the
+    processed frame and the list of the shard summaries, in row order.
+    Without the fork start method (e.g. on Windows) the shards are processed
+    one after the other in this process.
+    """
+    global _shared_job
+
+    num_workers = num_workers or os.cpu_count()
+    # An empty frame still goes through the steps, as a single shard.
+    row_ranges = _row_ranges(len(df), num_workers) or [(0, 0)]
+
+    _shared_job = (df, steps, summarize)
+    try:
+        if len(row_ranges) > 1 \
+                and 'fork' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('fork')
+            with context.Pool(len(row_ranges)) as pool:
+                results = pool.map(_process_row_range, row_ranges)
+        else:
+            results = [_process_row_range(row_range)
+                       for row_range in row_ranges]
+    finally:
+        _shared_job = None
+
+    changed_dfs, output_columns, summaries = zip(*results)
+
+    category_orders = {}
+    for step in steps:
+        category_orders.update(getattr(step, 'category_orders', {}))
+
+    # A column changed in some shards only keeps its input values in the
+    # others.
+    changed_columns = list(dict.fromkeys(
+        col_name for changed_df in changed_dfs for col_name in changed_df))
+    output_df = df[[col_name
+                    for col_name in output_columns[0]
+                    if col_name not in changed_columns]]
+    output_df = output_df.assign(**{
+        col_name: _concat_shards(
+            col_name,
+            [changed_df[col_name]
+             if col_name in changed_df.columns
+             else df[col_name].iloc[start:stop]
+             for changed_df, (start, stop) in zip(changed_dfs, row_ranges)],
+            category_orders.get(col_name))
+        for col_name in changed_columns
+    })
+    return output_df[output_columns[0]], list(summaries)
@@ -0,0 +1,118 @@
+"""Manual fixes to the data, kept as patch tables.
+
+A patch table is a json file holding a list of commented patch groups:
+
+    [
+        {
+            "comment": "Why these rows need fixing.",
+            "patches": [
+                {"match": {"UrlId": "/titanic-victim/..."},
+                 "set": {"Title": "Mr"}},
+                ...
+            ]
+        },
+        ...
+    ]
+
+A patch selects the rows whose columns (or index levels) equal all the values
+in "match", and sets the values in "set" on them. Rows are always selected on
+the values the table had before any patch was applied.
+"""
+
+import json
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+_logger = logging.getLogger(__name__)
+
+_fixes_dir = os.path.join(os.environ['HOME'],
+                          'kaggle',
+                          'titanic',
+                          'data',
+                          'fixes')
+
+
+def patch_table_path(name):
+    return os.path.join(_fixes_dir, '{}.json'.format(name))
+
+
+def _key_column(df, col_name):
+    if col_name in df.columns:
+        return df[col_name]
+    return df.index.get_level_values(col_name)
+
+
+def _candidate_rows(df, patches_df, key):
+    """Returns the positions and the key values of the rows that may match
+    a patch. Each key column is scanned once, whatever the number of patches.
+    """
+    is_candidate = np.ones(len(df), dtype=bool)
+    for col_name in key:
+        is_candidate &= np.asarray(
+            _key_column(df, col_name).isin(patches_df[col_name].unique()))
+    positions = np.flatnonzero(is_candidate)
+
+    candidates_df = pd.DataFrame({
+        col_name: np.asarray(_key_column(df, col_name))[positions]
+        for col_name in key
+    })
+    candidates_df['_row'] = positions
+    return candidates_df
+
+
+def apply_patch_table(df, path):
+    """Applies all the patches of the table at `path` to `df`, in place.
+
+    Rows are matched by one scan of each matched column and a join on the
+    few candidate rows, and each patched column is written once. Patches
+    matching no row are logged.
+    """
+    with open(path, 'r') as f:
+        patch_groups = json.load(f)
+
+    patches_by_key = {}
+    for patch_group in patch_groups:
+        for patch in patch_group['patches']:
+            key = tuple(patch['match'])
+            patches_by_key.setdefault(key, []).append(patch)
+
+    row_positions = {}
+    new_values = {}
+    for key, patches in patches_by_key.items():
+        key = list(key)
+        patches_df = pd.DataFrame([[patch['match'][col_name]
+                                    for col_name in key]
+                                   for patch in patches],
+                                  columns=key)
+        patches_df['_patch'] = np.arange(len(patches_df))
+
+        matches_df = _candidate_rows(df, patches_df, key) \
+            .merge(patches_df, on=key)
+
+        matched_patches = set(matches_df['_patch'])
+        for patch_idx, patch in enumerate(patches):
+            if patch_idx not in matched_patches:
+                _logger.warning('Patch matching no row in {}: {}'.format(
+                    os.path.basename(path), patch['match']))
+
+        for row_pos, patch_idx in zip(matches_df['_row'],
+                                      matches_df['_patch']):
+            for col_name, value in patches[patch_idx]['set'].items():
+                if col_name not in df.columns:
+                    continue
+                row_positions.setdefault(col_name, []).append(row_pos)
+                new_values.setdefault(col_name, []).append(value)
+
+    for col_name, positions in row_positions.items():
+        values = new_values[col_name]
+        if isinstance(df[col_name].dtype, pd.CategoricalDtype):
+            new_categories = set(values) - set(df[col_name].cat.categories)
+            if new_categories:
+                df[col_name] = df[col_name].cat.add_categories(
+                    sorted(new_categories))
+        df.iloc[positions, df.columns.get_loc(col_name)] = values
+
+    return df
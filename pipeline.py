@@ -0,0 +1,184 @@
+"""Runs a DataFrame pipeline as a graph of cached stages.
+
+A stage is a step declaring the columns it reads and the ones it writes, see
+`stage`. Every column of the running table has a key: the columns of the
+input table are keyed by their content. The key of a stage hashes its code,
+its version, the data files it reads and the keys of the index and of its
+input columns. A stage whose key is in the feature cache does not run: its
+output columns are read from the cache. The outputs of a stage that runs are
+keyed by their content again, so that the stages downstream only run if the
+columns they read actually changed.
+
+The code of a stage is the source of the step and of the helpers it declares
+(see `feature_cache.code_fingerprint`): an edit of an undeclared helper does
+not rerun the stage, unless its version is bumped.
+
+Example:
+    @pipeline.stage(['Sex'], ['Sex'])
+    def gender_to_lower_case(df):
+        df['Sex'] = df['Sex'].str.lower()
+        return df
+
+    df = pipeline.run(df, [gender_to_lower_case, ...])
+"""
+
+import hashlib
+import logging
+
+import pandas as pd
+
+import feature_cache as fc
+import parallel
+import profiling
+
+_logger = logging.getLogger(__name__)
+
+
+class Stage:
+
+    def __init__(self, step, input_columns, output_columns, data_files,
+                 version, row_local, helpers):
+        self.step = step
+        self.input_columns = list(input_columns)
+        self.output_columns = list(output_columns)
+        self.data_files = list(data_files)
+        self.version = version
+        self.row_local = row_local
+        self.helpers = list(helpers)
+
+    @property
+    def name(self):
+        return self.step.__name__
+
+    def fingerprint(self):
+        """Hashes the code of the stage, with its helpers, and the data files
+        it reads.
+        """
+        digest = hashlib.sha256()
+        digest.update('{}.{}:{}'.format(self.step.__module__,
+                                        self.step.__qualname__,
+                                        self.version).encode())
+        digest.update(fc.code_fingerprint(self.step, self.helpers).encode())
+        for path in self.data_files:
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+
+def stage(input_columns, output_columns, data_files=(), version=1,
+          row_local=False, helpers=()):
+    """Decorator declaring a step as a pipeline stage reading only the
+    `input_columns` and the `data_files` and writing only the
+    `output_columns`. The step itself is left unchanged. The functions,
+    modules and constants the step calls or reads are its `helpers`.
+
+    Row-local stages (see `parallel`) run on shards of the rows, in a pool of
+    processes.
+    """
+    def decorator(step):
+        step.stage = Stage(step,
+                           input_columns,
+                           output_columns,
+                           data_files,
+                           version,
+                           row_local,
+                           helpers)
+        return step
+    return decorator
+
+
+def _content_key(index_key, column):
+    digest = hashlib.sha256(index_key)
+    digest.update(str(column.dtype).encode())
+    digest.update(pd.util.hash_pandas_object(column,
+                                             index=False,
+                                             categorize=False).values)
+    return digest.hexdigest()
+
+
+def _stage_key(stage_, index_key, column_keys):
+    digest = hashlib.sha256(index_key)
+    digest.update(stage_.fingerprint().encode())
+    for col_name in stage_.input_columns:
+        digest.update('{}:{}'.format(col_name, column_keys[col_name]).encode())
+    return digest.hexdigest()
+
+
+def _run_stage(stage_, stage_df, num_workers):
+    if stage_.row_local:
+        stage_df, _ = parallel.apply_steps(stage_df,
+                                           [stage_.step],
+                                           num_workers=num_workers)
+    else:
+        stage_df = stage_.step(stage_df)
+    return stage_df[stage_.output_columns]
+
+
+def run(df, steps, num_workers=1, profiler=None):
+    """Runs the stages `steps`, in order, on `df`, which is left unchanged.
+
+    Returns the resulting frame: the columns of `df` followed by the new ones,
+    in the order the stages declare them. Row-local stages run in
+    `num_workers` processes. The stages that run, or are read from the cache,
+    are profiled by `profiler`, if given.
+    """
+    index_key = hashlib.sha256(
+        pd.util.hash_pandas_object(df.index).values).digest()
+    columns = {col_name: df[col_name] for col_name in df.columns}
+    column_keys = {}
+
+    # Without the cache the stages just run: no key is needed.
+    caching = fc.enabled
+    for step in steps:
+        stage_ = step.stage
+        outputs_df = None
+        if caching:
+            for col_name in stage_.input_columns:
+                if col_name not in column_keys:
+                    column_keys[col_name] = _content_key(index_key,
+                                                         columns[col_name])
+            key = _stage_key(stage_, index_key, column_keys)
+            if fc.has_entry(key):
+                with profiling.stage(profiler,
+                                     '{} (cached)'.format(stage_.name),
+                                     df[[]]) as profiled:
+                    outputs_df = fc.read_entry(key)
+                    profiled.set_output(outputs_df)
+
+        if outputs_df is None:
+            _logger.info('Running stage {}'.format(stage_.name))
+            # The steps work in place: they get a copy of their inputs.
+            stage_df = pd.DataFrame({col_name: columns[col_name].values
+                                     for col_name in stage_.input_columns},
+                                    index=df.index,
+                                    copy=True)
+            with profiling.stage(profiler, stage_.name, stage_df) as profiled:
+                outputs_df = _run_stage(stage_, stage_df, num_workers)
+                profiled.set_output(outputs_df)
+
+            if caching:
+                outputs_df.attrs['column_keys'] = {
+                    col_name: _content_key(index_key, outputs_df[col_name])
+                    for col_name in stage_.output_columns
+                }
+                fc.write_entry(key, outputs_df)
+
+        for col_name in stage_.output_columns:
+            columns[col_name] = outputs_df[col_name]
+            if caching:
+                column_keys[col_name] = \
+                    outputs_df.attrs['column_keys'][col_name]
+
+    # Concatenating the columns as they are is much cheaper than copying them
+    # together into blocks of the same dtype.
+    new_columns = [col_name
+                   for step in steps
+                   for col_name in step.stage.output_columns
+                   if col_name not in df.columns]
+    output_columns = list(df.columns) + list(dict.fromkeys(new_columns))
+    return pd.concat([pd.Series(columns[col_name].values,
+                                index=df.index,
+                                name=col_name)
+                      for col_name in output_columns],
+                     axis=1,
+                     copy=False)
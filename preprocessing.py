@@ -1,84 +1,118 @@
 """Collection of function to preprocess Kaggle-only data before training.
 """
 
+import functools
 import re
-from collections import Counter
 
 import numpy as np
 import pandas as pd
 
+import feature_cache as fc
+import parallel
+import patches
+import profiling
+
+
+def transform_unique_values(column, transform):
+    """Runs `transform` once per distinct value of `column`.
+
+    `transform` gets the distinct non-missing values as a Series and returns
+    a Series or a DataFrame aligned with it. The result is spread back to
+    all the rows of `column`, missing values getting missing results.
+    """
+    codes, uniques = pd.factorize(column)
+    transformed = transform(pd.Series(uniques))
+
+    # Missing values (code -1) pick the trailing row of NaN.
+    transformed = transformed.reindex(np.arange(len(uniques) + 1))
+    transformed = transformed.iloc[codes]
+    transformed.index = column.index
+    return transformed
+
 
 def convert_attribute_to_categorical(df, attribute_name):
-    categories = df[attribute_name].unique()
+    column = df[attribute_name]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # Columns loaded as categorical keep their categories in the order
+        # of appearance, as the plain object columns do.
+        codes = pd.unique(column.cat.codes)
+        categories = column.cat.categories[codes[codes >= 0]]
+    else:
+        categories = column.unique()
     df[attribute_name] = pd.Categorical(df[attribute_name],
                                         categories=categories,
                                         ordered=False)
     return df
 
 
+def fill_missing_with_unknown(df, attribute_names):
+    # Categorical columns need the "Unknown" category before being filled.
+    for attribute_name in attribute_names:
+        column = df[attribute_name]
+        if isinstance(column.dtype, pd.CategoricalDtype) \
+                and 'Unknown' not in column.cat.categories:
+            df[attribute_name] = column.cat.add_categories('Unknown')
+    df[attribute_names] = df[attribute_names].fillna('Unknown')
+    return df
+
+
 def manual_fixes(df):
-    """
+    """The fixes are listed in data/fixes/kaggle.json.
+
     See
         https://www.kaggle.com/c/titanic/discussion/39787
     and
         https://www.kaggle.com/erikbruin/titanic-2nd-degree-families-and-majority-voting
-    for some of the following fixes.
+    for some of them.
     """
-
-    # Replace wives' names to fully match their husbands'.
-    df.loc[499, 'Name'] = 'Allison, Mrs. Hudson Joshua Creighton (Bessie Waldo Daniels)'
-    df.loc[26, 'Name'] = 'Asplund, Mrs. Carl Oscar Vilhelm Gustafsson (Selma Augusta Emilia Johansson)'
-    df.loc[924, 'Name'] = 'Dean, Mrs. Bertram Frank (Eva Georgetta Light)'
-
-    # Replace some ill-formatted names.
-    df.loc[188, 'Name'] = 'Romaine, Mr. Charles Hallace'
-    df.loc[200, 'Name'] = 'Yrois, Miss. Henriette'
-    df.loc[428, 'Name'] = 'Phillips, Miss. Kate Florence'
-    df.loc[557, 'Name'] = 'Duff Gordon, Lady. Lucille Christiana (Lucille Christiana Sutherland)'
-    df.loc[600, 'Name'] = 'Duff Gordon, Sir. Cosmo Edmund'
-    df.loc[605, 'Name'] = 'Homer, Mr. Harry'
-    df.loc[706, 'Name'] = 'Morley, Mr. Henry Samuel'
-    df.loc[711, 'Name'] = 'Mayne, Mlle. Berthe Antonine'
-    df.loc[1036, 'Name'] = 'Lindeberg-Lind, Mr. Erik Gustaf'
-    df.loc[1219, 'Name'] = 'Rosenshine, Mr. George Thorne'
-
-    # Fix Abbott family's relationship.
-    df.loc[280, ['SibSp', 'Parch']] = [0, 2]
-    df.loc[747, ['SibSp', 'Parch']] = [1, 1]
-    df.loc[1284, ['SibSp', 'Parch']] = [1, 1]
-
-    # Fix Samaan family's relationship.
-    df.loc[1189, ['SibSp', 'Parch']] = [0, 2]
-    df.loc[49, ['SibSp', 'Parch']] = [1, 1]
-    df.loc[921, ['SibSp', 'Parch']] = [1, 1]
-
-    # Fix Davies family's relationship.
-    df.loc[550, ['SibSp', 'Parch']] = [0, 1]
-    df.loc[1222, ['SibSp', 'Parch']] = [0, 1]
-
-    return df
-
-
-def format_name(df):
-    # Pre-formatting.
-    df['Name'] = df['Name'].str.replace('"', '')
-    df['Name'] = df['Name'].str.strip()
-
-    # Split the name into "official" and "real".
-    # The official name is usually something like:
-    #  <last name>, <title> <first name>
-    # while the real name is usually the unmarried name for women.
-    full_name_pattern = r'(?P<OfficialName>.+?)(\s\((?P<RealName>.*?)\))?$'
-    df = df.join(df['Name'].str.extract(full_name_pattern).drop(columns=1))
-
-    # Split the official name into last name, title and first name.
-    official_name_pattern = \
-        r'(?P<LastName>.+),\s(?P<UnstrippedTitle>\S+)(?:\s(?P<FirstName>.*?))?$'
-    df = df.join(df['OfficialName'].str.extract(official_name_pattern))
-
-    # If the title ends with a punctuation sign (usually a dot), remove it.
-    stripped_title_pattern = r'(?P<Title>\w+)\W?'
-    df = df.join(df['UnstrippedTitle'].str.extract(stripped_title_pattern))
+    return patches.apply_patch_table(df, patches.patch_table_path('kaggle'))
+
+
+# Split the name into "official" and "real".
+# The official name is usually something like:
+#  <last name>, <title> <first name>
+# while the real name is usually the unmarried name for women.
+_full_name_pattern = re.compile(
+    r'(?P<OfficialName>.+?)(\s\((?P<RealName>.*?)\))?$')
+_official_name_pattern = re.compile(
+    r'(?P<LastName>.+),\s(?P<UnstrippedTitle>\S+)(?:\s(?P<FirstName>.*?))?$')
+# If the title ends with a punctuation sign (usually a dot), remove it.
+_stripped_title_pattern = re.compile(r'(?P<Title>\w+)\W?')
+
+_name_columns = [
+    'LastName',
+    'FirstName',
+    'Title',
+    'UnmarriedFirstName',
+    'UnmarriedLastName',
+]
+
+
+def _parse_name(name):
+    """Returns the last name, first name, title, unmarried first name and
+    unmarried last name in a formatted Kaggle name, NaN for missing parts.
+    """
+    last_name = first_name = title = np.nan
+    unmarried_first_name = unmarried_last_name = np.nan
+
+    full_name_match = _full_name_pattern.search(name)
+    if full_name_match is None:
+        return last_name, first_name, title, \
+            unmarried_first_name, unmarried_last_name
+    official_name, real_name = full_name_match.group('OfficialName',
+                                                     'RealName')
+
+    official_name_match = _official_name_pattern.search(official_name)
+    if official_name_match is not None:
+        last_name, unstripped_title, first_name = \
+            official_name_match.group('LastName',
+                                      'UnstrippedTitle',
+                                      'FirstName')
+        title_match = _stripped_title_pattern.search(unstripped_title)
+        if title_match is not None:
+            title = title_match.group('Title')
+        if first_name is None:
+            first_name = np.nan
 
     # Split the real name.
     # Here we use the following convention:
@@ -87,150 +121,194 @@ def format_name(df):
     # otherwise:
     #   the last word is the last name and all the previous words
     #   compose the first name.
-    df = df.join(df['RealName'].str.rsplit(n=1, expand=True).rename(
-        columns={0: 'UnmarriedFirstName', 1: 'UnmarriedLastName'}))
+    if real_name is not None:
+        real_name_parts = real_name.rsplit(None, 1)
+        if real_name_parts:
+            unmarried_first_name = real_name_parts[0]
+        if len(real_name_parts) == 2:
+            unmarried_last_name = real_name_parts[1]
 
     # If any of the unmarried names is missing, fill the hole with
     # the real name. This is always useful for men and unmarried women.
-    df = df.assign(
-        UnmarriedFirstName=df['UnmarriedFirstName'].fillna(df['FirstName']),
-        UnmarriedLastName=df['UnmarriedLastName'].fillna(df['LastName']))
+    if unmarried_first_name != unmarried_first_name:
+        unmarried_first_name = first_name
+    if unmarried_last_name != unmarried_last_name:
+        unmarried_last_name = last_name
 
     # If the first official name is not specified, use the unmarried name.
-    df = df.assign(FirstName=df['FirstName'].fillna(df['UnmarriedFirstName']))
+    if first_name != first_name:
+        first_name = unmarried_first_name
+
+    return last_name, first_name, title, \
+        unmarried_first_name, unmarried_last_name
 
-    # Discard intermediate use columns.
-    df = df.drop(columns=['OfficialName', 'RealName', 'UnstrippedTitle'])
+
+@fc.cached_step(['Name'], ['Name'] + _name_columns,
+                helpers=[_parse_name,
+                         _full_name_pattern,
+                         _official_name_pattern,
+                         _stripped_title_pattern])
+def format_name(df):
+    """Each distinct name is formatted and parsed once, in a single pass."""
+    name_codes, names = pd.factorize(df['Name'])
+
+    # Pre-formatting.
+    names = names.str.replace('"', '', regex=False).str.strip()
+
+    # One extra row of NaN for the missing names (code -1).
+    parsed_names = [_parse_name(name) for name in names]
+    parsed_names.append((np.nan,) * len(_name_columns))
+    parsed_names = np.array(parsed_names, dtype=object)[name_codes]
+
+    df['Name'] = np.append(names.values, np.nan)[name_codes]
+    for col_idx, col_name in enumerate(_name_columns):
+        df[col_name] = parsed_names[:, col_idx]
 
     # Ad-hoc fix: the only title with more than one word is passenger 760,
     # the Countess of Rothes. OUr heuristics on the name format do not comply
     # with this passenger.
     # Name: Rothes, the Countess. of (Lucy Noel Martha Dyer-Edwards)
-    countess_fixes = {
-        'LastName': 'Dyer-Edwards',
-        'Title': 'Countess of Rothes',
-        'FirstName': 'Lucy Noel Martha',
-        'UnmarriedFirstName': 'Lucy Noel Martha',
-        'UnmarriedLastName': 'Dyer-Edwards',
-    }
-    keys, values = zip(*countess_fixes.items())
-    df.loc[760, keys] = values
+    if 760 in df.index:
+        countess_fixes = {
+            'LastName': 'Dyer-Edwards',
+            'Title': 'Countess of Rothes',
+            'FirstName': 'Lucy Noel Martha',
+            'UnmarriedFirstName': 'Lucy Noel Martha',
+            'UnmarriedLastName': 'Dyer-Edwards',
+        }
+        keys, values = zip(*countess_fixes.items())
+        df.loc[760, keys] = values
 
     return df
 
 
-def get_title_list(df):
-    name_template = r'[^,]+, (?P<title>[^\.]+)\.\s'
-    name_pattern = re.compile(name_template)
+# Kaggle names look like "<last name>, <title>. <first name>". Multi-word
+# titles (e.g. "the Countess") are reduced to their last word.
+_title_pattern = r'^[^,]+, (?:[^\.]* )?(?P<title>[^\. ]+)\.\s'
+
+_coarse_title_mapping = {
+    'Ms': 'Common',
+    'Major': 'Rare',
+    'Mr': 'Common',
+    'Miss': 'Common',
+    'Countess': 'Rare',
+    'Dr': 'Rare',
+    'Don': 'Rare',
+    'Master': 'Common',
+    'Jonkheer': 'Rare',
+    'Mlle': 'Rare',
+    'Col': 'Rare',
+    'Mme': 'Rare',
+    'Capt': 'Rare',
+    'Rev': 'Rare',
+    'Lady': 'Rare',
+    'Mrs': 'Common',
+    'Sir': 'Rare',
+    'Dona': 'Rare',
+    'Unknown': 'Unknown',
+}
+_coarse_titles = list(dict.fromkeys(_coarse_title_mapping.values()))
+
+# A typical cabin field is in the form:
+#  A123
+#  or: A123 B456 C78
+#  or: Q A123 B456 C78
+_cabin_full_pattern = r'^([A-Z] )?([A-Z]\d+\s?)+$'
+_cabin_floor_pattern = r'(?P<floor>[A-Z])\d+'
+
+
+def _extract_titles(df):
+    """Returns the titles as a Categorical with the categories in order of
+    appearance. The regex only runs once per distinct name.
+    """
+    # Missing names get a code too, hence the 'Unknown' title.
+    name_codes, names = pd.factorize(df['Name'], use_na_sentinel=False)
+    titles = pd.Series(names) \
+        .str.extract(_title_pattern, expand=False) \
+        .fillna('Unknown')
+    title_codes, titles = pd.factorize(titles)
+    return pd.Categorical.from_codes(title_codes[name_codes],
+                                     categories=titles)
 
-    titles_list = []
-    for name in df['Name']:
-        match = name_pattern.match(name)
-        if not match:
-            titles_list.append('Unknown')
-            continue
-        else:
-            titles_list.append(match.group('title').split(' ')[-1])
 
-    return titles_list
+def get_title_list(df):
+    titles = _extract_titles(df)
+    return titles.categories[titles.codes].tolist()
 
 
+@parallel.categorical_outputs(Title=parallel.APPEARANCE)
+@parallel.categorical_outputs(Title=_coarse_titles)
+@fc.cached_step(['Name'], ['Title'],
+                version=2,
+                helpers=[_extract_titles, _title_pattern])
 def add_title_column(df):
-    titles_list = get_title_list(df)
-    titles_counter = Counter(titles_list)
-
-    df['Title'] = pd.Categorical(titles_list,
-                                 categories=titles_counter.keys(),
-                                 ordered=False)
+    df['Title'] = _extract_titles(df)
     return df
 
 
+@parallel.categorical_outputs(Title=_coarse_titles)
+@fc.cached_step(['Name'], ['Title'],
+                version=2,
+                helpers=[_extract_titles,
+                         _title_pattern,
+                         _coarse_title_mapping,
+                         _coarse_titles])
 def add_coarse_title_column(df):
-    name_template = r'[^,]+, (?P<title>[^\.]+)\.\s'
-    name_pattern = re.compile(name_template)
-
-    titles_list = []
-    for name in df['Name']:
-        match = name_pattern.match(name)
-        if not match:
-            titles_list.append('Unknown')
-            continue
-        else:
-            titles_list.append(match.group('title').split(' ')[-1])
-
-    title_mapping = {
-        'Ms': 'Common',
-        'Major': 'Rare',
-        'Mr': 'Common',
-        'Miss': 'Common',
-        'Countess': 'Rare',
-        'Dr': 'Rare',
-        'Don': 'Rare',
-        'Master': 'Common',
-        'Jonkheer': 'Rare',
-        'Mlle': 'Rare',
-        'Col': 'Rare',
-        'Mme': 'Rare',
-        'Capt': 'Rare',
-        'Rev': 'Rare',
-        'Lady': 'Rare',
-        'Mrs': 'Common',
-        'Sir': 'Rare',
-        'Dona': 'Rare',
-        'Unknown': 'Unknown',
-    }
-
-    df['Title'] = pd.Categorical(
-        map(lambda fine_title: title_mapping.get(fine_title, 'Rare'),
-            titles_list),
-        categories=set(title_mapping.values()),
-        ordered=False)
+    titles = _extract_titles(df)
+    coarse_titles = titles.categories \
+        .map(_coarse_title_mapping) \
+        .fillna('Rare')
+    df['Title'] = pd.Categorical.from_codes(
+        pd.Index(_coarse_titles).get_indexer(coarse_titles)[titles.codes],
+        categories=_coarse_titles)
     return df
 
 
+@fc.cached_step(['Ticket'], ['TicketNumber'],
+                version=2,
+                helpers=[transform_unique_values])
 def add_ticket_number_column(df):
     ticket_pattern = r'.*?(?P<TicketNumber>\d+)$'
-    df['TicketNumber'] = df['Ticket'].str.extract(ticket_pattern, expand=True).astype(float)
+    df['TicketNumber'] = transform_unique_values(
+        df['Ticket'],
+        lambda tickets: tickets.str.extract(ticket_pattern, expand=False)
+        .astype(float))
     return df
 
 
+@parallel.categorical_outputs(Floor=parallel.APPEARANCE)
+@fc.cached_step(['Cabin'], ['Floor'],
+                helpers=[_cabin_full_pattern, _cabin_floor_pattern])
 def add_floor_column(df):
-    cabin_full_template = r'^([A-Z] )?([A-Z]\d+\s?)+$'
-    cabin_full_pattern = re.compile(cabin_full_template)
-
-    cabin_template = r'(?P<floor>[A-Z])\d+\s?'
-    cabin_pattern = re.compile(cabin_template)
-
-    floors = []
-    for cabin in df['Cabin']:
-        if cabin != cabin:
-            # NaN value.
-            floors.append('Unknown')
-            continue
-
-        # Check if the cabin format is atypical.
-        if not cabin_full_pattern.match(cabin):
-            floors.append('Unknown')
-            continue
-
-        # If you get here the cabin field is in the form:
-        #  A123
-        #  or: A123 B456 C78
-        #  or: Q A123 B456 C78
-
-        cabin_floors = {
-            match.group('floor')
-            for match in cabin_pattern.finditer(cabin)
-        }
-
-        if len(cabin_floors) != 1:
-            raise ValueError('Only one floor per cabin expected, '
-                             'but got {}'.format(len(cabin_floors)))
-        floors.append(cabin_floors.pop())
-
-    df['Floor'] = pd.Categorical(floors,
-                                 categories=filter(None, set(floors)),
-                                 ordered=False)
+    """The cabin formats are only parsed once per distinct cabin."""
+    cabin_codes, cabins = pd.factorize(df['Cabin'])
+    cabins = pd.Series(cabins)
+
+    # Atypical cabin formats get an unknown floor.
+    is_typical = cabins.str.match(_cabin_full_pattern).astype(bool)
+    floor_matches = cabins[is_typical] \
+        .str.extractall(_cabin_floor_pattern)['floor'] \
+        .groupby(level=0)
+
+    num_cabin_floors = floor_matches.nunique()
+    if (num_cabin_floors != 1).any():
+        raise ValueError('Only one floor per cabin expected, '
+                         'but got {}'.format(
+                             num_cabin_floors[num_cabin_floors != 1].iloc[0]))
+
+    cabin_floors = pd.Series('Unknown', index=cabins.index)
+    cabin_floors[is_typical] = floor_matches.first()
+
+    # Missing cabins (code -1) pick the trailing "Unknown".
+    floor_codes, floors = pd.factorize(np.append(cabin_floors.values,
+                                                 'Unknown'))
+    floor_codes = floor_codes[cabin_codes]
+
+    # Categories in order of appearance.
+    appearance_order = pd.unique(floor_codes)
+    df['Floor'] = pd.Categorical.from_codes(
+        np.argsort(appearance_order)[floor_codes],
+        categories=floors[appearance_order])
     return df
 
 
@@ -259,3 +337,163 @@ def convert_categorical_columns_to_numerical(df):
 def sort_columns(df):
     df = df.reindex(columns=sorted(list(df.columns)))
     return df
+
+
+def _apply_steps(df, steps, profiler=None):
+    for step in steps:
+        df = profiling.apply(step, df, profiler)
+    return df
+
+
+def _median_from_value_counts(value_counts):
+    # As Series.median() on a column without known values.
+    if value_counts.empty:
+        return np.nan
+    value_counts = value_counts.sort_index()
+    cum_counts = value_counts.cumsum().values
+    total_count = cum_counts[-1]
+    # Values at the two central positions: they coincide for odd counts.
+    lower_value, upper_value = value_counts.index[np.searchsorted(
+        cum_counts, [(total_count - 1) // 2, total_count // 2], side='right')]
+    return (lower_value + upper_value) / 2
+
+
+def _summarize_chunk(chunk_df, categorical_attributes, median_attributes):
+    # Categories in order of appearance and value counts of the chunk.
+    return {
+        'categories': {
+            attribute_name:
+                chunk_df[attribute_name].dropna().astype(object).unique()
+            for attribute_name in categorical_attributes
+        },
+        'value_counts': {
+            attribute_name: chunk_df[attribute_name].value_counts()
+            for attribute_name in median_attributes
+        },
+    }
+
+
+def _reduce_chunk_summaries(summaries,
+                            categorical_attributes,
+                            median_attributes):
+    categories = {attribute_name: {}
+                  for attribute_name in categorical_attributes}
+    value_counts = {attribute_name: pd.Series(dtype=float)
+                    for attribute_name in median_attributes}
+
+    for summary in summaries:
+        for attribute_name in categorical_attributes:
+            # Dicts keep the insertion order, hence the order of appearance.
+            categories[attribute_name].update(
+                dict.fromkeys(summary['categories'][attribute_name]))
+
+        for attribute_name in median_attributes:
+            value_counts[attribute_name] = value_counts[attribute_name].add(
+                summary['value_counts'][attribute_name], fill_value=0)
+
+    return {
+        'categories': {
+            attribute_name: list(attribute_categories)
+            for attribute_name, attribute_categories in categories.items()
+        },
+        'medians': {
+            attribute_name: _median_from_value_counts(attribute_counts)
+            for attribute_name, attribute_counts in value_counts.items()
+        },
+    }
+
+
+def learn_chunk_statistics(chunks,
+                           categorical_attributes=(),
+                           median_attributes=(),
+                           steps=(),
+                           profiler=None):
+    """Learns the statistics needed to preprocess a dataset chunk by chunk.
+
+    Each chunk first goes through the `steps` functions, then it updates:
+    - the categories of the categorical attributes, in order of appearance;
+    - the value counts of the median attributes, from which the exact
+      medians are computed at the end.
+    Memory is bounded by the number of distinct values, not by the number
+    of rows. The steps are profiled by `profiler`, if given.
+    """
+    summaries = (_summarize_chunk(_apply_steps(chunk_df, steps, profiler),
+                                  categorical_attributes,
+                                  median_attributes)
+                 for chunk_df in chunks)
+    return _reduce_chunk_summaries(summaries,
+                                   categorical_attributes,
+                                   median_attributes)
+
+
+def apply_chunk_statistics(df, statistics):
+    """Fills the missing median attributes with the learned medians and
+    converts the categorical attributes to the learned categories. Values
+    never seen while learning become missing.
+    """
+    df = df.fillna(statistics['medians'])
+    for attribute_name, categories in statistics['categories'].items():
+        df[attribute_name] = pd.Categorical(
+            df[attribute_name].astype(object),
+            categories=categories,
+            ordered=False)
+    return df
+
+
+def preprocess_chunks(chunks, statistics, steps=(), profiler=None):
+    """Yields the chunks processed by the `steps` functions and by the
+    statistics learned with `learn_chunk_statistics`. Categorical codes are
+    consistent across chunks.
+
+    Example:
+        steps = [add_ticket_number_column, add_floor_column]
+        statistics = learn_chunk_statistics(
+            (X for X, _ in ds.iter_training_set(100000)),
+            categorical_attributes=['Sex', 'Floor'],
+            median_attributes=['Age'],
+            steps=steps)
+        for X, y in ds.iter_training_set(100000):
+            X = next(preprocess_chunks([X], statistics, steps=steps))
+    """
+    for chunk_df in chunks:
+        chunk_df = _apply_steps(chunk_df, steps, profiler)
+        with profiling.stage(profiler, 'apply_chunk_statistics', chunk_df) \
+                as stage:
+            chunk_df = apply_chunk_statistics(chunk_df, statistics)
+            stage.set_output(chunk_df)
+        yield chunk_df
+
+
+def preprocess_in_parallel(df,
+                           categorical_attributes=(),
+                           median_attributes=(),
+                           steps=(),
+                           num_workers=None,
+                           profiler=None):
+    """Same as learning the statistics of `df` and preprocessing it in a
+    single chunk, but the row-local `steps` run on shards of `df` in
+    `num_workers` processes, all the cores by default.
+
+    Each worker also summarizes its shard, and the summaries are reduced into
+    the statistics of the whole table. Returns the preprocessed frame and
+    the statistics, to preprocess other sets the same way. The stages are
+    profiled by `profiler`, if given: the steps run in the workers are not.
+    """
+    with profiling.stage(profiler, 'parallel steps', df) as stage:
+        df, summaries = parallel.apply_steps(
+            df,
+            steps,
+            num_workers=num_workers,
+            summarize=functools.partial(
+                _summarize_chunk,
+                categorical_attributes=categorical_attributes,
+                median_attributes=median_attributes))
+        stage.set_output(df)
+    with profiling.stage(profiler, 'reduce statistics'):
+        statistics = _reduce_chunk_summaries(summaries,
+                                             categorical_attributes,
+                                             median_attributes)
+    with profiling.stage(profiler, 'apply_chunk_statistics', df) as stage:
+        df = apply_chunk_statistics(df, statistics)
+        stage.set_output(df)
+    return df, statistics
@@ -0,0 +1,167 @@
+"""Opt-in profiling of the preprocessing stages.
+
+The pipelines take an optional `profiler`: when given, every stage records its
+wall time, its peak memory as traced by tracemalloc, the rows it got and
+returned and the columns it added or dropped. Stages can be nested: the peak
+memory of a stage includes the one of its sub-stages.
+
+Example:
+    profiler = profiling.Profiler()
+    df = merge.apply_post_processing(df, profiler=profiler)
+    profiler.print_report()
+    profiler.write_json('post_processing_profile.json')
+"""
+
+import contextlib
+import json
+import time
+import tracemalloc
+
+import pandas as pd
+
+
+def _num_rows(data):
+    if isinstance(data, (tuple, list)):
+        return sum(_num_rows(item) for item in data)
+    return len(data)
+
+
+def _columns(data):
+    if isinstance(data, (tuple, list)):
+        return list(dict.fromkeys(col_name
+                                  for item in data
+                                  for col_name in _columns(item)))
+    if isinstance(data, pd.Series):
+        return [data.name]
+    return list(data.columns)
+
+
+class _Stage:
+
+    def __init__(self, name, input_data):
+        self.name = name
+        self.input_data = input_data
+        self.output_data = None
+        self.rows_in = None if input_data is None else _num_rows(input_data)
+        self.columns_in = [] if input_data is None else _columns(input_data)
+        self.start_memory = 0
+        self.max_memory = 0
+
+    def set_output(self, output_data):
+        """Sets what the stage returned, if it is not its input frame."""
+        self.output_data = output_data
+
+
+class Profiler:
+
+    def __init__(self):
+        self.records = []
+        self._active_stages = []
+        self._started_tracing = False
+
+    def _update_peaks(self):
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        for stage in self._active_stages:
+            stage.max_memory = max(stage.max_memory, peak_memory)
+        tracemalloc.reset_peak()
+
+    @contextlib.contextmanager
+    def stage(self, name, input_data=None):
+        """Profiles the code run in the context. `input_data` is the frame,
+        or tuple of frames, the stage works on.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+        stage = _Stage(name, input_data)
+        self._update_peaks()
+        stage.start_memory = tracemalloc.get_traced_memory()[0]
+        stage.max_memory = stage.start_memory
+        self._active_stages.append(stage)
+        start_time = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            wall_time = time.perf_counter() - start_time
+            self._update_peaks()
+            self._active_stages.pop()
+
+            output_data = stage.output_data
+            if output_data is None:
+                output_data = stage.input_data
+            columns_out = [] if output_data is None else _columns(output_data)
+            self.records.append({
+                'stage': name,
+                'wall_time': wall_time,
+                'peak_memory': stage.max_memory - stage.start_memory,
+                'rows_in': stage.rows_in,
+                'rows_out': None if output_data is None
+                else _num_rows(output_data),
+                'columns_added': [col_name
+                                  for col_name in columns_out
+                                  if col_name not in stage.columns_in],
+                'columns_dropped': [col_name
+                                    for col_name in stage.columns_in
+                                    if col_name not in columns_out],
+            })
+
+            if not self._active_stages and self._started_tracing:
+                tracemalloc.stop()
+                self._started_tracing = False
+
+    def apply(self, step, df):
+        """Returns step(df), profiled as a stage named after the step."""
+        with self.stage(step.__name__, df) as stage:
+            stage.set_output(step(df))
+        return stage.output_data
+
+    def report(self):
+        """Returns one row per stage name, in order of first run. Stages run
+        more than once, e.g. once per chunk, are summed up, but for the
+        largest peak memory. Only the number of distinct columns added is
+        reported: the json output lists them.
+        """
+        records_df = pd.DataFrame(self.records, columns=[
+            'stage', 'wall_time', 'peak_memory', 'rows_in', 'rows_out'])
+        report_df = records_df.groupby('stage', sort=False).agg(
+            calls=('wall_time', 'size'),
+            wall_time=('wall_time', 'sum'),
+            peak_memory=('peak_memory', 'max'),
+            rows_in=('rows_in', 'sum'),
+            rows_out=('rows_out', 'sum'))
+        report_df[['rows_in', 'rows_out']] = \
+            report_df[['rows_in', 'rows_out']].astype(int)
+        report_df['columns_added'] = [
+            len(set(col_name
+                    for record in self.records
+                    if record['stage'] == stage_name
+                    for col_name in record['columns_added']))
+            for stage_name in report_df.index
+        ]
+        return report_df
+
+    def print_report(self):
+        report_df = self.report()
+        report_df['wall_time'] = report_df['wall_time'].map('{:.3f} s'.format)
+        report_df['peak_memory'] = (report_df['peak_memory'] / 2 ** 20) \
+            .map('{:.1f} MB'.format)
+        print(report_df.to_string())
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.records, f, indent=2)
+
+
+def stage(profiler, name, input_data=None):
+    """Same as `profiler.stage`, only doing nothing without a profiler."""
+    if profiler is None:
+        return contextlib.nullcontext(_Stage(name, None))
+    return profiler.stage(name, input_data)
+
+
+def apply(step, df, profiler=None):
+    """Returns step(df), profiled if a profiler is given."""
+    if profiler is None:
+        return step(df)
+    return profiler.apply(step, df)
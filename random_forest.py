@@ -1,189 +1,58 @@
 import numpy as np
+from sklearn.base import clone
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import GridSearchCV
+from sklearn.model_selection import PredefinedSplit
+from sklearn.model_selection import StratifiedKFold
 from sklearn.model_selection import train_test_split
+from sklearn.pipeline import Pipeline
 
 import dataset as ds
-import preprocessing as pp
+import features as fs
 import submission as sm
-
-'''
-Just a copy of all the attributes.
-
-attributes = [
-    'Age',
-    'BirthDate',
-    'BirthPlace',
-    'Cabin',
-    'Destination',
-    'Embarked',
-    'FirstName',
-    'Job',
-    'LastName',
-    'MaritalStatus',
-    'Nationality',
-    'Pclass',
-    'Residence',
-    'Sex',
-    'Ticket',
-    'Title',
-    'UrlId',
-    'TicketPrice',
-    'TicketNumber',
-    'BirthPlaceCountry',
-    'BirthPlaceCity',
-    'BirthPlaceRegion',
-    'ResidenceCountry',
-    'ResidenceCity',
-    'ResidenceRegion',
-    'DestinationCountry',
-    'DestinationCity',
-    'DestinationRegion',
-    'CabinDeck',
-    'AgeInDays',
-    'KPassengerId',
-    'SibSp',
-    'Parch',
-    'Split',
-    'NumChild',
-    'NumEmployee',
-    'NumEmployer',
-    'NumFriend',
-    'NumKnows',
-    'NumParent',
-    'NumRelative',
-    'NumSibling',
-    'NumSpouse',
-]
-'''
-
-
-def preprocess_dataset(df):
-    keep_attributes = [
-        # 'Age',
-        # 'BirthDate',
-        # 'BirthPlace',
-        # 'Cabin',
-        # 'Destination',
-        'Embarked',
-        # 'FirstName',
-        'Job',
-        # 'LastName',
-        'MaritalStatus',
-        'Nationality',
-        'Pclass',
-        # 'Residence',
-        'Sex',
-        # 'Ticket',
-        'Title',
-        # 'UrlId',
-        'TicketPrice',
-        'TicketNumber',
-        'BirthPlaceCountry',
-        # 'BirthPlaceCity',
-        # 'BirthPlaceRegion',
-        'ResidenceCountry',
-        # 'ResidenceCity',
-        # 'ResidenceRegion',
-        'DestinationCountry',
-        # 'DestinationCity',
-        # 'DestinationRegion',
-        'CabinDeck',
-        'AgeInDays',
-        # 'KPassengerId',
-        # 'SibSp',
-        # 'Parch',
-        # 'Split',
-        'NumChild',
-        'NumEmployee',
-        'NumEmployer',
-        'NumFriend',
-        'NumKnows',
-        'NumParent',
-        'NumRelative',
-        'NumSibling',
-        'NumSpouse',
-    ]
-    drop_attributes = set(df.columns) - set(keep_attributes)
-    df = df.drop(columns=drop_attributes)
-
-    # Missing tickets belong to crew member.
-    df['TicketNumber'] = df['TicketNumber'].fillna(-1)
-
-    # Use the median to replace missing ages.
-    no_age_df = df.loc[df['AgeInDays'].isna()]
-    for psgr_id, no_age_row in no_age_df.iterrows():
-        pclass, gender, embarked = no_age_row[['Pclass', 'Sex', 'Embarked']]
-        inferred_age = df.loc[(df['Pclass'] == pclass)
-                              & (df['Sex'] == gender)
-                              & (df['Embarked'] == embarked)
-                              & (~df['AgeInDays'].isna())]['AgeInDays'].median()
-        df.loc[psgr_id, 'AgeInDays'] = inferred_age
-
-    attributes_to_categorical = [
-        'Embarked',
-        'Job',
-        'MaritalStatus',
-        'Nationality',
-        'Pclass',
-        'Sex',
-        'Title',
-        # 'TicketPrice',
-        # 'TicketNumber',
-        'BirthPlaceCountry',
-        'ResidenceCountry',
-        'DestinationCountry',
-        'CabinDeck',
-        # 'AgeInDays',
-        # 'NumChild',
-        # 'NumEmployee',
-        # 'NumEmployer',
-        # 'NumFriend',
-        # 'NumKnows',
-        # 'NumParent',
-        # 'NumRelative',
-        # 'NumSibling',
-        # 'NumSpouse',
-    ]
-    df[attributes_to_categorical] = \
-        df[attributes_to_categorical].fillna('Unknown')
-    for attribute_name in attributes_to_categorical:
-        df = pp.convert_attribute_to_categorical(df, attribute_name)
-
-    df = pp.convert_categorical_columns_to_numerical(df)
-
-    return df
+import transformers as tr
 
 
 def main():
     print('Random Forest')
 
-    X_dataset, y_dataset = ds.load_training_set()
-    X_testset = ds.load_test_set()
-
-    X_dataset = preprocess_dataset(X_dataset)
-    X_testset = preprocess_dataset(X_testset)
+    X_dataset, y_dataset, X_testset = fs.load_features('random_forest')
 
     X_train, X_val, y_train, y_val = train_test_split(X_dataset,
                                                       y_dataset,
                                                       test_size=0.3,
                                                       random_state=0)
 
+    # The group survival rates of all the fits of the search are derived
+    # from the same statistics of the folds.
+    folds = np.empty(len(X_train), dtype=int)
+    k_fold = StratifiedKFold(n_splits=10)
+    for fold, (_, fold_rows) in enumerate(k_fold.split(X_train, y_train)):
+        folds[fold_rows] = fold
+    statistics = fs.fold_group_statistics(X_train, y_train, folds)
+
     parameters = {
-        'n_estimators': range(100, 501, 500),
-        'criterion': ('entropy', 'gini'),
-        'max_depth': range(1, 11, 1),
-        'ccp_alpha': np.linspace(0, 1e-2, 6),
-        'bootstrap': (True, False),
+        'forest__n_estimators': range(100, 501, 500),
+        'forest__criterion': ('entropy', 'gini'),
+        'forest__max_depth': range(1, 11, 1),
+        'forest__ccp_alpha': np.linspace(0, 1e-2, 6),
+        'forest__bootstrap': (True, False),
     }
-    estimator = RandomForestClassifier()
+    estimator = Pipeline([
+        ('group_survival', tr.OutOfFoldGroupEncoder(statistics)),
+        ('forest', RandomForestClassifier()),
+    ])
     clf = GridSearchCV(estimator=estimator,
                        param_grid=parameters,
                        refit=True,
                        n_jobs=-1,
-                       cv=10)
+                       cv=PredefinedSplit(folds))
     clf.fit(X_train, y_train)
-    train_accuracy = clf.score(X_train, y_train)
+    # Transforming the training passengers would count their own labels in
+    # the rates: the forest is scored on the out-of-fold rates it was fit on.
+    encoder = clone(clf.best_estimator_.named_steps['group_survival'])
+    train_accuracy = clf.best_estimator_.named_steps['forest'].score(
+        encoder.fit_transform(X_train), y_train)
     val_accuracy = clf.score(X_val, y_val)
 
     print('Train accuracy:      {}'.format(train_accuracy))
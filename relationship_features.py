@@ -0,0 +1,156 @@
+"""Features of the passengers derived from the relationship graph (see
+data.integration.relationships.graph) by sparse matrix products:
+  - the number of passengers of each relationship: NumParent, NumChild...
+    (see `RELATIONSHIP_COUNT_FEATURES`);
+  - NumRelativesRelatives: the number of relationships of the passengers
+    related to each passenger, the ones back to it aside.
+
+The features are kept in the feature cache together with the graph they were
+computed on. When relationships_data.json or the manual fixes change, only
+the passengers whose features may have changed are computed again: the ones
+of a changed relationship and the ones related to them.
+
+The survival rate of the passengers at most two relationships away depends on
+the folds of each model: it is computed by transformers.OutOfFoldGroupEncoder,
+on the groups of `neighbourhoods`.
+
+Example:
+    features_df = relationship_features.build_features(df['UrlId'])
+"""
+
+import hashlib
+import logging
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+import data.integration.relationships.graph as rg
+import data.integration.relationships.manual_fixes as mf
+import data.integration.relationships.mapping as mapping
+import feature_cache as fc
+
+_logger = logging.getLogger(__name__)
+
+# Bump whenever the features change.
+_version = 2
+
+RELATIONSHIP_COUNT_FEATURES = ['Num{}'.format(rel.capitalize())
+                               for rel in mapping.codes]
+TWO_HOP_FEATURES = ['NumRelativesRelatives']
+
+
+def compute_features(graph, rows=None):
+    """Returns the features of the passengers at the positions `rows`, all
+    if None, of the relationship `graph`.
+    """
+    if rows is None:
+        rows = np.arange(graph.matrix.shape[0])
+    features = {
+        'Num{}'.format(rel.capitalize()):
+            np.diff(graph.adjacency(rel)[rows].indptr)
+        for rel in mapping.codes
+    }
+
+    adjacency = graph.adjacency().astype(np.int32)
+    num_relationships = np.diff(adjacency.indptr)
+    features['NumRelativesRelatives'] = \
+        adjacency[rows] @ (num_relationships - 1)
+
+    return pd.DataFrame(features, index=rows).astype(np.int32)
+
+
+def within_2(graph):
+    """Returns the CSR matrix with 1 at (row, other row) if the passengers
+    are at most two relationships away, the passengers themselves aside.
+    """
+    adjacency = graph.adjacency().astype(np.int32)
+    within = (adjacency + adjacency @ adjacency).tocoo()
+    is_other = within.row != within.col
+    return sparse.csr_matrix(
+        (np.ones(is_other.sum(), dtype=np.int8),
+         (within.row[is_other], within.col[is_other])),
+        shape=within.shape)
+
+
+def neighbourhoods(graph, url_ids):
+    """Returns the memberships of the neighbourhoods of the passengers of
+    `graph` among the passengers of `url_ids`, see
+    transformers.FoldGroupStatistics: the UrlIds of the passengers, and the
+    CSR matrix with 1 at (row of a passenger, position in `url_ids`) for the
+    passengers at most two relationships away.
+    """
+    url_ids = np.asarray(url_ids, dtype=object)
+    vocabulary = pd.Index(
+        graph.index.url_ids[pd.notna(graph.index.url_ids)], dtype=object)
+    positions = graph.index.rows(url_ids)
+    is_known = positions >= 0
+    # Moves the columns of the graph rows to the positions in `url_ids`.
+    selection = sparse.csr_matrix(
+        (np.ones(is_known.sum()),
+         (positions[is_known], np.flatnonzero(is_known))),
+        shape=(len(graph.index), len(url_ids)))
+    return vocabulary, \
+        within_2(graph)[graph.index.rows(vocabulary)] @ selection
+
+
+def _changed_rows(matrix, other_matrix):
+    """Returns the rows whose features differ between the relationship
+    matrices: the ones of a changed relationship and the ones related to
+    them, in either matrix.
+    """
+    changed = (matrix != other_matrix).tocoo()
+    rows = np.union1d(changed.row, changed.col)
+    related = (abs(matrix[rows]) + abs(other_matrix[rows])).tocoo()
+    return np.union1d(rows, related.col)
+
+
+def _sources_signature(relationships_path):
+    digest = hashlib.sha256()
+    with open(relationships_path, 'rb') as f:
+        digest.update(f.read())
+    digest.update(repr(mf.manual_fixes).encode())
+    return digest.hexdigest()
+
+
+def _entry_key(url_ids):
+    digest = hashlib.sha256('{}:{}'.format(__name__, _version).encode())
+    digest.update(pd.util.hash_pandas_object(pd.Series(url_ids),
+                                             index=False).values)
+    return digest.hexdigest()
+
+
+def build_features(url_ids, relationships_path=rg._relationships_path):
+    """Returns the features of the passengers of `url_ids`, one row each,
+    see `compute_features`.
+
+    The features are only computed again for the passengers whose
+    relationships changed since the last call on the same passengers.
+    """
+    url_ids = np.asarray(url_ids, dtype=object)
+    key = _entry_key(url_ids)
+    signature = _sources_signature(relationships_path)
+
+    previous_df = fc.read_entry(key) if fc.enabled else None
+    if previous_df is not None \
+            and previous_df.attrs['signature'] == signature:
+        previous_df.attrs = {}
+        return previous_df
+
+    graph = rg.RelationshipGraph.build(
+        url_ids, rg.load_relationships(relationships_path))
+    if previous_df is None:
+        features_df = compute_features(graph)
+    else:
+        rows = _changed_rows(previous_df.attrs['matrix'], graph.matrix)
+        _logger.info('Relationships changed: computing the features of {} '
+                     'passengers again'.format(len(rows)))
+        features_df = previous_df.copy()
+        features_df.attrs = {}
+        features_df.iloc[rows] = compute_features(graph, rows).values
+
+    if fc.enabled:
+        entry_df = features_df.copy(deep=False)
+        entry_df.attrs = {'signature': signature, 'matrix': graph.matrix}
+        fc.write_entry(key, entry_df)
+    return features_df
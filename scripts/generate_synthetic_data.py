@@ -0,0 +1,467 @@
+"""This script generates synthetic Titanic-like tables of any size, to
+benchmark and load test the data pipelines.
+
+The distributions are learned from the real train.csv, xtrain.csv and
+extra_data.csv. Passengers are generated by travel group: the members of a
+group share ticket, cabins, class, embarking port and residence, families
+share their last name and are linked by relationships. The output directory
+gets the same tables as the data directory:
+    train.csv                   Kaggle format, passengers only;
+    xtrain.csv                  extended format, passengers and crew;
+    extra_data.csv              raw encyclopedia-titanica format;
+    relationships_data.json     relationship graph.
+The output only depends on the number of rows and on the seed.
+"""
+import argparse
+import datetime as dt
+import json
+import logging
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+import data.integration.relationships.mapping as mapping
+
+logging.basicConfig(format='[{levelname}][{name}] {message}',
+                    style='{',
+                    level=logging.INFO)
+_logger = logging.getLogger(__name__)
+
+
+_DATA_DIR = os.path.join(os.environ['HOME'], 'kaggle', 'titanic', 'data')
+_OUTPUT_DIR = os.path.join(_DATA_DIR, 'synthetic')
+
+# Passengers are generated and written in batches of this size. It is part
+# of the generation, so changing it changes the output for a given seed.
+_BATCH_SIZE = 100000
+
+_sinking_date = dt.date(year=1912, month=4, day=15)
+_passenger_classes = {
+    '1st Class Passenger': 1,
+    '2nd Class Passenger': 2,
+    '3rd Class Passenger': 3,
+}
+_embarking_ports = {
+    'S': 'Southampton',
+    'C': 'Cherbourg',
+    'Q': 'Queenstown',
+    'B': 'Belfast',
+}
+_location_suffixes = ['Country', 'City', 'Region']
+_count_columns = [
+    'NumChild',
+    'NumEmployee',
+    'NumEmployer',
+    'NumFriend',
+    'NumKnows',
+    'NumParent',
+    'NumRelative',
+    'NumSibling',
+    'NumSpouse',
+]
+_kaggle_columns = ['PassengerId', 'Survived', 'Pclass', 'Name', 'Sex', 'Age',
+                   'SibSp', 'Parch', 'Ticket', 'Fare', 'Cabin', 'Embarked']
+_extra_columns = ['Age', 'BirthDate', 'BirthPlace', 'Cabin', 'Destination',
+                  'Embarked', 'FirstName', 'Job', 'LastName', 'MaritalStatus',
+                  'Nationality', 'Pclass', 'Relationships', 'Residence', 'Sex',
+                  'Ticket', 'Title', 'UrlId', 'Survived']
+
+
+def _location_columns(field_name):
+    return [field_name] + ['{}{}'.format(field_name, suffix)
+                           for suffix in _location_suffixes]
+
+
+def _learn_sources():
+    """Collects the value pools and the rates the generator samples from."""
+    kaggle_df = pd.read_csv(os.path.join(_DATA_DIR, 'train.csv'))
+    xtrain_df = pd.read_csv(os.path.join(_DATA_DIR, 'xtrain.csv'))
+    extra_df = pd.read_csv(os.path.join(_DATA_DIR, 'extra_data.csv'))
+
+    passengers_df = xtrain_df[xtrain_df['Pclass'].isin(_passenger_classes)]
+    adults_df = passengers_df[passengers_df['Age'] >= 18]
+
+    # Tickets: "<prefix> <number>", with the prefix often missing.
+    ticket_parts = kaggle_df['Ticket'].str.extract(r'^(?:(.*)\s)?(\d+)$')
+    ticket_parts = ticket_parts.dropna(subset=[1])
+
+    # Cabins: single cabins, e.g. "C85", by class.
+    cabins = kaggle_df[['Pclass', 'Cabin']].dropna()
+    cabins = cabins.assign(Cabin=cabins['Cabin'].str.split()).explode('Cabin')
+    cabins = cabins[cabins['Cabin'].str.match(r'^[A-G]\d+$')]
+
+    # Share of the groups travelling on one ticket who are a family.
+    shared_tickets = kaggle_df \
+        .assign(LastName=kaggle_df['Name'].str.split(',').str[0]) \
+        .groupby('Ticket')['LastName'].agg(['size', 'nunique'])
+    shared_tickets = shared_tickets[shared_tickets['size'] > 1]
+
+    # Raw birth dates: share of "1870" and "January 1870" formats.
+    birth_dates = extra_df['BirthDate'].dropna()
+
+    survival_rates = passengers_df \
+        .assign(Child=passengers_df['Age'] < 18) \
+        .groupby(['Pclass', 'Sex', 'Child'])['Survived'].mean()
+
+    return {
+        'passenger_rows': passengers_df.to_dict('records'),
+        'crew_rows': xtrain_df[~xtrain_df['Pclass'].isin(_passenger_classes)]
+            .to_dict('records'),
+        'crew_fraction': 1 - len(passengers_df) / len(xtrain_df),
+        'xtrain_columns': xtrain_df.columns.tolist(),
+        'adult_ages': {sex: sex_df['Age'].dropna().values
+                       for sex, sex_df in adults_df.groupby('Sex')},
+        'first_names': {sex: sex_df['FirstName'].dropna().unique()
+                        for sex, sex_df in passengers_df.groupby('Sex')},
+        'last_names': xtrain_df['LastName'].dropna().unique(),
+        'jobs': {sex: sex_df['Job'].values
+                 for sex, sex_df in adults_df.groupby('Sex')},
+        'group_sizes': kaggle_df['Ticket'].value_counts().values,
+        'family_group_rate': (shared_tickets['nunique'] == 1).mean(),
+        'ticket_prefixes': ticket_parts[0].values,
+        'ticket_number_lengths': ticket_parts[1].str.len().values,
+        'fares': {pclass: pclass_df['Fare'].values
+                  for pclass, pclass_df in kaggle_df.groupby('Pclass')},
+        'cabin_rates': kaggle_df.groupby('Pclass')['Cabin']
+            .apply(lambda cabin: cabin.notna().mean()).to_dict(),
+        'cabins': {pclass: pclass_df['Cabin'].values
+                   for pclass, pclass_df in cabins.groupby('Pclass')},
+        'year_only_rate': birth_dates.str.fullmatch(r'\d{4}').mean(),
+        'month_year_rate':
+            birth_dates.str.fullmatch(r'[A-Za-z]+ \d{4}').mean(),
+        'survival_rates': survival_rates.to_dict(),
+    }
+
+
+def _ticket(rng, sources):
+    prefix = rng.choice(sources['ticket_prefixes'])
+    num_digits = rng.choice(sources['ticket_number_lengths'])
+    number = rng.integers(10 ** (num_digits - 1), 10 ** num_digits)
+    if prefix != prefix:
+        # NaN prefix.
+        return str(number), str(number), number
+    compact_prefix = re.sub(r'\W', '', prefix)
+    return '{} {}'.format(prefix, number), \
+        '{}{}'.format(compact_prefix, number), \
+        number
+
+
+def _cabins(rng, sources, pclass, group_size):
+    """Returns the Kaggle and the extended cabin strings, e.g.
+    "C22 C26" and "C22/26".
+    """
+    if rng.random() >= sources['cabin_rates'][pclass]:
+        return np.nan, np.nan
+
+    first_cabin = rng.choice(sources['cabins'][pclass])
+    deck, number = first_cabin[0], int(first_cabin[1:])
+    num_cabins = rng.integers(1, min(group_size, 4) + 1)
+    numbers = [number + 2 * cabin_idx for cabin_idx in range(num_cabins)]
+    kaggle_cabin = ' '.join('{}{}'.format(deck, num) for num in numbers)
+    extended_cabin = '{}{}'.format(deck, '/'.join(map(str, numbers)))
+    return kaggle_cabin, extended_cabin
+
+
+def _birth_date(rng, sources, age_in_days):
+    birth_date = _sinking_date - dt.timedelta(days=int(age_in_days))
+    draw = rng.random()
+    if draw < sources['year_only_rate']:
+        return str(birth_date.year), str(birth_date.year)
+    if draw < sources['year_only_rate'] + sources['month_year_rate']:
+        return birth_date.strftime('%B %Y'), birth_date.strftime('%Y-%m')
+    return birth_date.isoformat(), birth_date.isoformat()
+
+
+def _group_roles(rng, sources, group_size):
+    """Returns one role for each group member, among:
+    husband, wife, son, daughter, single man and single woman.
+    """
+    if group_size == 1 or rng.random() >= sources['family_group_rate']:
+        return [rng.choice(['single man', 'single woman'], p=[0.7, 0.3])
+                for _ in range(group_size)]
+
+    roles = ['husband', 'wife'] if rng.random() < 0.7 else ['wife']
+    roles += [rng.choice(['son', 'daughter'])
+              for _ in range(group_size - len(roles))]
+    return roles[:group_size]
+
+
+def _relationship(role, other_role):
+    """Returns the relationship type and description that a passenger
+    with `role` has with one with `other_role`.
+    """
+    parents = {'husband': 'father', 'wife': 'mother'}
+    children = {'son': 'son', 'daughter': 'daughter'}
+    if role in parents and other_role in parents:
+        return 'spouse', 'wife' if other_role == 'wife' else 'husband'
+    if role in parents and other_role in children:
+        return 'children', children[other_role]
+    if role in children and other_role in parents:
+        return 'parent', parents[other_role]
+    if role in children and other_role in children:
+        return 'sibling', 'brother' if other_role == 'son' else 'sister'
+    return 'knows', 'travelling companion'
+
+
+def _coarse_relationship(relationship_type, description):
+    return mapping.fine_description_to_coarse_description.get(
+        description,
+        mapping.relationship_type_to_coarse_description.get(
+            relationship_type, 'knows'))
+
+
+def _url_id(first_name, last_name, survived, url_counts):
+    slug = re.sub(r'\W+', '-', '{} {}'.format(first_name, last_name).lower())
+    slug = slug.strip('-')
+    url_counts[slug] = url_counts.get(slug, 0) + 1
+    if url_counts[slug] > 1:
+        slug = '{}-{}'.format(slug, url_counts[slug])
+    return '/titanic-{}/{}.html'.format('survivor' if survived else 'victim',
+                                        slug)
+
+
+def _price_string(price):
+    pounds = int(price)
+    shillings = int((price - pounds) * 20)
+    pence = int(round((price - pounds - shillings / 20) * 240))
+    price_str = '£{} '.format(pounds)
+    if shillings:
+        price_str += ' {}s '.format(shillings)
+    if pence:
+        price_str += ' {}d'.format(pence)
+    return price_str
+
+
+def _generate_group(rng, sources, group_size, url_counts):
+    """Returns the extended rows of a travel group, with the Kaggle and raw
+    only fields in extra keys.
+    """
+    is_crew = rng.random() < sources['crew_fraction']
+    if is_crew:
+        group_size = 1
+        base_rows = sources['crew_rows']
+    else:
+        base_rows = sources['passenger_rows']
+    group_row = base_rows[rng.integers(len(base_rows))]
+    pclass = _passenger_classes.get(group_row['Pclass'])
+
+    if is_crew:
+        kaggle_ticket = extended_ticket = ticket_number = np.nan
+        kaggle_cabin = extended_cabin = np.nan
+        fare = 0.
+    else:
+        kaggle_ticket, extended_ticket, ticket_number = _ticket(rng, sources)
+        kaggle_cabin, extended_cabin = _cabins(rng, sources, pclass,
+                                               group_size)
+        fare = rng.choice(sources['fares'][pclass])
+
+    roles = _group_roles(rng, sources, group_size)
+    family_last_name = rng.choice(sources['last_names'])
+    husband_first_name = rng.choice(sources['first_names']['male'])
+
+    rows = []
+    for role in roles:
+        sex = 'male' if role in ('husband', 'son', 'single man') else 'female'
+        first_name = husband_first_name if role == 'husband' \
+            else rng.choice(sources['first_names'][sex])
+        last_name = family_last_name \
+            if role in ('husband', 'wife', 'son', 'daughter') \
+            else rng.choice(sources['last_names'])
+
+        if role in ('son', 'daughter'):
+            age_in_days = rng.integers(30, 18 * 365)
+            title = 'Master' if sex == 'male' else 'Miss'
+            job = np.nan
+        else:
+            age_in_days = int(rng.choice(sources['adult_ages'][sex]) * 365) \
+                + rng.integers(365)
+            title = {'husband': 'Mr', 'wife': 'Mrs', 'single man': 'Mr'} \
+                .get(role, rng.choice(['Miss', 'Mrs']))
+            job = rng.choice(sources['jobs'][sex])
+
+        if title == 'Mrs':
+            maiden_name = '{} {}'.format(first_name,
+                                         rng.choice(sources['last_names']))
+            kaggle_name = '{}, Mrs. {} ({})'.format(last_name,
+                                                    husband_first_name,
+                                                    maiden_name)
+        else:
+            kaggle_name = '{}, {}. {}'.format(last_name, title, first_name)
+
+        age = age_in_days / 365
+        survival_rate = sources['survival_rates'].get(
+            (group_row['Pclass'], sex, age < 18), 0.3)
+        survived = float(rng.random() < survival_rate)
+        raw_birth_date, birth_date = _birth_date(rng, sources, age_in_days)
+
+        # Every member gets the birth place of a different real passenger.
+        birth_row = base_rows[rng.integers(len(base_rows))]
+
+        row = {
+            'Age': age,
+            'BirthDate': birth_date,
+            'Cabin': extended_cabin,
+            'Embarked': group_row['Embarked'],
+            'FirstName': first_name,
+            'Job': job,
+            'LastName': last_name,
+            'MaritalStatus': 'Married' if title == 'Mrs' or role == 'husband'
+            else group_row['MaritalStatus'] if age >= 18 else np.nan,
+            'Nationality': group_row['Nationality'],
+            'Pclass': group_row['Pclass'],
+            'Sex': sex,
+            'Ticket': extended_ticket,
+            'Title': title,
+            'UrlId': _url_id(first_name, last_name, survived, url_counts),
+            'TicketPrice': fare,
+            'TicketNumber': ticket_number,
+            'CabinDeck': extended_cabin[0]
+            if extended_cabin == extended_cabin else np.nan,
+            'AgeInDays': float(age_in_days),
+            'Survived': survived,
+            'Role': role,
+            'KaggleName': kaggle_name,
+            'KaggleTicket': kaggle_ticket,
+            'KaggleCabin': kaggle_cabin,
+            'RawBirthDate': raw_birth_date,
+        }
+        for field_name in ('Residence', 'Destination'):
+            row.update((col_name, group_row[col_name])
+                       for col_name in _location_columns(field_name))
+        row.update((col_name, birth_row[col_name])
+                   for col_name in _location_columns('BirthPlace'))
+        rows.append(row)
+
+    # Relationships between all the group members.
+    for row in rows:
+        row['Relationships'] = [
+            [other_row['UrlId']] + list(_relationship(row['Role'],
+                                                      other_row['Role']))
+            for other_row in rows
+            if other_row is not row
+        ]
+
+    return rows
+
+
+def _generate_batch(rng, sources, num_passengers, url_counts):
+    rows = []
+    while len(rows) < num_passengers:
+        group_size = rng.choice(sources['group_sizes'])
+        rows.extend(_generate_group(rng, sources, group_size, url_counts))
+    # The last group may be cut: drop its relationships to the cut members.
+    rows = rows[:num_passengers]
+    url_ids = {row['UrlId'] for row in rows}
+    for row in rows:
+        row['Relationships'] = [relationship
+                                for relationship in row['Relationships']
+                                if relationship[0] in url_ids]
+    return pd.DataFrame(rows)
+
+
+def _format_batch(df, xtrain_columns, first_id, first_kaggle_id):
+    """Returns the Kaggle, extended and raw tables of a batch."""
+    df['PassengerId'] = np.arange(first_id, first_id + len(df))
+
+    counts = np.zeros((len(df), len(_count_columns)), dtype=int)
+    count_column_idxs = {col_name: col_idx
+                         for col_idx, col_name in enumerate(_count_columns)}
+    for row_idx, relationships in enumerate(df['Relationships']):
+        for _, relationship_type, description in relationships:
+            coarse = _coarse_relationship(relationship_type, description)
+            counts[row_idx,
+                   count_column_idxs['Num{}'.format(coarse.capitalize())]] += 1
+    df[_count_columns] = counts
+    df['SibSp'] = (df['NumSibling'] + df['NumSpouse']).astype(float)
+    df['Parch'] = (df['NumParent'] + df['NumChild']).astype(float)
+
+    is_passenger = df['Pclass'].isin(_passenger_classes)
+    df['Split'] = np.where(is_passenger, 'Training', 'Extra')
+    df['KPassengerId'] = np.nan
+    df.loc[is_passenger, 'KPassengerId'] = \
+        np.arange(first_kaggle_id, first_kaggle_id + is_passenger.sum())
+
+    kaggle_df = df[is_passenger].assign(
+        PassengerId=df.loc[is_passenger, 'KPassengerId'].astype(int),
+        Survived=df.loc[is_passenger, 'Survived'].astype(int),
+        Pclass=df.loc[is_passenger, 'Pclass'].map(_passenger_classes),
+        Name=df.loc[is_passenger, 'KaggleName'],
+        Age=df.loc[is_passenger, 'Age'].round(),
+        Ticket=df.loc[is_passenger, 'KaggleTicket'],
+        Fare=df.loc[is_passenger, 'TicketPrice'],
+        Cabin=df.loc[is_passenger, 'KaggleCabin'],
+    )[_kaggle_columns]
+
+    xtrain_df = df[xtrain_columns]
+
+    extra_df = df.assign(
+        Age=df['Age'].astype(int).astype(str),
+        BirthDate=df['RawBirthDate'],
+        Cabin='\nCabin No.: ' + df['Cabin'],
+        Destination='\nDestination:       \n      ' + df['Destination'] + '\n',
+        Embarked=df['Embarked'].map(_embarking_ports),
+        Sex=df['Sex'].str.capitalize(),
+        Ticket='\nTicket No. ' + df['Ticket'] + ', '
+               + df['TicketPrice'].map(_price_string),
+        Relationships=df['Relationships'].map(
+            lambda relationships: str([url_id
+                                       for url_id, _, _ in relationships])),
+    )[_extra_columns]
+    extra_df.index = df['PassengerId'].values
+
+    relationships = [
+        {'Relationships': relationships, 'UrlId': url_id}
+        for url_id, relationships in zip(df['UrlId'], df['Relationships'])
+    ]
+
+    return kaggle_df, xtrain_df, extra_df, relationships
+
+
+def generate(num_passengers, output_dir=_OUTPUT_DIR, seed=0):
+    rng = np.random.default_rng(seed)
+    sources = _learn_sources()
+    os.makedirs(output_dir, exist_ok=True)
+
+    url_counts = {}
+    all_relationships = []
+    num_kaggle_passengers = 0
+    for first_id in range(0, num_passengers, _BATCH_SIZE):
+        batch_size = min(_BATCH_SIZE, num_passengers - first_id)
+        batch_df = _generate_batch(rng, sources, batch_size, url_counts)
+        kaggle_df, xtrain_df, extra_df, relationships = \
+            _format_batch(batch_df,
+                          sources['xtrain_columns'],
+                          first_id,
+                          num_kaggle_passengers + 1)
+        num_kaggle_passengers += len(kaggle_df)
+
+        is_first_batch = first_id == 0
+        for df, filename, index in ((kaggle_df, 'train.csv', False),
+                                    (xtrain_df, 'xtrain.csv', False),
+                                    (extra_df, 'extra_data.csv', True)):
+            df.to_csv(os.path.join(output_dir, filename),
+                      mode='w' if is_first_batch else 'a',
+                      header=is_first_batch,
+                      index=index)
+        all_relationships.extend(relationships)
+        _logger.info('Generated {}/{} passengers'.format(
+            first_id + batch_size, num_passengers))
+
+    with open(os.path.join(output_dir, 'relationships_data.json'), 'w') as f:
+        json.dump(all_relationships, f, indent=2)
+
+
+def _main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('num_passengers', type=int)
+    parser.add_argument('--output-dir', default=_OUTPUT_DIR)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generate(args.num_passengers, output_dir=args.output_dir, seed=args.seed)
+
+
+if __name__ == '__main__':
+    _main()
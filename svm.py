@@ -2,178 +2,24 @@ from sklearn.svm import SVC
 from sklearn.model_selection import GridSearchCV
 from sklearn.model_selection import train_test_split
 from sklearn.tree import DecisionTreeClassifier
-from sklearn.preprocessing import MaxAbsScaler, MinMaxScaler
 
 import dataset as ds
-import preprocessing as pp
+import features as fs
 import pandas as pd
 import submission as sm
 
-'''
-Just a copy of all the attributes.
-
-attributes = [
-    'Age',
-    'BirthDate',
-    'BirthPlace',
-    'Cabin',
-    'Destination',
-    'Embarked',
-    'FirstName',
-    'Job',
-    'LastName',
-    'MaritalStatus',
-    'Nationality',
-    'Pclass',
-    'Residence',
-    'Sex',
-    'Ticket',
-    'Title',
-    'UrlId',
-    'TicketPrice',
-    'TicketNumber',
-    'BirthPlaceCountry',
-    'BirthPlaceCity',
-    'BirthPlaceRegion',
-    'ResidenceCountry',
-    'ResidenceCity',
-    'ResidenceRegion',
-    'DestinationCountry',
-    'DestinationCity',
-    'DestinationRegion',
-    'CabinDeck',
-    'AgeInDays',
-    'KPassengerId',
-    'SibSp',
-    'Parch',
-    'Split',
-    'NumChild',
-    'NumEmployee',
-    'NumEmployer',
-    'NumFriend',
-    'NumKnows',
-    'NumParent',
-    'NumRelative',
-    'NumSibling',
-    'NumSpouse',
-]
-'''
-
-
-def preprocess_dataset(df):
-    keep_attributes = [
-        # 'Age',
-        # 'BirthDate',
-        # 'BirthPlace',
-        # 'Cabin',
-        # 'Destination',
-        'Embarked',
-        # 'FirstName',
-        'Job',
-        # 'LastName',
-        'MaritalStatus',
-        'Nationality',
-        'Pclass',
-        # 'Residence',
-        'Sex',
-        # 'Ticket',
-        'Title',
-        # 'UrlId',
-        'TicketPrice',
-        'TicketNumber',
-        'BirthPlaceCountry',
-        # 'BirthPlaceCity',
-        # 'BirthPlaceRegion',
-        'ResidenceCountry',
-        # 'ResidenceCity',
-        # 'ResidenceRegion',
-        'DestinationCountry',
-        # 'DestinationCity',
-        # 'DestinationRegion',
-        'CabinDeck',
-        'AgeInDays',
-        # 'KPassengerId',
-        # 'SibSp',
-        # 'Parch',
-        # 'Split',
-        'NumChild',
-        'NumEmployee',
-        'NumEmployer',
-        'NumFriend',
-        'NumKnows',
-        'NumParent',
-        'NumRelative',
-        'NumSibling',
-        'NumSpouse',
-    ]
-    drop_attributes = set(df.columns) - set(keep_attributes)
-    df = df.drop(columns=drop_attributes)
-
-    # Missing tickets belong to crew member.
-    df['TicketNumber'] = df['TicketNumber'].fillna(-1)
-
-    # Use the median to replace missing ages.
-    no_age_df = df.loc[df['AgeInDays'].isna()]
-    for psgr_id, no_age_row in no_age_df.iterrows():
-        pclass, gender, embarked = no_age_row[['Pclass', 'Sex', 'Embarked']]
-        inferred_age = df.loc[(df['Pclass'] == pclass)
-                              & (df['Sex'] == gender)
-                              & (df['Embarked'] == embarked)
-                              & (~df['AgeInDays'].isna())]['AgeInDays'].median()
-        df.loc[psgr_id, 'AgeInDays'] = inferred_age
-
-    attributes_to_categorical = [
-        'Embarked',
-        'Job',
-        'MaritalStatus',
-        'Nationality',
-        'Pclass',
-        'Sex',
-        'Title',
-        # 'TicketPrice',
-        # 'TicketNumber',
-        'BirthPlaceCountry',
-        'ResidenceCountry',
-        'DestinationCountry',
-        'CabinDeck',
-        # 'AgeInDays',
-        # 'NumChild',
-        # 'NumEmployee',
-        # 'NumEmployer',
-        # 'NumFriend',
-        # 'NumKnows',
-        # 'NumParent',
-        # 'NumRelative',
-        # 'NumSibling',
-        # 'NumSpouse',
-    ]
-    df[attributes_to_categorical] = \
-        df[attributes_to_categorical].fillna('Unknown')
-    for attribute_name in attributes_to_categorical:
-        df = pp.convert_attribute_to_categorical(df, attribute_name)
-
-    df = pp.convert_categorical_columns_to_numerical(df)
-
-    return df
+# Rarer categories share a single one-hot column.
+_min_category_frequency = 5
 
 
 def main():
     print('SVM')
 
-    X_dataset, y_dataset = ds.load_training_set()
-    X_testset = ds.load_test_set()
-
-    X_dataset = preprocess_dataset(X_dataset)
-    X_testset = preprocess_dataset(X_testset)
-
-    scaler = MinMaxScaler()
-    # scaler = MaxAbsScaler()
-    X_dataset = pd.DataFrame(scaler.fit_transform(X_dataset.values),
-                             index=X_dataset.index,
-                             columns=X_dataset.columns)
-    X_testset = pd.DataFrame(scaler.transform(X_testset.values),
-                             index=X_testset.index,
-                             columns=X_testset.columns)
+    # Sparse one-hot encoding: integer codes would impose a fake ordering
+    # of the categories on the distances. The numerical features are scaled
+    # to the range of the one-hot ones.
+    X_dataset, y_dataset, X_testset, test_ids = fs.load_one_hot_features(
+        'svm', min_frequency=_min_category_frequency, scale=True)
 
     # X_train, X_val, y_train, y_val = train_test_split(X_dataset,
     #                                                   y_dataset,
@@ -202,7 +48,8 @@ def main():
     print('Testset: {}/{} survived'.format(sum(test_predictions),
                                            len(test_predictions)))
 
-    X_testset[ds.LABEL_COLUMN_NAME] = test_predictions
+    X_testset = pd.DataFrame({ds.LABEL_COLUMN_NAME: test_predictions},
+                             index=test_ids)
     X_testset[ds.LABEL_COLUMN_NAME] = X_testset[ds.LABEL_COLUMN_NAME].astype(int)
     sm.output_submission_file(X_testset, notes='svm')
 
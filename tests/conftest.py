@@ -0,0 +1,13 @@
+import pytest
+
+import feature_cache as fc
+
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    """Runs a test with the feature cache enabled, in a directory of its
+    own.
+    """
+    monkeypatch.setattr(fc, '_cache_dir', str(tmp_path / 'cache'))
+    monkeypatch.setattr(fc, 'enabled', True)
+    return tmp_path / 'cache'
@@ -0,0 +1,86 @@
+import importlib
+import os
+import sys
+
+import pandas as pd
+
+import feature_cache as fc
+
+_step_module_source = '''
+import feature_cache as fc
+
+
+def _decorate(name):
+    return name + {suffix!r}
+
+
+@fc.cached_step(['Name'], ['Decorated'], helpers=[_decorate])
+def add_decorated_column(df):
+    df['Decorated'] = df['Name'].map(_decorate)
+    return df
+'''
+
+
+_num_runs = 0
+
+
+@fc.cached_step(['Name'], ['NameLength'])
+def _add_name_length_column(df):
+    global _num_runs
+    _num_runs += 1
+    df['NameLength'] = df['Name'].str.len()
+    return df
+
+
+def _import_step_module(tmp_path, monkeypatch, suffix):
+    (tmp_path / 'cached_steps.py').write_text(
+        _step_module_source.format(suffix=suffix))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    # A bytecode file of the same second would hide the edit.
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+    sys.modules.pop('cached_steps', None)
+    importlib.invalidate_caches()
+    return importlib.import_module('cached_steps')
+
+
+def test_changed_helper_runs_the_step_again(cache_dir, tmp_path,
+                                            monkeypatch):
+    df = pd.DataFrame({'Name': ['Braund', 'Cumings']})
+    module = _import_step_module(tmp_path, monkeypatch, '!')
+    assert module.add_decorated_column(df.copy())['Decorated'].tolist() \
+        == ['Braund!', 'Cumings!']
+
+    module = _import_step_module(tmp_path, monkeypatch, '?')
+    assert module.add_decorated_column(df.copy())['Decorated'].tolist() \
+        == ['Braund?', 'Cumings?']
+
+
+def test_changed_input_runs_the_step_again(cache_dir):
+    df = pd.DataFrame({'Name': ['Braund', 'Cumings']})
+    num_runs = _num_runs
+    assert _add_name_length_column(df.copy())['NameLength'].tolist() == [6, 7]
+    assert _add_name_length_column(df.copy())['NameLength'].tolist() == [6, 7]
+    assert _num_runs == num_runs + 1
+
+    df.loc[1, 'Name'] = 'Heikkinen'
+    assert _add_name_length_column(df.copy())['NameLength'].tolist() == [6, 9]
+    assert _num_runs == num_runs + 2
+
+
+def test_eviction_removes_the_least_recently_used_entries(cache_dir,
+                                                         monkeypatch):
+    entry_df = pd.DataFrame({'Value': range(100)})
+    for time, key in enumerate(['first', 'second']):
+        fc.write_entry(key, entry_df)
+        os.utime(os.path.join(fc._cache_dir, key + fc._entry_suffix),
+                 (time, time))
+    # Reading the first entry makes the second one the least recently used.
+    assert fc.read_entry('first') is not None
+
+    entry_bytes = os.path.getsize(
+        os.path.join(fc._cache_dir, 'first' + fc._entry_suffix))
+    monkeypatch.setattr(fc, '_max_cache_bytes', 2 * entry_bytes)
+    fc.write_entry('third', entry_df)
+    assert fc.has_entry('first')
+    assert not fc.has_entry('second')
+    assert fc.has_entry('third')
@@ -0,0 +1,36 @@
+import pandas as pd
+
+import gazetteer as gz
+
+
+def _resolve(locations):
+    locations = pd.Series(locations)
+    gazetteer = gz.Gazetteer.build([locations])
+    return gazetteer.resolve(locations)[gz.LEVELS].values.tolist()
+
+
+def test_united_kingdom_kept_without_constituent_country():
+    assert _resolve(['Glasgow, UK', 'Belfast, U.K.', 'UK']) == [
+        ['United Kingdom', 'Glasgow', None],
+        ['United Kingdom', 'Belfast', None],
+        ['United Kingdom', None, None],
+    ]
+
+
+def test_constituent_country_replaces_united_kingdom():
+    assert _resolve(['London, England, UK',
+                     'Lambeth, London, England, Great Britain',
+                     'England, UK',
+                     'London, England']) == [
+        ['England', 'London', None],
+        ['England', 'Lambeth', 'London'],
+        ['England', None, None],
+        ['England', 'London', None],
+    ]
+
+
+def test_alternative_city_names():
+    assert _resolve(['Åbo (Turku), Finland', 'Turku, Finland']) == [
+        ['Finland', 'Åbo', None],
+        ['Finland', 'Åbo', None],
+    ]
@@ -0,0 +1,12 @@
+import numpy as np
+
+import knn
+
+
+def test_design_matrix_is_scaled(cache_dir):
+    X_train, _, X_test, _ = knn.load_features()
+    # Every column, one-hot or numerical, spans at most [-1, 1] on the
+    # training set.
+    max_abs = abs(X_train).max(axis=0).toarray().ravel()
+    assert np.all(max_abs <= 1)
+    assert np.all(np.isfinite(X_test.data))
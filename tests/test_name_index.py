@@ -0,0 +1,15 @@
+import pandas as pd
+
+import name_index as ni
+
+
+def test_candidates_share_a_rare_ngram_or_the_key():
+    index = ni.NameIndex.build(pd.Series([
+        'Catherine', 'Kathryn', 'Adeline', 'Caroline', 'Christine',
+        'Ernestine', 'Geraldine', 'Josephine', 'Justine', 'Pauline',
+    ]))
+    candidates_df = index.candidates(pd.Series(['Katherine', None]))
+    # The names only ending in "ine" as well are not visited.
+    assert candidates_df['Name'].tolist() == ['Katherine', 'Katherine']
+    assert candidates_df['Candidate'].tolist() == ['Catherine', 'Kathryn']
+    assert candidates_df['Similarity'].is_monotonic_decreasing
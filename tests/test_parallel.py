@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import parallel
+
+
+@parallel.categorical_outputs(Title=parallel.SORTED,
+                              TitleInOrder=parallel.APPEARANCE)
+def _add_columns(df):
+    df['Title'] = pd.Categorical(df['Name'].str.split().str[0])
+    # Categories in order of appearance, as the steps of preprocessing.
+    codes, titles = pd.factorize(df['Name'].str.split().str[0])
+    df['TitleInOrder'] = pd.Categorical.from_codes(codes, categories=titles)
+    df['Deck'] = pd.Categorical(df['Cabin'].str[0], categories=['A', 'B', 'C'])
+    df['NameLength'] = df['Name'].str.len()
+    return df
+
+
+def _frame(num_rows):
+    # Later rows hold later titles: each shard sees its own titles.
+    names = np.array(['Mr A', 'Mrs B', 'Miss C', 'Dr D'])
+    cabins = np.array(['A1', 'B2', None, 'C3'])
+    return pd.DataFrame({
+        'Name': names[np.arange(num_rows) * len(names) // num_rows],
+        'Cabin': cabins[np.arange(num_rows) % len(cabins)],
+    }, index=np.arange(num_rows) * 2)
+
+
+def test_shards_match_serial_run():
+    df = _frame(101)
+    serial_df = _add_columns(df.copy())
+    for num_workers in [1, 2, 3, 7]:
+        parallel_df, _ = parallel.apply_steps(df,
+                                              [_add_columns],
+                                              num_workers=num_workers)
+        # Dtypes included: the categories of the shards differ.
+        pd.testing.assert_frame_equal(parallel_df, serial_df)
+
+
+def test_summaries_in_row_order():
+    df = _frame(10)
+    _, summaries = parallel.apply_steps(df,
+                                        [_add_columns],
+                                        num_workers=3,
+                                        summarize=len)
+    assert summaries == [3, 3, 4]
+
+
+@parallel.categorical_outputs(Title=parallel.SORTED)
+def _add_sorted_titles(df):
+    df['Title'] = pd.Categorical(df['Name'])
+    return df
+
+
+def _add_undeclared_titles(df):
+    df['Title'] = pd.Categorical(df['Name'])
+    return df
+
+
+def test_one_category_per_shard():
+    # Each shard holds one title, in the order they were sorted.
+    df = pd.DataFrame({'Name': ['Mr', 'Mr', 'Miss', 'Miss', 'Mrs', 'Mrs']})
+    parallel_df, _ = parallel.apply_steps(df,
+                                          [_add_sorted_titles],
+                                          num_workers=3)
+    pd.testing.assert_frame_equal(parallel_df, _add_sorted_titles(df.copy()))
+
+
+def test_undeclared_categories_differing_across_shards():
+    df = pd.DataFrame({'Name': ['Mr', 'Mr', 'Miss', 'Miss', 'Mrs', 'Mrs']})
+    with pytest.raises(ValueError, match='Title'):
+        parallel.apply_steps(df, [_add_undeclared_titles], num_workers=3)
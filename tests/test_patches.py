@@ -0,0 +1,62 @@
+import json
+import logging
+
+import pandas as pd
+
+import patches
+
+
+def _write_table(tmp_path, patch_groups):
+    path = tmp_path / 'fixes.json'
+    path.write_text(json.dumps(patch_groups))
+    return str(path)
+
+
+def _frame():
+    return pd.DataFrame({
+        'UrlId': ['/a', '/b', '/c'],
+        'Title': pd.Categorical(['Mr', 'Mrs', 'Mr']),
+        'Age': [30., 41., 2.],
+    }, index=pd.Index([1, 2, 3], name='PassengerId'))
+
+
+def test_patches_set_the_values_of_the_matched_rows(tmp_path):
+    path = _write_table(tmp_path, [
+        {'comment': 'By column and by index.',
+         'patches': [
+             {'match': {'UrlId': '/b'}, 'set': {'Title': 'Lady'}},
+             {'match': {'PassengerId': 3}, 'set': {'Age': 3.}},
+         ]},
+    ])
+    df = patches.apply_patch_table(_frame(), path)
+    assert df['Title'].tolist() == ['Mr', 'Lady', 'Mr']
+    assert df['Age'].tolist() == [30., 41., 3.]
+
+
+def test_patches_match_the_values_before_any_patch(tmp_path):
+    path = _write_table(tmp_path, [
+        {'comment': 'Swap two ids.',
+         'patches': [
+             {'match': {'UrlId': '/a'}, 'set': {'UrlId': '/b'}},
+             {'match': {'UrlId': '/b'}, 'set': {'UrlId': '/a'}},
+         ]},
+    ])
+    df = patches.apply_patch_table(_frame(), path)
+    assert df['UrlId'].tolist() == ['/b', '/a', '/c']
+
+
+def test_unmatched_patch_warns(tmp_path, caplog):
+    path = _write_table(tmp_path, [
+        {'comment': 'No such passenger.',
+         'patches': [
+             {'match': {'UrlId': '/a'}, 'set': {'Age': 31.}},
+             {'match': {'UrlId': '/z'}, 'set': {'Age': 1.}},
+         ]},
+    ])
+    with caplog.at_level(logging.WARNING, logger=patches.__name__):
+        df = patches.apply_patch_table(_frame(), path)
+    assert df['Age'].tolist() == [31., 41., 2.]
+    warnings = [record for record in caplog.records
+                if record.levelno == logging.WARNING]
+    assert len(warnings) == 1
+    assert "'/z'" in warnings[0].getMessage()
@@ -0,0 +1,68 @@
+import importlib
+import logging
+import sys
+
+import pandas as pd
+
+import pipeline
+
+_stage_module_source = '''
+import pipeline
+import stage_helpers
+
+
+@pipeline.stage(['Name'], ['Decorated'], helpers=[stage_helpers])
+def add_decorated_column(df):
+    df['Decorated'] = stage_helpers.decorate(df['Name']) + {suffix!r}
+    return df
+'''
+
+_helper_module_source = '''
+def decorate(names):
+    return {prefix!r} + names
+'''
+
+
+def _import_stage_module(tmp_path, monkeypatch, suffix, prefix=''):
+    (tmp_path / 'stages.py').write_text(
+        _stage_module_source.format(suffix=suffix))
+    (tmp_path / 'stage_helpers.py').write_text(
+        _helper_module_source.format(prefix=prefix))
+    monkeypatch.syspath_prepend(str(tmp_path))
+    # A bytecode file of the same second would hide the edit.
+    monkeypatch.setattr(sys, 'dont_write_bytecode', True)
+    for module_name in ['stages', 'stage_helpers']:
+        sys.modules.pop(module_name, None)
+    importlib.invalidate_caches()
+    return importlib.import_module('stages')
+
+
+def _run(df, module, caplog):
+    caplog.clear()
+    with caplog.at_level(logging.INFO, logger=pipeline.__name__):
+        output_df = pipeline.run(df, [module.add_decorated_column])
+    num_runs = sum(record.getMessage().startswith('Running stage')
+                   for record in caplog.records)
+    return output_df['Decorated'].tolist(), num_runs
+
+
+def test_stage_reruns_only_when_its_code_changes(cache_dir, tmp_path,
+                                                 monkeypatch, caplog):
+    df = pd.DataFrame({'Name': ['Braund', 'Cumings']})
+    module = _import_stage_module(tmp_path, monkeypatch, '!')
+    assert _run(df, module, caplog) == (['Braund!', 'Cumings!'], 1)
+    assert _run(df, module, caplog) == (['Braund!', 'Cumings!'], 0)
+
+    module = _import_stage_module(tmp_path, monkeypatch, '?')
+    assert _run(df, module, caplog) == (['Braund?', 'Cumings?'], 1)
+
+
+def test_stage_reruns_when_a_helper_changes(cache_dir, tmp_path, monkeypatch,
+                                            caplog):
+    df = pd.DataFrame({'Name': ['Braund', 'Cumings']})
+    module = _import_stage_module(tmp_path, monkeypatch, '!')
+    assert _run(df, module, caplog) == (['Braund!', 'Cumings!'], 1)
+
+    module = _import_stage_module(tmp_path, monkeypatch, '!', prefix='Mr ')
+    assert _run(df, module, caplog) == (['Mr Braund!', 'Mr Cumings!'], 1)
+    assert _run(df, module, caplog) == (['Mr Braund!', 'Mr Cumings!'], 0)
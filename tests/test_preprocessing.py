@@ -0,0 +1,18 @@
+import numpy as np
+import pandas as pd
+
+import preprocessing as pp
+
+
+def test_chunk_medians_match_serial_median():
+    df = pd.DataFrame({'Age': [30., np.nan, 2., 41., 30., np.nan, 7.]})
+    statistics = pp.learn_chunk_statistics([df.iloc[:3], df.iloc[3:]],
+                                           median_attributes=['Age'])
+    assert statistics['medians']['Age'] == df['Age'].median()
+
+
+def test_chunk_median_of_all_missing_column_is_nan():
+    df = pd.DataFrame({'Age': [np.nan, np.nan, np.nan]})
+    statistics = pp.learn_chunk_statistics([df.iloc[:2], df.iloc[2:]],
+                                           median_attributes=['Age'])
+    assert np.isnan(statistics['medians']['Age'])
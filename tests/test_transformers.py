@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.preprocessing import MaxAbsScaler
+
+import transformers as tr
+
+
+def _frames():
+    X_train = pd.DataFrame({
+        'Sex': ['male', 'female', 'male', None],
+        'Fare': [7.25, -71.3, 0., 8.05],
+        'Zeros': [0., 0., 0., 0.],
+    })
+    X_test = pd.DataFrame({
+        'Sex': ['female', 'other'],
+        'Fare': [100., 3.5],
+        'Zeros': [1., 0.],
+    })
+    return X_train, X_test
+
+
+def test_sparse_one_hot_scaling_matches_max_abs_scaler():
+    X_train, X_test = _frames()
+    encoder = tr.SparseOneHotEncoder(['Sex'], scale=True).fit(X_train)
+    unscaled_encoder = tr.SparseOneHotEncoder(['Sex']).fit(X_train)
+    scaler = MaxAbsScaler().fit(
+        unscaled_encoder.transform(X_train).toarray())
+    for X in (X_train, X_test):
+        X_encoded = encoder.transform(X)
+        assert sparse.isspmatrix_csr(X_encoded)
+        np.testing.assert_allclose(
+            X_encoded.toarray(),
+            scaler.transform(unscaled_encoder.transform(X).toarray()))
+
+
+def _out_of_fold_rates(members, y, is_counted, smoothing=1.0):
+    prior = y[is_counted.any(axis=0)].mean()
+    counted = members & is_counted
+    return (counted @ y + smoothing * prior) \
+        / (counted.sum(axis=1) + smoothing)
+
+
+def test_out_of_fold_group_rates_match_brute_force():
+    rng = np.random.default_rng(0)
+    num_rows, num_folds = 60, 4
+    X = pd.DataFrame({'Group': rng.integers(0, 8, num_rows).astype(float),
+                      'Key': np.arange(num_rows)},
+                     index=np.arange(num_rows) * 3)
+    X.loc[X.index[:5], 'Group'] = np.nan
+    y = pd.Series(rng.integers(0, 2, num_rows), index=X.index)
+    folds = np.arange(num_rows) % num_folds
+    # Each row counts the rows of the same group, or its neighbours.
+    same_group = (X['Group'].values[:, None] == X['Group'].values[None, :])
+    neighbours = rng.random((num_rows, num_rows)) < 0.2
+    statistics = tr.FoldGroupStatistics(
+        X, y, ['Group', 'Key'], folds,
+        memberships={'Key': (pd.Index(X['Key'], dtype=object),
+                             sparse.csr_matrix(neighbours))})
+
+    for held_out_fold in range(num_folds):
+        is_fit = folds != held_out_fold
+        encoder = tr.OutOfFoldGroupEncoder(statistics)
+        fit_df = encoder.fit_transform(X[is_fit])
+        held_out_df = encoder.transform(X[~is_fit])
+        for attribute_name, members in [('Group', same_group),
+                                        ('Key', neighbours)]:
+            np.testing.assert_allclose(
+                fit_df[attribute_name],
+                _out_of_fold_rates(
+                    members[is_fit], y.values,
+                    is_fit[None, :]
+                    & (folds[None, :] != folds[is_fit][:, None])))
+            np.testing.assert_allclose(
+                held_out_df[attribute_name],
+                _out_of_fold_rates(members[~is_fit], y.values,
+                                   np.tile(is_fit, (len(held_out_df), 1))))
@@ -0,0 +1,316 @@
+"""Collection of scikit-learn transformers to preprocess data before training.
+
+Unlike the functions in preprocessing.py, these learn their statistics on the
+training set only and then apply them unchanged to any other set.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from sklearn.base import BaseEstimator, TransformerMixin
+
+
+def _vocabulary_codes(column, vocabulary):
+    """Returns the positions of the values of `column` in `vocabulary`, with
+    the values not in the vocabulary, missing ones included, coded as the
+    size of the vocabulary.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        # Only look up the categories, then index by the codes.
+        # Missing values (code -1) pick the trailing -1.
+        category_codes = np.append(
+            vocabulary.get_indexer(column.cat.categories), -1)
+        codes = category_codes[column.cat.codes.values]
+    else:
+        codes = vocabulary.get_indexer(column)
+    codes[codes == -1] = len(vocabulary)
+    return codes
+
+
+class GroupMedianImputer(BaseEstimator, TransformerMixin):
+    """Fills the missing values of an attribute with the median of the
+    training rows sharing the same group attributes.
+
+    The medians of all the groups are learned in a single groupby pass.
+    Groups without any known value fall back to the overall median.
+    """
+
+    def __init__(self, attribute_name, group_attributes):
+        self.attribute_name = attribute_name
+        self.group_attributes = group_attributes
+
+    def fit(self, X, y=None):
+        known_df = X.loc[X[self.attribute_name].notna(),
+                         list(self.group_attributes) + [self.attribute_name]]
+        self.group_medians_ = known_df \
+            .groupby(list(self.group_attributes), observed=True) \
+            [self.attribute_name].median()
+        self.median_ = known_df[self.attribute_name].median()
+        return self
+
+    def transform(self, X):
+        X = X.copy()
+        is_missing = X[self.attribute_name].isna()
+        if not is_missing.any():
+            return X
+
+        missing_groups = X.loc[is_missing, list(self.group_attributes)] \
+            .astype(object)
+        if len(self.group_attributes) == 1:
+            group_keys = pd.Index(missing_groups.iloc[:, 0])
+        else:
+            group_keys = pd.MultiIndex.from_frame(missing_groups)
+        medians = self.group_medians_.reindex(group_keys).values
+
+        X.loc[is_missing, self.attribute_name] = \
+            pd.Series(medians, index=missing_groups.index).fillna(self.median_)
+        return X
+
+
+class CategoricalEncoder(BaseEstimator, TransformerMixin):
+    """Replaces the values of categorical attributes with integer codes.
+
+    The vocabulary of each attribute is learned once, in order of
+    appearance, and kept as a pandas Index: values are turned into codes by
+    hash lookup. Values never seen while fitting, missing values included,
+    all go to an unknown bucket, coded as the size of the vocabulary. Hence
+    the codes of a set never depend on the other values in that set.
+    """
+
+    def __init__(self, attribute_names):
+        self.attribute_names = attribute_names
+
+    def fit(self, X, y=None):
+        self.vocabularies_ = {
+            attribute_name: pd.Index(
+                pd.unique(X[attribute_name].dropna().astype(object)),
+                dtype=object)
+            for attribute_name in self.attribute_names
+        }
+        return self
+
+    def transform(self, X):
+        X = X.copy()
+        for attribute_name, vocabulary in self.vocabularies_.items():
+            codes = _vocabulary_codes(X[attribute_name], vocabulary)
+            X[attribute_name] = \
+                codes.astype(np.min_scalar_type(len(vocabulary)))
+        return X
+
+
+class SparseOneHotEncoder(BaseEstimator, TransformerMixin):
+    """One-hot encodes categorical attributes into a scipy.sparse CSR matrix,
+    without any fake ordering of the categories.
+
+    Each attribute gets one column per value seen at least `min_frequency`
+    times while fitting, in order of appearance, plus an "Other" column for
+    all the rarer, unseen and missing values. The remaining attributes are
+    kept after the one-hot columns, divided by their maximum absolute value
+    on the training set if `scale`: the one-hot columns already are in
+    [0, 1]. `feature_names_` lists the names of all the columns.
+    """
+
+    def __init__(self, attribute_names, min_frequency=1, scale=False):
+        self.attribute_names = attribute_names
+        self.min_frequency = min_frequency
+        self.scale = scale
+
+    def fit(self, X, y=None):
+        self.vocabularies_ = {}
+        for attribute_name in self.attribute_names:
+            codes, values = pd.factorize(X[attribute_name])
+            counts = np.bincount(codes[codes >= 0], minlength=len(values))
+            self.vocabularies_[attribute_name] = pd.Index(
+                np.asarray(values, dtype=object)[counts >= self.min_frequency],
+                dtype=object)
+
+        self.other_attributes_ = [
+            attribute_name
+            for attribute_name in X.columns
+            if attribute_name not in self.attribute_names
+        ]
+        # Columns of zeros are left as they are.
+        max_abs = X[self.other_attributes_].abs().max().fillna(0).values
+        self.scales_ = np.where(self.scale & (max_abs > 0), max_abs, 1.)
+        self.feature_names_ = [
+            '{}={}'.format(attribute_name, value)
+            for attribute_name, vocabulary in self.vocabularies_.items()
+            for value in list(vocabulary) + ['Other']
+        ] + self.other_attributes_
+        return self
+
+    def transform(self, X):
+        # Each row has exactly one non-zero entry per attribute, and the
+        # column offsets of the attributes keep the indices of a row sorted.
+        num_rows = len(X)
+        num_attributes = len(self.vocabularies_)
+        indices = np.empty((num_rows, num_attributes), dtype=np.int64)
+        offset = 0
+        for attribute_idx, (attribute_name, vocabulary) \
+                in enumerate(self.vocabularies_.items()):
+            indices[:, attribute_idx] = offset + _vocabulary_codes(
+                X[attribute_name], vocabulary)
+            offset += len(vocabulary) + 1
+
+        one_hot = sparse.csr_matrix(
+            (np.ones(indices.size),
+             indices.ravel(),
+             np.arange(num_rows + 1) * num_attributes),
+            shape=(num_rows, offset))
+        if not self.other_attributes_:
+            return one_hot
+
+        others = sparse.csr_matrix(
+            X[self.other_attributes_].to_numpy(dtype=float) / self.scales_)
+        return sparse.hstack([one_hot, others], format='csr')
+
+
+class FoldGroupStatistics:
+    """Number of passengers and of survivors of each group of the training
+    set, in each fold, for the `attribute_names` group attributes (ticket,
+    family, cabin...).
+
+    A group is made of the training passengers holding the same value, or of
+    the members given by `memberships`: for each attribute, its vocabulary
+    and the CSR matrix with 1 at (value, training passenger) for the members
+    of the group of each value (e.g. the passengers related to the passenger
+    of each UrlId).
+
+    All the statistics an `OutOfFoldGroupEncoder` needs are differences of
+    these: computed once, in one bincount or sparse product per attribute,
+    they are shared by all the fits of a grid search. Clones of an encoder
+    share the same statistics too, as they are read-only.
+    """
+
+    def __init__(self, X, y, attribute_names, folds, memberships=None):
+        memberships = memberships or {}
+        self.attribute_names = attribute_names
+        self.index = X.index
+        # The fold of each training passenger.
+        self.folds = np.asarray(folds)
+        self.num_folds = self.folds.max() + 1
+        y = np.asarray(y, dtype=float)
+        self.fold_survivors = np.bincount(self.folds, weights=y,
+                                          minlength=self.num_folds)
+        self.fold_counts = np.bincount(self.folds, minlength=self.num_folds)
+
+        self.vocabularies = {}
+        # The group of each training passenger.
+        self.codes = {}
+        self.survivors = {}
+        self.counts = {}
+        self.total_survivors = {}
+        self.total_counts = {}
+        for attribute_name in attribute_names:
+            if attribute_name in memberships:
+                vocabulary, members = memberships[attribute_name]
+            else:
+                vocabulary = pd.Index(X[attribute_name].dropna().unique())
+                members = None
+            codes = _vocabulary_codes(X[attribute_name], vocabulary)
+            # The trailing group, of the unseen and missing values, is empty:
+            # it gets the overall rate.
+            shape = (len(vocabulary) + 1, self.num_folds)
+            if members is None:
+                cells = codes * self.num_folds + self.folds
+                survivors = np.bincount(cells, weights=y,
+                                        minlength=np.prod(shape)) \
+                    .reshape(shape)
+                counts = np.bincount(cells, minlength=np.prod(shape)) \
+                    .reshape(shape)
+                survivors[-1] = 0
+                counts[-1] = 0
+            else:
+                fold_one_hot = sparse.csr_matrix(
+                    (np.ones(len(X)), (np.arange(len(X)), self.folds)),
+                    shape=(len(X), self.num_folds))
+                survivors = np.zeros(shape)
+                counts = np.zeros(shape)
+                survivors[:-1] = \
+                    (members @ fold_one_hot.multiply(y[:, None])).toarray()
+                counts[:-1] = (members @ fold_one_hot).toarray()
+            self.vocabularies[attribute_name] = vocabulary
+            self.codes[attribute_name] = codes
+            self.survivors[attribute_name] = survivors
+            self.counts[attribute_name] = counts
+            self.total_survivors[attribute_name] = survivors.sum(axis=1)
+            self.total_counts[attribute_name] = counts.sum(axis=1)
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def rows(self, X):
+        """Returns the positions of the passengers of `X` in the training
+        set, -1 for the other ones.
+        """
+        return self.index.get_indexer(X.index)
+
+
+class OutOfFoldGroupEncoder(BaseEstimator, TransformerMixin):
+    """Replaces group attributes with the survival rate of the training
+    passengers of the same group, smoothed towards the overall rate by
+    `smoothing` passengers.
+
+    The training passengers are the ones of the folds of `statistics` (see
+    FoldGroupStatistics) fit on: the folds held out of a cross-validation
+    split never count. While fitting, the rate of each passenger also leaves
+    out its own fold, so that no passenger sees its own label. Each rate is
+    the sum over all the folds minus the ones left out: nothing is
+    aggregated again.
+    """
+
+    def __init__(self, statistics, smoothing=1.0):
+        self.statistics = statistics
+        self.smoothing = smoothing
+
+    def _rows(self, X):
+        rows = self.statistics.rows(X)
+        if (rows == -1).any():
+            raise ValueError('Fitting on passengers without statistics')
+        return rows
+
+    def _fit(self, rows):
+        is_held_out = np.ones(self.statistics.num_folds, dtype=bool)
+        is_held_out[self.statistics.folds[rows]] = False
+        self.held_out_folds_ = np.flatnonzero(is_held_out)
+        self.prior_ = \
+            self.statistics.fold_survivors[~is_held_out].sum() \
+            / self.statistics.fold_counts[~is_held_out].sum()
+        return self
+
+    def fit(self, X, y=None):
+        return self._fit(self._rows(X))
+
+    def _encode(self, X, rows=None):
+        X = X.copy()
+        for attribute_name in self.statistics.attribute_names:
+            survivors = self.statistics.survivors[attribute_name]
+            counts = self.statistics.counts[attribute_name]
+            group_survivors = self.statistics.total_survivors[attribute_name] \
+                - survivors[:, self.held_out_folds_].sum(axis=1)
+            group_counts = self.statistics.total_counts[attribute_name] \
+                - counts[:, self.held_out_folds_].sum(axis=1)
+
+            if rows is None:
+                codes = _vocabulary_codes(
+                    X[attribute_name],
+                    self.statistics.vocabularies[attribute_name])
+                row_survivors = group_survivors[codes]
+                row_counts = group_counts[codes]
+            else:
+                codes = self.statistics.codes[attribute_name][rows]
+                row_folds = self.statistics.folds[rows]
+                row_survivors = group_survivors[codes] \
+                    - survivors[codes, row_folds]
+                row_counts = group_counts[codes] - counts[codes, row_folds]
+            X[attribute_name] = \
+                (row_survivors + self.smoothing * self.prior_) \
+                / (row_counts + self.smoothing)
+        return X
+
+    def transform(self, X):
+        return self._encode(X)
+
+    def fit_transform(self, X, y=None, **fit_params):
+        rows = self._rows(X)
+        return self._fit(rows)._encode(X, rows)
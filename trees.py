@@ -4,38 +4,14 @@ from sklearn.model_selection import train_test_split
 from sklearn.tree import DecisionTreeClassifier
 
 import dataset as ds
-import preprocessing as pp
+import features as fs
 import submission as sm
 
 
-def preprocess_dataset(df):
-    df = pp.replace_nan_embarked_with_unknown(df)
-    df = pp.replace_nan_age_with_value(df)
-    df = pp.replace_nan_fare_with_value(df)
-
-    attributes_to_categorical = ['Sex', 'Embarked', 'Pclass']
-    for attribute_name in attributes_to_categorical:
-        df = pp.convert_attribute_to_categorical(df, attribute_name)
-
-    df = pp.add_coarse_title_column(df)
-    df = pp.add_ticket_number_column(df)
-    df = pp.add_floor_column(df)
-
-    df = pp.convert_categorical_columns_to_numerical(df)
-
-    non_numerical_attributes = ['Name', 'Ticket', 'Cabin']
-    df.drop(columns=non_numerical_attributes, inplace=True)
-
-    df = pp.sort_columns(df)
-
-    return df
-
-
 def main():
     print('Decision trees')
 
-    X_dataset, y_dataset = ds.load_training_set()
-    X_dataset = preprocess_dataset(X_dataset)
+    X_dataset, y_dataset, X_testset = fs.load_features('trees')
     X_train, X_val, y_train, y_val = train_test_split(X_dataset,
                                                       y_dataset,
                                                       test_size=0.3,
@@ -61,8 +37,6 @@ def main():
     print('Best parameters:')
     print(clf.best_params_)
 
-    X_testset = ds.load_test_set()
-    X_testset = preprocess_dataset(X_testset)
     test_predictions = clf.predict(X_testset)
     print('Testset: {}/{} survived'.format(sum(test_predictions),
                                            len(test_predictions)))